@@ -0,0 +1,324 @@
+from pathlib import Path
+from urllib.parse import quote, unquote, urljoin
+import argparse
+import hashlib
+import io
+import json
+import re
+import sys
+import time
+import zipfile
+
+
+# Builds public/avr-mini-projects/catalog.json and backend/ai/mini-projects/catalog.json
+# from the versioned files in the NN_Name/ folders, plus one ZIP bundle per project
+# in the layout avr-mini-project-archive.js accepts (source, guides, AI spec, images).
+# Descriptive fields that cannot be derived from file names (displayName, title,
+# summary, guide labels, aiSpecRef) are kept from the existing public catalog.
+PUBLIC_ROOT = Path("public/avr-mini-projects")
+AI_ROOT = Path("backend/ai/mini-projects")
+PUBLIC_URL = "/avr-mini-projects"
+STATE_PATH = Path(".mini-project-catalog-state.json")
+
+PROJECT_DIR_RE = re.compile(r"^\d{2}_[A-Za-z0-9_-]+$")
+VERSION = r"(?P<version>\d+\.\d+\.\d+(?:-[a-z0-9]+)?)"
+IMAGE_TYPES = {".gif": "image/gif", ".jpeg": "image/jpeg", ".jpg": "image/jpeg", ".png": "image/png", ".webp": "image/webp"}
+LOCALE_LABELS = {"en": "English", "es": "Español", "ru": "Русский"}
+BUNDLE_DATE = (1980, 1, 1, 0, 0, 0)
+
+
+class FileHashes:
+    # sha256 per file, cached by (size, mtime) across runs.
+    def __init__(self, cached):
+        self.cached = cached
+        self.current = {}
+
+    def __call__(self, path):
+        key = path.as_posix()
+        if key not in self.current:
+            stat = path.stat()
+            entry = self.cached.get(key)
+            if entry and entry[0] == stat.st_size and entry[1] == stat.st_mtime_ns:
+                self.current[key] = entry
+            else:
+                self.current[key] = [stat.st_size, stat.st_mtime_ns, hashlib.sha256(path.read_bytes()).hexdigest()]
+        return self.current[key][2]
+
+
+def version_key(version):
+    numbers, _, suffix = version.partition("-")
+    return tuple(int(part) for part in numbers.split(".")), suffix
+
+
+def newest(matches):
+    return max(matches, key=lambda match: version_key(match.group("version")))
+
+
+def scan_public_project(folder):
+    project_id = folder.name
+    source_re = re.compile(rf"^{re.escape(project_id)}_{VERSION}\.c$")
+    guide_re = re.compile(rf"^{re.escape(project_id)}_help(?:\((?P<locale>[A-Za-z]{{2,8}}(?:[-_][A-Za-z0-9]{{1,8}})*)\))?_{VERSION}\.md$")
+    bundle_re = re.compile(rf"^{re.escape(project_id)}_{VERSION}\.zip$")
+
+    sources, guides, assets, bundles = [], {}, [], []
+    for path in sorted(folder.iterdir()):
+        name = path.name
+        if not path.is_file():
+            continue
+        if source_re.match(name):
+            sources.append(source_re.match(name))
+        elif guide_re.match(name):
+            match = guide_re.match(name)
+            locale = guide_locale(match.group("locale"))
+            guides.setdefault(locale, []).append(match)
+        elif bundle_re.match(name):
+            bundles.append(path)
+        elif path.suffix.lower() in IMAGE_TYPES:
+            assets.append(path)
+        else:
+            raise SystemExit(f"{path}: not a source, guide, image or bundle file name")
+    if not sources:
+        raise SystemExit(f"{folder}: no {project_id}_<version>.c source")
+    if not guides:
+        raise SystemExit(f"{folder}: no {project_id}_help[(<locale>)]_<version>.md guide")
+
+    source = newest(sources)
+    return {
+        "id": project_id,
+        "version": source.group("version"),
+        "source": folder / source.string,
+        "guides": {locale: folder / newest(matches).string for locale, matches in sorted(guides.items())},
+        "assets": assets,
+        "bundles": bundles,
+    }
+
+
+def add_guide_images(project, asset_base_urls):
+    # Guides may embed images from another project's folder via assetBaseUrl;
+    # those are part of the project (and its bundle) too.
+    names = {path.name for path in project["assets"]}
+    for locale, guide in project["guides"].items():
+        base = asset_base_urls.get(locale) or f"{PUBLIC_URL}/{project['id']}/"
+        for ref in re.findall(r"!\[[^\]]*\]\(([^)\s]+)\)", guide.read_text(encoding="utf-8")):
+            url = urljoin(base, ref)
+            if not url.startswith(PUBLIC_URL + "/"):
+                continue
+            path = PUBLIC_ROOT / unquote(url[len(PUBLIC_URL) + 1:])
+            if path.suffix.lower() in IMAGE_TYPES and path.is_file() and path.name not in names:
+                project["assets"].append(path)
+                names.add(path.name)
+
+
+def scan_ai_spec(project_id):
+    folder = AI_ROOT / project_id
+    ai_re = re.compile(rf"^{re.escape(project_id)}_AI_{VERSION}\.md$")
+    matches = [ai_re.match(path.name) for path in folder.glob("*.md")] if folder.is_dir() else []
+    matches = [match for match in matches if match]
+    if not matches:
+        return None
+    match = newest(matches)
+    return {"path": folder / match.string, "version": match.group("version")}
+
+
+def public_url(path):
+    return f"{PUBLIC_URL}/{quote(path.relative_to(PUBLIC_ROOT).as_posix(), safe='/()')}"
+
+
+def guide_locale(raw):
+    # Same canonical form as extractGuideLocale() in avr-mini-project-archive.js.
+    parts = (raw or "en").replace("_", "-").split("-")
+    return "-".join(
+        part.lower() if index == 0 else part.upper() if len(part) == 2 else part
+        for index, part in enumerate(parts)
+    )
+
+
+def file_entry(path, media_type, file_hash):
+    return {
+        "name": path.name,
+        "mediaType": media_type,
+        "url": public_url(path),
+        "size": path.stat().st_size,
+        "sha256": file_hash(path),
+    }
+
+
+def build_bundle(project, ai_spec):
+    members = [project["source"], *project["guides"].values(), ai_spec["path"], *project["assets"]]
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        for path in sorted(members, key=lambda member: member.name):
+            info = zipfile.ZipInfo(f"{project['id']}/{path.name}", date_time=BUNDLE_DATE)
+            info.external_attr = 0o644 << 16
+            # Images are already compressed; deflating them only costs time.
+            info.compress_type = zipfile.ZIP_STORED if path.suffix.lower() in IMAGE_TYPES else zipfile.ZIP_DEFLATED
+            archive.writestr(info, path.read_bytes(), compresslevel=9)
+    return buffer.getvalue()
+
+
+def bundle_inputs(project, ai_spec, file_hash):
+    members = [project["source"], *project["guides"].values(), ai_spec["path"], *project["assets"]]
+    digest = hashlib.sha256()
+    for path in sorted(members, key=lambda member: member.name):
+        digest.update(f"{path.name}\0{file_hash(path)}\n".encode("utf-8"))
+    return digest.hexdigest()
+
+
+def public_descriptor(project, previous, file_hash, bundle):
+    guides_before = {guide.get("locale"): guide for guide in previous.get("guides", [])}
+    descriptor = {"id": project["id"]}
+    for key in ("displayName", "title", "summary"):
+        if key in previous:
+            descriptor[key] = previous[key]
+    descriptor.setdefault("displayName", project["id"])
+    descriptor.setdefault("title", project["id"])
+    descriptor["version"] = project["version"]
+    default_locale = previous.get("defaultLocale") or ("en" if "en" in project["guides"] else next(iter(project["guides"])))
+    descriptor["defaultLocale"] = default_locale
+    descriptor["source"] = file_entry(project["source"], "text/x-c", file_hash)
+
+    descriptor["guides"] = []
+    for locale, path in project["guides"].items():
+        entry = file_entry(path, "text/markdown", file_hash)
+        before = guides_before.get(locale, {})
+        guide = {
+            "locale": locale,
+            "label": before.get("label") or LOCALE_LABELS.get(locale, locale),
+            **entry,
+            "assetBaseUrl": before.get("assetBaseUrl") or f"{PUBLIC_URL}/{project['id']}/",
+        }
+        descriptor["guides"].append(guide)
+
+    if project["assets"]:
+        descriptor["assets"] = [file_entry(path, IMAGE_TYPES[path.suffix.lower()], file_hash) for path in project["assets"]]
+    if bundle is not None:
+        descriptor["bundle"] = bundle
+    if "aiSpecRef" in previous:
+        descriptor["aiSpecRef"] = previous["aiSpecRef"]
+    return descriptor
+
+
+def ai_descriptor(project_id, ai_spec, file_hash):
+    path = ai_spec["path"]
+    return {
+        "id": project_id,
+        "version": ai_spec["version"],
+        "file": path.relative_to(AI_ROOT).as_posix(),
+        "mediaType": "text/markdown",
+        "size": path.stat().st_size,
+        "sha256": file_hash(path),
+    }
+
+
+def render_json(data):
+    return json.dumps(data, indent=2, ensure_ascii=False) + "\n"
+
+
+def load_json(path, default):
+    try:
+        return json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return default
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the mini-project catalogs and per-project ZIP bundles")
+    parser.add_argument("--check", action="store_true", help="Exit 1 if a catalog or built bundle is out of date, write nothing (bundles not built yet are skipped)")
+    parser.add_argument("--force", action="store_true", help="Rebuild every bundle even if its inputs are unchanged")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    state = load_json(STATE_PATH, {})
+    file_hash = FileHashes({} if args.force else state.get("files", {}))
+    bundle_state = {} if args.force else state.get("bundles", {})
+
+    public_catalog_path = PUBLIC_ROOT / "catalog.json"
+    ai_catalog_path = AI_ROOT / "catalog.json"
+    previous = {entry["id"]: entry for entry in load_json(public_catalog_path, {}).get("projects", [])}
+
+    public_projects, ai_projects, stale, unbuilt = [], [], [], []
+    built = written = reused = 0
+    for folder in sorted(path for path in PUBLIC_ROOT.iterdir() if path.is_dir() and PROJECT_DIR_RE.match(path.name)):
+        project = scan_public_project(folder)
+        before = previous.get(project["id"], {})
+        add_guide_images(project, {guide.get("locale"): guide.get("assetBaseUrl") for guide in before.get("guides", [])})
+        ai_spec = scan_ai_spec(project["id"])
+
+        bundle_path = bundle = None
+        if ai_spec is not None:
+            ai_projects.append(ai_descriptor(project["id"], ai_spec, file_hash))
+            bundle_path = folder / f"{project['id']}_{project['version']}.zip"
+            inputs = bundle_inputs(project, ai_spec, file_hash)
+            recorded = bundle_state.get(project["id"], {})
+            if (
+                bundle_path.is_file()
+                and recorded.get("inputs") == inputs
+                and recorded.get("sha256") == file_hash(bundle_path)
+            ):
+                reused += 1
+                bundle = file_entry(bundle_path, "application/zip", file_hash)
+            else:
+                # Bundles are deterministic, so an existing file with the same bytes is kept as is.
+                data = build_bundle(project, ai_spec)
+                built += 1
+                if args.check and not bundle_path.is_file():
+                    # Bundles are not tracked (.gitignore), so a fresh clone has none; the
+                    # catalogs are still checked against the bytes a build would write.
+                    unbuilt.append(bundle_path)
+                elif not bundle_path.is_file() or bundle_path.read_bytes() != data:
+                    stale.append(bundle_path)
+                    written += 1
+                    if not args.check:
+                        tmp = bundle_path.with_name(bundle_path.name + ".tmp")
+                        tmp.write_bytes(data)
+                        tmp.replace(bundle_path)
+                        file_hash.current.pop(bundle_path.as_posix(), None)
+                bundle = {
+                    "name": bundle_path.name,
+                    "mediaType": "application/zip",
+                    "url": public_url(bundle_path),
+                    "size": len(data),
+                    "sha256": hashlib.sha256(data).hexdigest(),
+                }
+            bundle_state[project["id"]] = {"inputs": inputs, "sha256": bundle["sha256"]}
+        else:
+            print(f"warning: {project['id']} has no AI spec in {AI_ROOT}, no bundle built", file=sys.stderr)
+
+        for old_bundle in project["bundles"]:
+            if old_bundle != bundle_path:
+                stale.append(old_bundle)
+                if not args.check:
+                    old_bundle.unlink()
+
+        public_projects.append(public_descriptor(project, before, file_hash, bundle))
+
+    outputs = [
+        (public_catalog_path, render_json({"schemaVersion": 1, "projects": public_projects})),
+        (ai_catalog_path, render_json({"schemaVersion": 1, "projects": ai_projects})),
+    ]
+    changed = [path for path, text in outputs if not path.is_file() or path.read_text(encoding="utf-8") != text]
+
+    elapsed_ms = (time.perf_counter() - started) * 1000.0
+    if args.check:
+        for path in stale + changed:
+            print(f"out of date: {path}")
+        for path in unbuilt:
+            print(f"skipped (not built): {path}")
+        print(f"{len(public_projects)} projects checked in {elapsed_ms:.1f} ms")
+        sys.exit(1 if stale or changed else 0)
+
+    for path, text in outputs:
+        if path in changed:
+            path.write_text(text, encoding="utf-8")
+    STATE_PATH.write_text(
+        json.dumps({"files": file_hash.current, "bundles": bundle_state}, indent=1, sort_keys=True),
+        encoding="utf-8",
+    )
+    print(
+        f"{len(public_projects)} projects: {built} bundles rebuilt ({written} changed), {reused} unchanged; "
+        f"{len(changed)} catalogs written in {elapsed_ms:.1f} ms"
+    )
+
+
+if __name__ == "__main__":
+    main()
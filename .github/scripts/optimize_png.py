@@ -0,0 +1,403 @@
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from pathlib import Path
+import argparse
+import hashlib
+import json
+import os
+import struct
+import time
+import zlib
+
+
+# Lossless PNG recompression with the standard library only. Every PNG under the
+# roots is decoded, optionally reduced (opaque RGBA -> RGB, grey RGB -> grey),
+# re-filtered, re-deflated at level 9 and written back when that is smaller.
+# Ancillary chunks are dropped except tRNS (and the colour chunks with
+# --keep-color). Run before build_mini_project_catalog.py and
+# stamp_frontend_build.py, which hash the images.
+#
+# Results are cached by source hash in --cache-dir, so unchanged images cost one
+# sha256 on the next run (and in CI when the directory is restored).
+SIGNATURE = b"\x89PNG\r\n\x1a\n"
+CACHE_VERSION = 1
+KEEP_CHUNKS = {b"IHDR", b"PLTE", b"IDAT", b"IEND", b"tRNS"}
+COLOR_CHUNKS = {b"cHRM", b"gAMA", b"iCCP", b"sBIT", b"sRGB"}
+CHANNELS = {0: 1, 2: 3, 3: 1, 4: 2, 6: 4}
+VARIANT_DIR = "variants"
+ABS_COST = bytes(min(value, 256 - value) for value in range(256))
+
+
+class NotSupported(Exception):
+    pass
+
+
+def read_chunks(data):
+    if not data.startswith(SIGNATURE):
+        raise NotSupported("not a PNG file")
+    chunks = []
+    pos = len(SIGNATURE)
+    while pos < len(data):
+        if pos + 12 > len(data):
+            raise NotSupported("truncated chunk")
+        length, kind = struct.unpack(">I4s", data[pos:pos + 8])
+        body = data[pos + 8:pos + 8 + length]
+        (crc,) = struct.unpack(">I", data[pos + 8 + length:pos + 12 + length])
+        if len(body) != length or zlib.crc32(kind + body) != crc:
+            raise NotSupported(f"bad {kind.decode('latin-1')} chunk")
+        chunks.append((kind, body))
+        pos += 12 + length
+        if kind == b"IEND":
+            break
+    if not chunks or chunks[0][0] != b"IHDR" or chunks[-1][0] != b"IEND":
+        raise NotSupported("missing IHDR or IEND")
+    return chunks
+
+
+def chunk_bytes(kind, body):
+    return struct.pack(">I", len(body)) + kind + body + struct.pack(">I", zlib.crc32(kind + body))
+
+
+def parse_ihdr(body):
+    width, height, depth, color, compression, filter_method, interlace = struct.unpack(">IIBBBBB", body)
+    if color not in CHANNELS or compression != 0 or filter_method != 0:
+        raise NotSupported("unknown IHDR values")
+    return {"width": width, "height": height, "depth": depth, "color": color, "interlace": interlace}
+
+
+def build_ihdr(info):
+    return struct.pack(">IIBBBBB", info["width"], info["height"], info["depth"], info["color"], 0, 0, 0)
+
+
+def geometry(info):
+    bits = CHANNELS[info["color"]] * info["depth"]
+    return (info["width"] * bits + 7) // 8, max(1, bits // 8)
+
+
+# Byte-wise arithmetic mod 256 on whole scanlines at once: each row is one big int
+# and the carries between bytes are masked off (SIMD within a register).
+@lru_cache(maxsize=64)
+def lane_masks(size):
+    high = int.from_bytes(b"\x80" * size, "big")
+    low = int.from_bytes(b"\x7f" * size, "big")
+    return high, low, int.from_bytes(b"\xfe" * size, "big")
+
+
+def lanes_add(x, y, size):
+    high, low, _ = lane_masks(size)
+    return ((x & low) + (y & low)) ^ ((x ^ y) & high)
+
+
+def lanes_sub(x, y, size):
+    high, low, _ = lane_masks(size)
+    return (((x | high) - (y & low)) ^ ((x ^ ~y) & high)) & (high | low)
+
+
+def lanes_avg(x, y, size):
+    _, _, even = lane_masks(size)
+    return (x & y) + (((x ^ y) & even) >> 1)
+
+
+def unfilter(raw, info):
+    stride, bpp = geometry(info)
+    rows = []
+    prior = bytes(stride)
+    pos = 0
+    for _ in range(info["height"]):
+        kind = raw[pos]
+        line = raw[pos + 1:pos + 1 + stride]
+        pos += 1 + stride
+        if len(line) != stride:
+            raise NotSupported("truncated image data")
+        if kind == 0:
+            row = bytes(line)
+        elif kind == 1:
+            # prefix sum per channel: log2(stride) shifted lane additions
+            value = int.from_bytes(line, "big")
+            shift = bpp
+            while shift < stride:
+                value = lanes_add(value, value >> (8 * shift), stride)
+                shift *= 2
+            row = value.to_bytes(stride, "big")
+        elif kind == 2:
+            row = lanes_add(int.from_bytes(line, "big"), int.from_bytes(prior, "big"), stride).to_bytes(stride, "big")
+        elif kind in (3, 4):
+            row = bytearray(line)
+            for i in range(stride):
+                left = row[i - bpp] if i >= bpp else 0
+                up = prior[i]
+                if kind == 3:
+                    row[i] = (row[i] + ((left + up) >> 1)) & 0xFF
+                else:
+                    corner = prior[i - bpp] if i >= bpp else 0
+                    p = left + up - corner
+                    pa, pb, pc = abs(p - left), abs(p - up), abs(p - corner)
+                    predictor = left if pa <= pb and pa <= pc else (up if pb <= pc else corner)
+                    row[i] = (row[i] + predictor) & 0xFF
+            row = bytes(row)
+        else:
+            raise NotSupported(f"unknown filter type {kind}")
+        rows.append(row)
+        prior = row
+    return rows
+
+
+def filter_rows(rows, bpp, adaptive):
+    # adaptive: per row, the cheapest of None/Sub/Up/Average by the usual
+    # minimum-sum-of-absolute-differences heuristic; otherwise filter None.
+    out = bytearray()
+    stride = len(rows[0]) if rows else 0
+    prior = 0
+    for row in rows:
+        if not adaptive:
+            out += b"\x00" + row
+            continue
+        value = int.from_bytes(row, "big")
+        left = value >> (8 * bpp)
+        candidates = [
+            (0, row),
+            (1, lanes_sub(value, left, stride).to_bytes(stride, "big")),
+            (2, lanes_sub(value, prior, stride).to_bytes(stride, "big")),
+            (3, lanes_sub(value, lanes_avg(left, prior, stride), stride).to_bytes(stride, "big")),
+        ]
+        kind, line = min(candidates, key=lambda item: sum(item[1].translate(ABS_COST)))
+        out.append(kind)
+        out += line
+        prior = value
+    return bytes(out)
+
+
+def deflate(data):
+    best = None
+    for strategy in (zlib.Z_DEFAULT_STRATEGY, zlib.Z_FILTERED):
+        packer = zlib.compressobj(9, zlib.DEFLATED, 15, 9, strategy)
+        packed = packer.compress(data) + packer.flush()
+        if best is None or len(packed) < len(best):
+            best = packed
+    return best
+
+
+def reduce_color(info, rows, chunk_kinds):
+    # Lossless colour-type reductions for 8-bit images; skipped when tRNS or an
+    # ICC profile would need rewriting too.
+    if info["depth"] != 8 or b"tRNS" in chunk_kinds:
+        return info, rows
+    color = info["color"]
+    if color in (4, 6):
+        channels = CHANNELS[color]
+        if all(row[channels - 1::channels].count(255) == info["width"] for row in rows):
+            rows = [drop_channel(row, channels, channels - 1) for row in rows]
+            color = 0 if color == 4 else 2
+    if color in (2, 6) and b"iCCP" not in chunk_kinds:
+        channels = CHANNELS[color]
+        if all(row[0::channels] == row[1::channels] == row[2::channels] for row in rows):
+            rows = [keep_channels(row, channels, [0] + ([3] if color == 6 else [])) for row in rows]
+            color = 0 if color == 2 else 4
+    return dict(info, color=color), rows
+
+
+def drop_channel(row, channels, index):
+    return keep_channels(row, channels, [c for c in range(channels) if c != index])
+
+
+def keep_channels(row, channels, keep):
+    out = bytearray(len(row) // channels * len(keep))
+    for slot, channel in enumerate(keep):
+        out[slot::len(keep)] = row[channel::channels]
+    return bytes(out)
+
+
+def encode(info, rows, chunks, keep_color, original_filtered=None):
+    stride, bpp = geometry(info)
+    streams = [filter_rows(rows, bpp, adaptive=True), filter_rows(rows, bpp, adaptive=False)]
+    if original_filtered is not None:
+        streams.append(original_filtered)
+    idat = min((deflate(stream) for stream in streams), key=len)
+    out = [SIGNATURE]
+    wrote_idat = False
+    for kind, body in chunks:
+        if kind == b"IHDR":
+            out.append(chunk_bytes(kind, build_ihdr(info)))
+        elif kind == b"IDAT":
+            if not wrote_idat:
+                out.append(chunk_bytes(kind, idat))
+                wrote_idat = True
+        elif kind in KEEP_CHUNKS or (keep_color and kind in COLOR_CHUNKS):
+            out.append(chunk_bytes(kind, body))
+    return b"".join(out)
+
+
+def decode(data):
+    chunks = read_chunks(data)
+    info = parse_ihdr(chunks[0][1])
+    if info["interlace"]:
+        raise NotSupported("interlaced")
+    raw = zlib.decompress(b"".join(body for kind, body in chunks if kind == b"IDAT"))
+    return chunks, info, raw, unfilter(raw, info)
+
+
+def optimize(data, keep_color):
+    chunks, info, raw, rows = decode(data)
+    reduced_info, reduced_rows = reduce_color(info, rows, {kind for kind, _body in chunks})
+    kept = [(kind, body) for kind, body in chunks if kind != b"sBIT" or reduced_info["color"] == info["color"]]
+    original = raw if reduced_info["color"] == info["color"] else None
+    packed = encode(reduced_info, reduced_rows, kept, keep_color, original)
+    if len(packed) >= len(data):
+        return data
+    # Never ship an image that does not decode to the same pixels.
+    _chunks, check_info, _raw, check_rows = decode(packed)
+    if check_info != reduced_info or check_rows != reduced_rows:
+        raise NotSupported("round trip mismatch")
+    return packed
+
+
+def downscale(info, rows, target_width):
+    # Box average over k x k blocks (straight alpha), k chosen so the width fits.
+    channels = CHANNELS[info["color"]]
+    factor = -(-info["width"] // target_width)
+    out_width = -(-info["width"] // factor)
+    out_rows = []
+    for top in range(0, info["height"], factor):
+        block = rows[top:top + factor]
+        column_sums = [sum(column) for column in zip(*block)] if len(block) > 1 else list(block[0])
+        out = bytearray(out_width * channels)
+        for channel in range(channels):
+            lane = column_sums[channel::channels]
+            for x in range(out_width):
+                cells = lane[x * factor:(x + 1) * factor]
+                count = len(cells) * len(block)
+                out[x * channels + channel] = (sum(cells) + count // 2) // count
+        out_rows.append(bytes(out))
+    return dict(info, width=out_width, height=len(out_rows)), out_rows
+
+
+def make_variant(data, width, keep_color):
+    chunks, info, _raw, rows = decode(data)
+    if info["depth"] != 8 or info["color"] == 3 or b"tRNS" in {kind for kind, _body in chunks}:
+        raise NotSupported("variants need 8-bit grey/RGB(A) without tRNS")
+    if info["width"] <= width:
+        return None
+    small_info, small_rows = downscale(info, rows, width)
+    small_info, small_rows = reduce_color(small_info, small_rows, {kind for kind, _body in chunks})
+    return encode(small_info, small_rows, chunks, keep_color)
+
+
+def variant_path(path, width):
+    return path.parent / VARIANT_DIR / f"{path.stem}@{width}w.png"
+
+
+def cache_file(cache_dir, sha, suffix):
+    return cache_dir / f"{sha}-v{CACHE_VERSION}{suffix}.png"
+
+
+def cached_or_build(cache_dir, sha, suffix, build):
+    entry = cache_file(cache_dir, sha, suffix)
+    if entry.is_file():
+        return entry.read_bytes(), True
+    data = build()
+    if data is not None:
+        entry.parent.mkdir(parents=True, exist_ok=True)
+        tmp = entry.with_name(f"{entry.name}.{os.getpid()}.tmp")
+        tmp.write_bytes(data)
+        os.replace(tmp, entry)
+    return data, False
+
+
+def process(job):
+    path, cache_dir, keep_color, widths = job
+    source = path.read_bytes()
+    sha = hashlib.sha256(source).hexdigest()
+    suffix = "-c" if keep_color else ""
+    result = {"path": path.as_posix(), "before": len(source), "after": len(source), "cached": False, "variants": []}
+    try:
+        optimized, hit = cached_or_build(cache_dir, sha, suffix, lambda: optimize(source, keep_color))
+        result["after"] = len(optimized)
+        result["cached"] = hit
+        result["data"] = optimized if optimized != source else None
+        # The optimized file is its own result next time, and variants are keyed
+        # by it so they are found again after the source was rewritten.
+        optimized_sha = hashlib.sha256(optimized).hexdigest()
+        if optimized != source:
+            cached_or_build(cache_dir, optimized_sha, suffix, lambda: optimized)
+        for width in widths:
+            variant, hit = cached_or_build(cache_dir, optimized_sha, f"{suffix}-w{width}", lambda: make_variant(optimized, width, keep_color))
+            if variant is not None:
+                result["variants"].append({"width": width, "path": variant_path(path, width).as_posix(), "bytes": len(variant), "data": variant})
+    except (NotSupported, zlib.error) as error:
+        result["skipped"] = str(error)
+    return result
+
+
+def write_atomic(path, data):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+
+
+def percent(saved, total):
+    return 100.0 * saved / total if total else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Losslessly recompress PNG images (standard library only)")
+    parser.add_argument("--root", action="append", default=None, help="Directory to scan, repeatable (default: public)")
+    parser.add_argument("--cache-dir", default=".png-cache", help="Results by source sha256 (default: .png-cache)")
+    parser.add_argument("--keep-color", action="store_true", help="Keep sRGB/gAMA/cHRM/iCCP/sBIT chunks")
+    parser.add_argument("--variant-width", type=int, action="append", default=[], help=f"Also write <dir>/{VARIANT_DIR}/<name>@<W>w.png no wider than W, repeatable")
+    parser.add_argument("--workers", type=int, default=None, help="Processes (default: CPU count)")
+    parser.add_argument("--dry-run", action="store_true", help="Report savings, write nothing but the cache")
+    parser.add_argument("--report", default=None, help="Write per-file results as JSON to this path")
+    parser.add_argument("--quiet", action="store_true", help="Only print the totals")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    roots = [Path(root) for root in (args.root or ["public"])]
+    cache_dir = Path(args.cache_dir)
+    files = sorted(
+        path for root in roots for path in root.rglob("*")
+        if path.suffix.lower() == ".png" and path.is_file() and VARIANT_DIR not in path.relative_to(root).parts[:-1]
+    )
+    jobs = [(path, cache_dir, args.keep_color, args.variant_width) for path in files]
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        results = list(pool.map(process, jobs))
+
+    totals = {"before": 0, "after": 0, "changed": 0, "cached": 0, "variants": 0}
+    for result in results:
+        totals["before"] += result["before"]
+        totals["after"] += result["after"]
+        totals["cached"] += result["cached"]
+        data = result.pop("data", None)
+        if data is not None:
+            totals["changed"] += 1
+            if not args.dry_run:
+                write_atomic(Path(result["path"]), data)
+        for variant in result["variants"]:
+            totals["variants"] += 1
+            variant_data = variant.pop("data")
+            variant_file = Path(variant["path"])
+            if not args.dry_run and (not variant_file.is_file() or variant_file.read_bytes() != variant_data):
+                write_atomic(variant_file, variant_data)
+        if args.quiet:
+            continue
+        saved = result["before"] - result["after"]
+        state = f"skipped: {result['skipped']}" if "skipped" in result else ("cached" if result["cached"] else "optimized")
+        line = f"{result['path']}: {result['before']} -> {result['after']} B (-{saved} B, {percent(saved, result['before']):.1f}%) [{state}]"
+        for variant in result["variants"]:
+            line += f"\n  {variant['path']}: {variant['bytes']} B"
+        print(line)
+
+    if args.report:
+        Path(args.report).write_text(json.dumps({"totals": totals, "files": results}, indent=1) + "\n", encoding="utf-8")
+
+    saved = totals["before"] - totals["after"]
+    elapsed_ms = (time.perf_counter() - started) * 1000.0
+    action = "would shrink" if args.dry_run else "shrank"
+    print(
+        f"{len(results)} PNG files, {totals['before']} -> {totals['after']} B (-{saved} B, {percent(saved, totals['before']):.1f}%); "
+        f"{action} {totals['changed']}, {totals['cached']} from cache, {totals['variants']} variants in {elapsed_ms:.1f} ms"
+    )
+
+
+if __name__ == "__main__":
+    main()
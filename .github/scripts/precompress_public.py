@@ -0,0 +1,168 @@
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import time
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+# Writes <file>.gz (and <file>.br when the brotli module is installed) next to every
+# text asset in public/, for nginx gzip_static / brotli_static. Run after
+# stamp_frontend_build.py, which still edits the pages, manifest and sw.js.
+TEXT_EXTENSIONS = {
+    ".c", ".css", ".h", ".html", ".ico", ".js", ".json", ".map", ".md",
+    ".mjs", ".svg", ".txt", ".webmanifest", ".xml",
+}
+STATE_VERSION = 1
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as handle:
+        for chunk in iter(lambda: handle.read(1 << 16), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def write_sibling(path, data):
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+
+
+def remove_sibling(path):
+    try:
+        path.unlink()
+    except FileNotFoundError:
+        pass
+
+
+def compress_file(path, use_brotli):
+    # A variant is only kept when it is smaller than the source.
+    data = path.read_bytes()
+    sizes = {"raw": len(data), "gz": None, "br": None}
+    variants = [("gz", lambda: gzip.compress(data, compresslevel=9, mtime=0))]
+    if use_brotli:
+        variants.append(("br", lambda: brotli.compress(data, quality=11)))
+    else:
+        # A .br left by a run that had brotli would go stale next to the new source.
+        remove_sibling(path.with_name(f"{path.name}.br"))
+    for suffix, compress in variants:
+        sibling = path.with_name(f"{path.name}.{suffix}")
+        packed = compress()
+        if len(packed) < len(data):
+            write_sibling(sibling, packed)
+            sizes[suffix] = len(packed)
+        else:
+            remove_sibling(sibling)
+    return sizes
+
+
+def load_state(path):
+    try:
+        state = json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+    return state.get("files", {}) if state.get("version") == STATE_VERSION else {}
+
+
+def is_current(path, entry, sha, use_brotli):
+    if entry is None or entry["sha256"] != sha or entry["brotli"] != use_brotli:
+        return False
+    return all(
+        entry[suffix] is None or path.with_name(f"{path.name}.{suffix}").is_file()
+        for suffix in ("gz", "br")
+    )
+
+
+def percent(saved, total):
+    return 100.0 * saved / total if total else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write .gz/.br siblings for text assets in public/")
+    parser.add_argument("--root", default="public", help="Directory to precompress (default: public)")
+    parser.add_argument("--min-size", type=int, default=1024, help="Skip files smaller than this many bytes (default: 1024)")
+    parser.add_argument("--workers", type=int, default=None, help="Compression processes (default: CPU count)")
+    parser.add_argument("--state", default=".precompress-state.json", help="Source hashes of the last run (default: .precompress-state.json)")
+    parser.add_argument("--force", action="store_true", help="Recompress every file even if its source is unchanged")
+    parser.add_argument("--quiet", action="store_true", help="Only print the totals")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    root = Path(args.root)
+    state_path = Path(args.state)
+    use_brotli = brotli is not None
+    previous = {} if args.force else load_state(state_path)
+
+    candidates = sorted(
+        path for path in root.rglob("*")
+        if path.is_file() and path.suffix.lower() in TEXT_EXTENSIONS and path.stat().st_size >= args.min_size
+    )
+
+    entries = {}
+    todo = []
+    for path in candidates:
+        key = path.relative_to(root).as_posix()
+        sha = file_sha256(path)
+        if is_current(path, previous.get(key), sha, use_brotli):
+            entries[key] = dict(previous[key], skipped=True)
+        else:
+            entries[key] = {"sha256": sha, "brotli": use_brotli}
+            todo.append((key, path))
+
+    # Sources that were deleted or fell under the threshold lose their siblings.
+    for key in previous.keys() - entries.keys():
+        for suffix in ("gz", "br"):
+            remove_sibling(root / f"{key}.{suffix}")
+
+    if todo:
+        with ProcessPoolExecutor(max_workers=args.workers) as pool:
+            sizes = pool.map(compress_file, [path for _key, path in todo], [use_brotli] * len(todo))
+            for (key, _path), file_sizes in zip(todo, sizes):
+                entries[key].update(file_sizes, skipped=False)
+
+    totals = {"raw": 0, "gz": 0, "br": 0}
+    for key, entry in entries.items():
+        totals["raw"] += entry["raw"]
+        totals["gz"] += entry["gz"] if entry["gz"] is not None else entry["raw"]
+        totals["br"] += entry["br"] if entry["br"] is not None else entry["raw"]
+        if args.quiet:
+            continue
+        parts = [f"{entry['raw']} B"]
+        for suffix in ("gz", "br"):
+            if entry[suffix] is not None:
+                parts.append(f"{suffix} {entry[suffix]} B (-{percent(entry['raw'] - entry[suffix], entry['raw']):.1f}%)")
+        state = "unchanged" if entry["skipped"] else "compressed"
+        print(f"{key}: {', '.join(parts)} [{state}]")
+
+    state_path.write_text(
+        json.dumps(
+            {"version": STATE_VERSION, "files": {key: {k: v for k, v in entry.items() if k != "skipped"} for key, entry in entries.items()}},
+            indent=1,
+            sort_keys=True,
+        ),
+        encoding="utf-8",
+    )
+
+    elapsed_ms = (time.perf_counter() - started) * 1000.0
+    summary = f"gz saves {totals['raw'] - totals['gz']} B ({percent(totals['raw'] - totals['gz'], totals['raw']):.1f}%)"
+    if use_brotli:
+        summary += f", br saves {totals['raw'] - totals['br']} B ({percent(totals['raw'] - totals['br'], totals['raw']):.1f}%)"
+    else:
+        summary += ", br skipped (brotli module not installed)"
+    print(
+        f"{len(entries)} files, {totals['raw']} B: {summary}; "
+        f"{len(todo)} compressed, {len(entries) - len(todo)} unchanged in {elapsed_ms:.1f} ms"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,83 +1,350 @@
 from pathlib import Path
+from urllib.parse import quote, unquote, urljoin
+from datetime import datetime, timezone
+import argparse
+import hashlib
+import json
 import os
 import re
+import time
+import zlib
 
 
-def get_build_id():
-    explicit_build_id = os.environ.get("FRONTEND_BUILD_ID")
-    if explicit_build_id:
-        return explicit_build_id
+# Every reference to a precached asset gets ?v=<content hash>, and sw.js gets the
+# generated path -> hash map, so a deploy only refetches the assets that changed.
+# Runs in the deploy job; the repository keeps the sources unstamped (empty map,
+# no ?v=), so do not commit the output of a local run.
+HASH_LENGTH = 10
+URL_SAFE = "/()!$&'*+,;=:@-._~"
 
-    sha = os.environ["GITHUB_SHA"][:12]
-    run_id = os.environ["GITHUB_RUN_ID"]
-    run_attempt = os.environ["GITHUB_RUN_ATTEMPT"]
-    return f"{sha}-{run_id}-{run_attempt}"
+REGISTER_PATTERN = (
+    r'navigator\.serviceWorker\.register\(\s*["\']/sw\.js(?:\?v=[^"\']*)?["\']'
+    r'(?:\s*,\s*\{\s*updateViaCache:\s*["\']none["\']\s*\})?\s*\)'
+)
+REGISTER_REPLACEMENT = 'navigator.serviceWorker.register("/sw.js", { updateViaCache: "none" })'
 
+PAGE_REF_PREFIX = r'(?:src|href)=["\']'
+MANIFEST_REF_PREFIX = r'"src"\s*:\s*"'
+REF_URL = r'(?P<url>[^"\'?#\s]+)(?:\?v=[^"\'#\s]*)?'
 
-def stamp_file(path, replacements):
-    text = path.read_text(encoding="utf-8")
-    for pattern, replacement in replacements:
-        text = pattern.sub(replacement, text)
-    path.write_text(text, encoding="utf-8")
+ASSETS_BLOCK = re.compile(r"const APP_SHELL_ASSETS = \{.*?\n\};\n", re.S)
+LEGACY_BLOCK = re.compile(r"const LEGACY_PATHS = new Set\(\[(.*?)\]\);", re.S)
+
+
+def content_hash(data):
+    return hashlib.sha256(data).hexdigest()[:HASH_LENGTH]
+
+
+def url_for(public_dir, path):
+    return "/" + quote(path.relative_to(public_dir).as_posix(), safe=URL_SAFE)
+
+
+def resolve_ref(public_dir, page_url, ref):
+    # Local file behind a src/href value, or None for external links, routes and missing files.
+    if ref.startswith("//") or re.match(r"[a-zA-Z][a-zA-Z0-9+.-]*:", ref):
+        return None
+    url = urljoin(page_url, ref)
+    path = public_dir / unquote(url.lstrip("/"))
+    if not path.is_file() or public_dir.resolve() not in path.resolve().parents:
+        return None
+    return url_for(public_dir, path)
+
+
+def build_stamper(ref_prefix, resolve, register=True):
+    # One alternation, one scan per file: the named group that matched picks
+    # the replacement from the dispatch table.
+    alternatives = []
+    if register:
+        alternatives.append(f"(?P<register>{REGISTER_PATTERN})")
+    alternatives.append(f"(?P<prefix>{ref_prefix}){REF_URL}")
+    pattern = re.compile("|".join(alternatives))
+
+    def stamp(text, versions):
+        counts = {}
+
+        def stamp_register(match):
+            counts["register"] = counts.get("register", 0) + 1
+            return REGISTER_REPLACEMENT
+
+        def stamp_url(match):
+            version = versions.get(resolve(match.group("url")))
+            if version is None:
+                return match.group(0)
+            counts["assets"] = counts.get("assets", 0) + 1
+            return f"{match.group('prefix')}{match.group('url')}?v={version}"
+
+        dispatch = {"register": stamp_register, "url": stamp_url}
+        return pattern.sub(lambda match: dispatch[match.lastgroup](match), text), counts
+
+    return stamp
+
+
+def legacy_paths(sw_text):
+    match = LEGACY_BLOCK.search(sw_text)
+    return set(json.loads(f"[{match.group(1).rstrip().rstrip(',')}]")) if match else set()
+
+
+def page_routes(page_url):
+    # /index.html is also served as /, /avr.html as /avr.
+    if page_url == "/index.html":
+        return ["/", page_url]
+    return [page_url[: -len(".html")], page_url]
+
+
+def catalog_urls(public_dir, catalog_path):
+    # Sources, guides and assets listed in the catalog plus the images the guides embed.
+    catalog = json.loads(catalog_path.read_text(encoding="utf-8"))
+    urls = [url_for(public_dir, catalog_path)]
+
+    def walk(node, base=None):
+        if isinstance(node, dict):
+            base = node.get("assetBaseUrl", base)
+            url = node.get("url")
+            if isinstance(url, str):
+                resolved = resolve_ref(public_dir, "/", url)
+                if resolved:
+                    urls.append(resolved)
+                if url.endswith(".md") and resolved:
+                    guide = public_dir / unquote(resolved.lstrip("/"))
+                    for image in re.findall(r"!\[[^\]]*\]\(([^)\s]+)", guide.read_text(encoding="utf-8")):
+                        image_url = resolve_ref(public_dir, base or resolved, image)
+                        if image_url:
+                            urls.append(image_url)
+            for key, value in node.items():
+                # A bundle repeats the files listed next to it; the browser
+                # falls back to those, so precaching it would double the install.
+                if key != "bundle":
+                    walk(value, base)
+        elif isinstance(node, list):
+            for value in node:
+                walk(value, base)
+
+    walk(catalog)
+    return urls
+
+
+def generate_sw(sw_text, assets):
+    lines = ["const APP_SHELL_ASSETS = {"]
+    lines += [f"  {json.dumps(url)}: {json.dumps(version)}," for url, version in assets.items()]
+    lines.append("};\n")
+    new_text, count = ASSETS_BLOCK.subn(lambda match: "\n".join(lines), sw_text, count=1)
+    if count != 1:
+        raise SystemExit("Could not find APP_SHELL_ASSETS in public/sw.js")
+    return new_text
+
+
+def parse_sw_assets(sw_text):
+    match = ASSETS_BLOCK.search(sw_text)
+    if match is None:
+        raise SystemExit("Could not find APP_SHELL_ASSETS in public/sw.js")
+    body = match.group(0)[len("const APP_SHELL_ASSETS = "): -len(";\n")]
+    return json.loads(re.sub(r",(\s*\})$", r"\1", body))
+
+
+def asset_path(public_dir, url):
+    # Routes resolve to their page: / -> index.html, /avr -> avr.html.
+    relative = unquote(url.lstrip("/"))
+    path = public_dir / relative
+    if path.is_file():
+        return path
+    page = public_dir / (f"{relative}index.html" if not relative or relative.endswith("/") else f"{relative}.html")
+    return page if page.is_file() else None
+
+
+def gzip_size(data):
+    # Same deflate stream as precompress_public.py writes; nginx only serves the
+    # .gz when it is smaller, so the transfer size is never above the raw size.
+    packer = zlib.compressobj(9, zlib.DEFLATED, 31)
+    return min(len(data), len(packer.compress(data) + packer.flush()))
+
+
+def measure_precache(public_dir, sw_text, pending):
+    # Resolve every APP_SHELL_ASSETS entry to a file and weigh it. pending maps
+    # paths to text that a dry run would have written.
+    entries = parse_sw_assets(sw_text)
+    missing, stale, resolved = [], [], []
+    for url, version in entries.items():
+        path = asset_path(public_dir, url)
+        if path is None:
+            missing.append(url)
+        else:
+            resolved.append((url, version, path))
+
+    def weigh(item):
+        url, version, path = item
+        data = pending[path].encode("utf-8") if path in pending else path.read_bytes()
+        return {
+            "url": url,
+            "path": path.relative_to(public_dir).as_posix(),
+            "version": version,
+            "raw": len(data),
+            "gzip": gzip_size(data),
+            "current": content_hash(data) == version,
+        }
+
+    assets = [weigh(item) for item in resolved]
+    stale = [asset["url"] for asset in assets if not asset.pop("current")]
+    return assets, missing, stale
+
+
+def precache_report(assets, budgets):
+    # Routes and their .html page are one download; count each file once.
+    files = {asset["path"]: asset for asset in assets}.values()
+    totals = {
+        "entries": len(assets),
+        "files": len(files),
+        "raw": sum(asset["raw"] for asset in files),
+        "gzip": sum(asset["gzip"] for asset in files),
+    }
+    over = []
+    if budgets["total"] is not None and totals["gzip"] > budgets["total"]:
+        over.append(f"precache is {totals['gzip']} B compressed, budget {budgets['total']} B")
+    if budgets["asset"] is not None:
+        for asset in sorted(files, key=lambda asset: -asset["gzip"]):
+            if asset["gzip"] > budgets["asset"]:
+                over.append(f"{asset['url']} is {asset['gzip']} B compressed, per-asset budget {budgets['asset']} B")
+    return {
+        "generated": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "commit": os.environ.get("GITHUB_SHA"),
+        "totals": totals,
+        "budgets": budgets,
+        "overBudget": over,
+        "assets": sorted(assets, key=lambda asset: (-asset["gzip"], asset["url"])),
+    }
+
+
+def print_precache_report(report, top):
+    totals = report["totals"]
+    assets = list({asset["path"]: asset for asset in report["assets"]}.values())
+    for asset in assets if top is None else assets[:top]:
+        print(f"  {asset['gzip']:>9} B gz {asset['raw']:>9} B raw  {asset['url']}")
+    if top is not None and len(assets) > top:
+        print(f"  ... {len(assets) - top} smaller files (--list-assets shows all)")
+    print(
+        f"Precache: {totals['entries']} entries, {totals['files']} files, "
+        f"{totals['raw']} B raw, {totals['gzip']} B compressed"
+    )
+
+
+def write_if_changed(path, text, dry_run):
+    if path.read_text(encoding="utf-8") == text:
+        return False
+    if not dry_run:
+        path.write_text(text, encoding="utf-8")
+    return True
 
 
 def main():
-    public_dir = Path("public")
-    build_id = get_build_id()
+    parser = argparse.ArgumentParser(description="Content-hash the precached frontend assets in public/")
+    parser.add_argument("--dry-run", action="store_true", help="Report matches per file and elapsed time, write nothing")
+    parser.add_argument("--budget", type=int, default=None, help="Fail when the precache exceeds this many compressed bytes")
+    parser.add_argument("--asset-budget", type=int, default=None, help="Fail when one precached file exceeds this many compressed bytes")
+    parser.add_argument("--report", default=None, help="Write the per-asset precache weights as JSON to this path")
+    parser.add_argument("--list-assets", action="store_true", help="Print every precached file instead of the 10 heaviest")
+    args = parser.parse_args()
 
+    started = time.perf_counter()
+    public_dir = Path("public")
     sw_path = public_dir / "sw.js"
+    manifest_path = public_dir / "manifest.webmanifest"
+    catalog_path = public_dir / "avr-mini-projects" / "catalog.json"
+
     sw_text = sw_path.read_text(encoding="utf-8")
-    sw_text, sw_count = re.subn(
-        r'const CACHE_NAME = "uartdebug-shell-[^"]+";',
-        f'const CACHE_NAME = "uartdebug-shell-{build_id}";',
-        sw_text,
-        count=1,
-    )
-    if sw_count != 1:
-        raise SystemExit("Could not stamp public/sw.js CACHE_NAME")
-    sw_path.write_text(sw_text, encoding="utf-8")
+    legacy = legacy_paths(sw_text)
+    all_pages = sorted(public_dir.rglob("*.html"))
+    shell_pages = [
+        path for path in all_pages
+        if path.parent == public_dir and url_for(public_dir, path) not in legacy
+    ]
 
-    register_pattern = re.compile(
-        r'navigator\.serviceWorker\.register\(\s*["\']/sw\.js(?:\?v=[^"\']*)?["\']'
-        r'(?:\s*,\s*\{\s*updateViaCache:\s*["\']none["\']\s*\})?\s*\)'
-    )
-    register_replacement = (
-        f'navigator.serviceWorker.register("/sw.js?v={build_id}", '
-        '{ updateViaCache: "none" })'
-    )
+    # 1. Assets referenced by the shell pages, the web manifest and the catalog.
+    ref_pattern = re.compile(PAGE_REF_PREFIX + REF_URL)
+    asset_urls = []
+    for page in shell_pages:
+        page_url = url_for(public_dir, page)
+        for ref in ref_pattern.finditer(page.read_text(encoding="utf-8")):
+            url = resolve_ref(public_dir, page_url, ref.group("url"))
+            if url and not url.endswith(".html") and url != "/sw.js":
+                asset_urls.append(url)
+    if manifest_path.exists():
+        manifest_text = manifest_path.read_text(encoding="utf-8")
+        for ref in re.finditer(MANIFEST_REF_PREFIX + REF_URL, manifest_text):
+            url = resolve_ref(public_dir, "/", ref.group("url"))
+            if url:
+                asset_urls.append(url)
+    if catalog_path.exists():
+        asset_urls += catalog_urls(public_dir, catalog_path)
+    asset_urls = [url for url in dict.fromkeys(asset_urls) if url != url_for(public_dir, manifest_path)]
 
-    stable_urls = [
-        "/manifest.webmanifest",
-        "/favicon.ico",
-        "/icons/favicon-192.png",
-        "/icons/logo-512.png",
-        "/icons/apple-touch-icon.png",
-    ]
-    stable_url_patterns = [
-        (
-            re.compile(re.escape(stable_url) + r'(?:\?v=[^"\'<\s]*)?'),
-            f"{stable_url}?v={build_id}",
-        )
-        for stable_url in stable_urls
-    ]
+    versions = {url: content_hash((public_dir / unquote(url.lstrip("/"))).read_bytes()) for url in asset_urls}
 
-    stamped_registers = 0
-    for html_path in public_dir.glob("*.html"):
-        html_text = html_path.read_text(encoding="utf-8")
-        html_text, register_count = register_pattern.subn(register_replacement, html_text)
-        stamped_registers += register_count
-        for pattern, replacement in stable_url_patterns:
-            html_text = pattern.sub(replacement, html_text)
-        html_path.write_text(html_text, encoding="utf-8")
+    results = []
 
-    manifest_path = public_dir / "manifest.webmanifest"
+    # 2. The manifest references icons and is itself referenced by the pages.
     if manifest_path.exists():
-        stamp_file(manifest_path, stable_url_patterns[2:])
+        manifest_stamp = build_stamper(MANIFEST_REF_PREFIX, lambda ref: resolve_ref(public_dir, "/", ref), register=False)
+        manifest_text, counts = manifest_stamp(manifest_text, versions)
+        results.append((manifest_path, counts, write_if_changed(manifest_path, manifest_text, args.dry_run)))
+        versions[url_for(public_dir, manifest_path)] = content_hash(manifest_text.encode("utf-8"))
+
+    # 3. Every page (nested redirect pages included) gets per-file versions.
+    def stamp_page(page):
+        page_url = url_for(public_dir, page)
+        stamp = build_stamper(PAGE_REF_PREFIX, lambda ref: resolve_ref(public_dir, page_url, ref))
+        text, counts = stamp(page.read_text(encoding="utf-8"), versions)
+        return page, counts, write_if_changed(page, text, args.dry_run), text
 
+    page_versions = {}
+    pending = {}
+    for page, counts, changed, text in map(stamp_page, all_pages):
+        results.append((page, counts, changed))
+        if page in shell_pages:
+            page_versions[url_for(public_dir, page)] = content_hash(text.encode("utf-8"))
+        if args.dry_run and changed:
+            pending[page] = text
+    if args.dry_run and manifest_path.exists():
+        pending[manifest_path] = manifest_text
+
+    stamped_registers = sum(counts.get("register", 0) for _path, counts, _changed in results)
     if stamped_registers == 0:
         raise SystemExit("No service worker registrations were stamped")
 
-    print(f"Stamped frontend build id: {build_id}")
+    # 4. sw.js precaches pages (and their routes) plus every asset; legacy paths are never served from cache.
+    assets = {}
+    for page_url, version in page_versions.items():
+        for route in page_routes(page_url):
+            assets[route] = version
+    for url, version in sorted(versions.items()):
+        if url not in legacy:
+            assets[url] = version
+    new_sw_text = generate_sw(sw_text, assets)
+    results.insert(0, (sw_path, {"assets": len(assets)}, write_if_changed(sw_path, new_sw_text, args.dry_run)))
+
+    # 5. Read back what sw.js will precache and weigh it against the budgets.
+    weights, missing, stale = measure_precache(public_dir, new_sw_text, pending)
+
+    budgets = {"total": args.budget, "asset": args.asset_budget}
+    report = precache_report(weights, budgets)
+    if args.report:
+        Path(args.report).write_text(json.dumps(dict(report, missing=missing, stale=stale), indent=1) + "\n", encoding="utf-8")
+
+    elapsed_ms = (time.perf_counter() - started) * 1000.0
+    changed_files = sum(1 for _path, _counts, changed in results if changed)
+    if args.dry_run:
+        for path, counts, changed in results:
+            summary = ", ".join(f"{key}={count}" for key, count in sorted(counts.items())) or "no matches"
+            state = "would change" if changed else "unchanged"
+            print(f"{path}: {summary} ({state})")
+        print(f"{len(assets)} precached URLs, {len(results)} files, {changed_files} would change, {elapsed_ms:.1f} ms")
+    else:
+        print(f"Stamped {len(assets)} precached URLs ({changed_files}/{len(results)} files changed, {elapsed_ms:.1f} ms)")
+    print_precache_report(report, None if args.list_assets else 10)
+
+    errors = [f"APP_SHELL_ASSETS entry has no file: {url}" for url in missing]
+    errors += [f"APP_SHELL_ASSETS hash does not match file: {url}" for url in stale]
+    errors += [f"Over budget: {line}" for line in report["overBudget"]]
+    if errors:
+        raise SystemExit("\n".join(errors))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,464 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+UartDebug: offline decoder for saved UART logs and raw captures
+
+Replays what the RXD oscilloscope view does (1 byte / 2 byte BE/LE, signed/unsigned)
+on captures that are too large for a browser tab, in bounded memory.
+
+Inputs (--format, default auto):
+  ascii - "Save log" text export of an ASCII terminal; visible \\r / \\n are turned back into bytes
+  hex   - "Save log" text export of a HEX terminal ("0A 1B 2C ...")
+  raw   - binary capture (e.g. `cat /dev/ttyUSB0 > capture.bin`), memory-mapped
+
+  Text exports may start with the "=== UART RxD Log ===" header (Baud Rate is picked up)
+  and may have "[HH:MM:SS.mmm] " line timestamps ("Show time").
+
+Output:
+  - summary: bytes, samples, min/max/mean/stddev, time span and throughput when timestamped
+  - min/max envelope of --points to 2x --points buckets (what a zoomed-out plot needs), as JSON and/or CSV
+
+NumPy is used for decoding and bucket reduction when installed; without it the same
+results come from the array module, only slower.
+
+Usage:
+  python ud_log_decode.py uart_rx_log_1753000000000.txt --mode 2LE --signed
+  python ud_log_decode.py capture.bin --format raw --mode 2BE --json envelope.json --csv envelope.csv
+  python ud_log_decode.py capture.bin --format raw --mode 1 --points 4000 --json -
+"""
+
+from __future__ import annotations
+
+import argparse
+import array
+import io
+import json
+import math
+import mmap
+import operator
+import os
+import re
+import sys
+import time
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, List, Optional, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # optional: pure-python fallback below
+    np = None
+
+
+MODES = ("1", "2BE", "2LE")
+CHUNK_BYTES = 1 << 22  # decode batch; even, so 2-byte samples never straddle raw chunks
+ALIGN_PROBE_BYTES = 16  # OSCILLOSCOPE_ALIGN_PROBE_BYTES in uart.js
+ALIGN_MIN_BYTES = 8
+
+LOG_HEADER_RE = re.compile(r"^=== UART (\S+) Log ===$")
+BAUD_RE = re.compile(r"^Baud Rate:\s*(\d+)")
+TIMESTAMP_RE = re.compile(r"^\[(\d{2}):(\d{2}):(\d{2})\.(\d{3})\] ", re.M)
+HEX_LINE_RE = re.compile(r"^(?:[0-9A-Fa-f]{2})(?: [0-9A-Fa-f]{2})*$")
+
+
+# =========================
+# Sample decoding (oscilloscope modes)
+# =========================
+
+def _typecode(mode: str, signed: bool) -> str:
+    if mode == "1":
+        return "b" if signed else "B"
+    return "h" if signed else "H"
+
+
+def decode_samples(buf, mode: str, signed: bool):
+    """Bytes -> samples like updateOscilloscopeData(); len(buf) must be a multiple of the sample size."""
+    if np is not None:
+        if mode == "1":
+            return np.frombuffer(buf, dtype=np.int8 if signed else np.uint8)
+        order = ">" if mode == "2BE" else "<"
+        return np.frombuffer(buf, dtype=f"{order}{'i2' if signed else 'u2'}")
+    values = array.array(_typecode(mode, signed))
+    values.frombytes(bytes(buf))
+    if mode != "1" and (mode == "2BE") != (sys.byteorder == "big"):
+        values.byteswap()
+    return values
+
+
+def alignment_offset(probe: bytes, mode: str) -> int:
+    """0 or 1: which byte starts a pair, like resolveOscilloscopeAutoAlignment() (smoother wins)."""
+    def score(start: int) -> float:
+        values = [
+            (probe[i + 1] << 8 | probe[i]) if mode == "2LE" else (probe[i] << 8 | probe[i + 1])
+            for i in range(start, len(probe) - 1, 2)
+        ]
+        steps = [abs(b - a) for a, b in zip(values, values[1:])]
+        return sum(steps) / len(steps) if steps else math.inf
+
+    return 1 if score(1) < score(0) else 0
+
+
+# =========================
+# Streaming statistics and min/max envelope
+# =========================
+
+@dataclass
+class Envelope:
+    """Min/max per bucket of `bucket` samples; buckets are merged pairwise (bucket doubles) to stay <= 2*points."""
+
+    points: int
+    bucket: int = 1
+    mins: List[int] = field(default_factory=list)
+    maxs: List[int] = field(default_factory=list)
+    part_n: int = 0
+    part_min: float = math.inf
+    part_max: float = -math.inf
+    # running stats: exact integer sums, so mean/stddev do not drift over billions of samples
+    count: int = 0
+    total: int = 0
+    squares: int = 0
+    vmin: float = math.inf
+    vmax: float = -math.inf
+
+    def add(self, values) -> None:
+        n = len(values)
+        if n == 0:
+            return
+        self._add_stats(values)
+        pos = 0
+        while True:
+            if self.part_n:
+                take = min(self.bucket - self.part_n, n - pos)
+                lo, hi = _minmax(values[pos:pos + take])
+                self.part_min, self.part_max = min(self.part_min, lo), max(self.part_max, hi)
+                self.part_n += take
+                pos += take
+                if self.part_n == self.bucket:
+                    self._close_partial()
+            # Grow the bucket before reducing, so a long chunk never makes more than 2*points buckets.
+            if len(self.mins) + (n - pos) // self.bucket <= 2 * self.points:
+                break
+            self._halve()
+        full = (n - pos) // self.bucket
+        if full:
+            mins, maxs = _bucket_minmax(values[pos:pos + full * self.bucket], self.bucket)
+            self.mins.extend(mins)
+            self.maxs.extend(maxs)
+            pos += full * self.bucket
+        if pos < n:
+            self.part_min, self.part_max = _minmax(values[pos:])
+            self.part_n = n - pos
+
+    def _add_stats(self, values) -> None:
+        if np is not None:
+            wide = values.astype(np.int64)
+            total, squares = int(wide.sum()), int((wide * wide).sum())
+        else:
+            total, squares = sum(values), sum(map(operator.mul, values, values))
+        lo, hi = _minmax(values)
+        self.count += len(values)
+        self.total += total
+        self.squares += squares
+        self.vmin, self.vmax = min(self.vmin, lo), max(self.vmax, hi)
+
+    def _close_partial(self) -> None:
+        self.mins.append(self.part_min)
+        self.maxs.append(self.part_max)
+        self.part_n, self.part_min, self.part_max = 0, math.inf, -math.inf
+
+    def _halve(self) -> None:
+        if len(self.mins) % 2:
+            # The odd last bucket joins the partial one; together they are < the doubled bucket.
+            self.part_min = min(self.part_min, self.mins.pop())
+            self.part_max = max(self.part_max, self.maxs.pop())
+            self.part_n += self.bucket
+        self.mins = [min(a, b) for a, b in zip(self.mins[0::2], self.mins[1::2])]
+        self.maxs = [max(a, b) for a, b in zip(self.maxs[0::2], self.maxs[1::2])]
+        self.bucket *= 2
+
+    def finish(self) -> Dict[str, object]:
+        if self.part_n:
+            self._close_partial()
+        return {"bucket": self.bucket, "min": [int(v) for v in self.mins], "max": [int(v) for v in self.maxs]}
+
+    def stats(self) -> Dict[str, object]:
+        if not self.count:
+            return {"samples": 0}
+        return {
+            "samples": self.count,
+            "min": int(self.vmin),
+            "max": int(self.vmax),
+            "mean": round(self.total / self.count, 6),
+            "stddev": round(math.sqrt((self.count * self.squares - self.total * self.total) / self.count ** 2), 6),
+        }
+
+
+def _minmax(values) -> Tuple[int, int]:
+    if np is not None:
+        return int(values.min()), int(values.max())
+    return min(values), max(values)
+
+
+def _bucket_minmax(values, bucket: int) -> Tuple[List[int], List[int]]:
+    if np is not None:
+        blocks = values.reshape(-1, bucket)
+        return blocks.min(axis=1).tolist(), blocks.max(axis=1).tolist()
+    starts = range(0, len(values), bucket)
+    return [min(values[i:i + bucket]) for i in starts], [max(values[i:i + bucket]) for i in starts]
+
+
+# =========================
+# Sources: raw capture (mmap) and text exports (streaming)
+# =========================
+
+@dataclass
+class LogInfo:
+    format: str
+    label: Optional[str] = None
+    baud: Optional[int] = None
+    lines: int = 0
+    timestamps: int = 0
+    first_ms: Optional[int] = None
+    last_ms: Optional[int] = None
+    _prev_ms: Optional[int] = None
+    _day_ms: int = 0
+
+    def see_timestamp(self, hh: str, mm: str, ss: str, ms: str) -> None:
+        t = ((int(hh) * 60 + int(mm)) * 60 + int(ss)) * 1000 + int(ms)
+        if self._prev_ms is not None and t + self._day_ms < self._prev_ms - 12 * 3600 * 1000:
+            self._day_ms += 24 * 3600 * 1000  # crossed midnight
+        t += self._day_ms
+        self._prev_ms = t
+        if self.first_ms is None:
+            self.first_ms = t
+        self.last_ms = t
+        self.timestamps += 1
+
+
+def raw_chunks(path: str, chunk_bytes: int = CHUNK_BYTES) -> Iterator[memoryview]:
+    """Zero-copy slices of a memory-mapped capture."""
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            view = memoryview(mm)
+            try:
+                for start in range(0, len(mm), chunk_bytes):
+                    yield view[start:start + chunk_bytes]
+            finally:
+                view.release()
+
+
+def _read_header(f: io.TextIOBase, info: LogInfo) -> List[str]:
+    """Consume the "=== UART ... Log ===" header; returns lines read past it that hold data."""
+    first = f.readline()
+    match = LOG_HEADER_RE.match(first.rstrip("\n"))
+    if not match:
+        return [first] if first else []
+    info.label = match.group(1)
+    for line in f:
+        if not line.strip():
+            break
+        baud = BAUD_RE.match(line)
+        if baud:
+            info.baud = int(baud.group(1))
+    return []
+
+
+def _detect_text_format(lines: List[str]) -> str:
+    data = [TIMESTAMP_RE.sub("", line.rstrip("\n"), count=1) for line in lines]
+    data = [line for line in data if line]
+    return "hex" if data and all(HEX_LINE_RE.match(line) for line in data) else "ascii"
+
+
+def _ascii_bytes(block: str) -> bytes:
+    # addToTerminal() writes each CR/LF as a visible "\r"/"\n" followed by the real
+    # character, and lines are joined with "\n": drop the real ones, unescape the visible ones.
+    text = block.replace("\r", "").replace("\n", "")
+    return text.replace("\\r", "\r").replace("\\n", "\n").encode("utf-8")
+
+
+def text_chunks(path: str, fmt: str, info: LogInfo, chunk_bytes: int = CHUNK_BYTES) -> Iterator[bytes]:
+    """Stream a "Save log" export as bytes, block by block (no per-line Python loop over data)."""
+    with open(path, "r", encoding="utf-8", errors="replace", newline="") as f:
+        pending = _read_header(f, info)
+        if fmt == "auto":
+            probe = pending + [f.readline() for _ in range(32)]
+            probe = [line for line in probe if line]
+            fmt = _detect_text_format(probe)
+            pending = probe
+        info.format = fmt
+        carry = "".join(pending)
+        while True:
+            read = f.read(chunk_bytes)
+            block = carry + read
+            if not block:
+                break
+            cut = block.rfind("\n") + 1 if read else len(block)
+            if cut == 0:
+                carry = block  # one line longer than a block: keep reading
+                continue
+            block, carry = block[:cut], block[cut:]
+            info.lines += block.count("\n") + (not block.endswith("\n"))
+            for match in TIMESTAMP_RE.finditer(block):
+                info.see_timestamp(*match.groups())
+            block = TIMESTAMP_RE.sub("", block)
+            yield bytes.fromhex(block) if fmt == "hex" else _ascii_bytes(block)
+
+
+# =========================
+# Decoder
+# =========================
+
+def decode_file(
+    path: str,
+    fmt: str = "auto",
+    mode: str = "1",
+    signed: bool = False,
+    align: str = "auto",
+    points: int = 2000,
+    chunk_bytes: int = CHUNK_BYTES,
+) -> Dict[str, object]:
+    if mode not in MODES:
+        raise ValueError(f"mode must be one of {', '.join(MODES)}")
+    if fmt == "auto" and path.lower().endswith((".bin", ".raw", ".cap")):
+        fmt = "raw"
+    info = LogInfo(format=fmt)
+    size = 1 if mode == "1" else 2
+    chunks = raw_chunks(path, chunk_bytes) if fmt == "raw" else text_chunks(path, fmt, info, chunk_bytes)
+
+    t0 = time.perf_counter()
+    bucket = 1
+    if fmt == "raw":
+        bucket = max(1, os.path.getsize(path) // size // points)
+    env = Envelope(points=points, bucket=bucket)
+    total_bytes = 0
+    skipped = 0
+    carry = b""
+    offset = None if (size == 2 and align == "auto") else (int(align) if size == 2 else 0)
+    for chunk in chunks:
+        total_bytes += len(chunk)
+        if offset is None:
+            # auto-align probes the first ALIGN_PROBE_BYTES bytes (the scope's probe of a full first
+            # packet), whatever the chunk size
+            carry += bytes(chunk)
+            if len(carry) < ALIGN_PROBE_BYTES:
+                del chunk  # the map closes when the source is exhausted: no view may outlive this iteration
+                continue
+            offset = alignment_offset(carry[:ALIGN_PROBE_BYTES], mode)
+            chunk = carry
+            carry = b""
+        if offset:
+            take = min(offset, len(chunk))
+            chunk, offset, skipped = chunk[take:], offset - take, skipped + take
+        if carry:
+            chunk = carry + bytes(chunk)
+            carry = b""
+        usable = len(chunk) - len(chunk) % size
+        if usable < len(chunk):
+            carry = bytes(chunk[usable:])
+        if usable:
+            env.add(decode_samples(chunk[:usable], mode, signed))
+        del chunk  # release mmap views before the map closes
+    if offset is None and carry:
+        # shorter than the probe: align on what there is, or decode as-is below ALIGN_MIN_BYTES like the scope
+        offset = alignment_offset(carry, mode) if len(carry) >= ALIGN_MIN_BYTES else 0
+        carry, skipped = carry[offset:], skipped + offset
+        usable = len(carry) - len(carry) % size
+        env.add(decode_samples(carry[:usable], mode, signed))
+        carry = carry[usable:]
+    elapsed = time.perf_counter() - t0
+
+    result: Dict[str, object] = {
+        "source": path,
+        "format": info.format,
+        "mode": mode,
+        "signed": signed,
+        "numpy": np is not None,
+        "bytes": total_bytes,
+        "skipped_bytes": skipped,
+        "dangling_bytes": len(carry),
+        "stats": env.stats(),
+        "elapsed_s": round(elapsed, 6),
+        "mb_per_s": round(total_bytes / elapsed / 1e6, 1) if elapsed > 0 else None,
+    }
+    if fmt != "raw":
+        result["log"] = {"label": info.label, "baud": info.baud, "lines": info.lines, "timestamps": info.timestamps}
+        if info.timestamps:
+            span_s = (info.last_ms - info.first_ms) / 1000.0
+            timing = {"first_ms": info.first_ms, "last_ms": info.last_ms, "span_s": span_s}
+            if span_s > 0:
+                timing["bytes_per_s"] = round(total_bytes / span_s, 1)
+                if info.baud:
+                    # 8N1: 10 bit times per byte
+                    timing["line_utilization"] = round(total_bytes * 10 / span_s / info.baud, 4)
+            result["timing"] = timing
+    result["envelope"] = env.finish()
+    return result
+
+
+def write_csv(path: str, envelope: Dict[str, object]) -> None:
+    out = sys.stdout if path == "-" else open(path, "w", encoding="utf-8", newline="\n")
+    try:
+        out.write("first_sample,min,max\n")
+        bucket = envelope["bucket"]
+        for i, (lo, hi) in enumerate(zip(envelope["min"], envelope["max"])):
+            out.write(f"{i * bucket},{lo},{hi}\n")
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+
+def _print_summary(result: Dict[str, object], out) -> None:
+    stats = result["stats"]
+    line = f"{result['source']}: {result['format']}, {result['bytes']} bytes -> {stats['samples']} samples ({result['mode']}, {'signed' if result['signed'] else 'unsigned'})"
+    print(line, file=out)
+    if stats["samples"]:
+        print(f"  min {stats['min']}  max {stats['max']}  mean {stats['mean']}  stddev {stats['stddev']}", file=out)
+    if result["skipped_bytes"] or result["dangling_bytes"]:
+        print(f"  alignment skipped {result['skipped_bytes']} byte(s), {result['dangling_bytes']} dangling byte(s) at the end", file=out)
+    timing = result.get("timing")
+    if timing:
+        rate = f", {timing['bytes_per_s']} B/s" if "bytes_per_s" in timing else ""
+        util = f" ({timing['line_utilization'] * 100:.1f}% of {result['log']['baud']} baud)" if "line_utilization" in timing else ""
+        print(f"  span {timing['span_s']:.3f} s{rate}{util}", file=out)
+    env = result["envelope"]
+    print(f"  envelope: {len(env['min'])} buckets of {env['bucket']} samples", file=out)
+    print(f"  decoded in {result['elapsed_s']:.3f} s ({result['mb_per_s']} MB/s, {'numpy' if result['numpy'] else 'no numpy'})", file=out)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="Decode saved UART logs / raw captures like the RXD oscilloscope view")
+    ap.add_argument("input", help="Saved log (.txt) or raw binary capture")
+    ap.add_argument("--format", choices=("auto", "ascii", "hex", "raw"), default="auto", help="Input format (default: auto; .bin/.raw/.cap are raw)")
+    ap.add_argument("--mode", choices=MODES, default="1", help="Sample size/endianness: 1, 2BE, 2LE (default: 1)")
+    ap.add_argument("--signed", action="store_true", help="Signed samples (default: unsigned)")
+    ap.add_argument("--align", choices=("auto", "0", "1"), default="auto", help="2-byte modes: bytes to skip before the first pair (default: auto, as the scope)")
+    ap.add_argument("--points", type=int, default=2000, help="Keep the envelope between POINTS and 2*POINTS buckets (default: 2000)")
+    ap.add_argument("--json", default=None, metavar="PATH", help="Write summary + envelope as JSON ('-' = stdout)")
+    ap.add_argument("--csv", default=None, metavar="PATH", help="Write the envelope as CSV ('-' = stdout)")
+    args = ap.parse_args(argv)
+
+    if args.points < 1:
+        ap.error("--points must be >= 1")
+    try:
+        result = decode_file(args.input, fmt=args.format, mode=args.mode, signed=args.signed, align=args.align, points=args.points)
+    except (OSError, ValueError) as e:
+        print(f"ERROR: {e}", file=sys.stderr)
+        return 1
+
+    to_stdout = "-" in (args.json, args.csv)
+    _print_summary(result, sys.stderr if to_stdout else sys.stdout)
+    if args.json:
+        text = json.dumps(result, indent=1) + "\n"
+        if args.json == "-":
+            sys.stdout.write(text)
+        else:
+            with open(args.json, "w", encoding="utf-8") as f:
+                f.write(text)
+    if args.csv:
+        write_csv(args.csv, result["envelope"])
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
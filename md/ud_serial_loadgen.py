@@ -0,0 +1,407 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+UartDebug: virtual serial port load generator (Linux/macOS pty)
+
+Creates a pseudo-terminal pair and streams synthetic UART traffic into it at a fixed
+rate, so the terminal / plotting path can be load-tested without a USB adapter.
+
+Patterns:
+  text - numbered text lines ("00000042 ...\\r\\n"), what ASCII view + Show time sees
+  hex  - pseudo-random binary bursts, what HEX view sees
+  wave - sine/saw/triangle/square samples encoded like the oscilloscope modes (1, 2BE, 2LE; signed/unsigned)
+
+Pacing models a UART: --baud / 10 bytes per second (8N1), or --rate bytes per second.
+A real UART does not wait for the reader, so bytes the pty cannot take (buffer full)
+are dropped and counted, not queued.
+
+Readers:
+  default     - a reference reader in this process drains the slave side and measures
+                throughput, dropped bytes, integrity (CRC32) and write -> read latency
+  --external  - no reader: print the slave path (and --link it) for another program to open
+
+Usage:
+  python ud_serial_loadgen.py --baud 921600 --pattern text --duration 10
+  python ud_serial_loadgen.py --rate 2000000 --pattern wave --mode 2LE --signed --json loadgen.json
+  python ud_serial_loadgen.py --external --link /tmp/ttyUD0 --pattern hex --echo --record sent.ndjson
+"""
+
+from __future__ import annotations
+
+import argparse
+import collections
+import errno
+import json
+import math
+import os
+import random
+import select
+import signal
+import statistics
+import sys
+import termios
+import threading
+import time
+import tty
+import zlib
+from typing import Deque, Dict, List, Optional, Tuple
+
+MODES = ("1", "2BE", "2LE")
+SHAPES = ("sine", "saw", "triangle", "square")
+MAX_WRITE = 1 << 16
+DRAIN_IDLE_S = 0.25
+
+
+# =========================
+# Traffic patterns
+# =========================
+
+class Pattern:
+    """Endless byte stream; take(n) returns the next n bytes."""
+
+    def __init__(self) -> None:
+        self._buf = bytearray()
+
+    def _refill(self, need: int) -> None:
+        raise NotImplementedError
+
+    def take(self, n: int) -> bytes:
+        if len(self._buf) < n:
+            self._refill(n - len(self._buf))
+        out = bytes(self._buf[:n])
+        del self._buf[:n]
+        return out
+
+
+class TextPattern(Pattern):
+    def __init__(self, line: str) -> None:
+        super().__init__()
+        self.line = line
+        self.seq = 0
+
+    def _refill(self, need: int) -> None:
+        while need > 0:
+            chunk = "".join(f"{self.seq + k:08d} {self.line}\r\n" for k in range(64)).encode("ascii")
+            self.seq += 64
+            self._buf += chunk
+            need -= len(chunk)
+
+
+class HexPattern(Pattern):
+    def __init__(self, burst: int, seed: int) -> None:
+        super().__init__()
+        self.burst = burst
+        self.rng = random.Random(seed)
+
+    def _refill(self, need: int) -> None:
+        bursts = max(1, -(-need // self.burst))
+        self._buf += self.rng.getrandbits(8 * self.burst * bursts).to_bytes(self.burst * bursts, "little")
+
+
+class WavePattern(Pattern):
+    """One period is encoded once, then repeated (cheap at any rate)."""
+
+    def __init__(self, shape: str, period: int, mode: str, signed: bool) -> None:
+        super().__init__()
+        self.period_bytes = encode_wave(shape, period, mode, signed)
+
+    def _refill(self, need: int) -> None:
+        repeats = -(-need // len(self.period_bytes))
+        self._buf += self.period_bytes * repeats
+
+
+def encode_wave(shape: str, period: int, mode: str, signed: bool) -> bytes:
+    """One period of samples, full scale for the mode, in oscilloscope byte order."""
+    bits = 8 if mode == "1" else 16
+    lo, hi = (-(1 << (bits - 1)), (1 << (bits - 1)) - 1) if signed else (0, (1 << bits) - 1)
+    mid, amp = (lo + hi) / 2.0, (hi - lo) / 2.0
+    out = bytearray()
+    for i in range(period):
+        phase = i / period
+        if shape == "sine":
+            unit = math.sin(2 * math.pi * phase)
+        elif shape == "saw":
+            unit = 2 * phase - 1
+        elif shape == "triangle":
+            unit = 1 - 4 * abs(phase - 0.5)
+        else:
+            unit = 1.0 if phase < 0.5 else -1.0
+        value = max(lo, min(hi, int(round(mid + amp * unit)))) & ((1 << bits) - 1)
+        if mode == "1":
+            out.append(value)
+        else:
+            out += value.to_bytes(2, "big" if mode == "2BE" else "little")
+    return bytes(out)
+
+
+def make_pattern(args: argparse.Namespace) -> Pattern:
+    if args.pattern == "text":
+        return TextPattern(args.line)
+    if args.pattern == "hex":
+        return HexPattern(args.burst, args.seed)
+    return WavePattern(args.shape, args.period, args.mode, args.signed)
+
+
+# =========================
+# pty pair
+# =========================
+
+def open_pty(baud: Optional[int]) -> Tuple[int, int, str]:
+    """(master, slave, slave path); slave in raw mode so bytes pass through untouched."""
+    master, slave = os.openpty()
+    tty.setraw(slave)
+    attrs = termios.tcgetattr(slave)
+    speed = getattr(termios, f"B{baud}", None) if baud else None
+    if speed is not None:
+        # cosmetic for programs that query the line speed; a pty has no real baud rate
+        attrs[4] = attrs[5] = speed
+        termios.tcsetattr(slave, termios.TCSANOW, attrs)
+    os.set_blocking(master, False)
+    return master, slave, os.ttyname(slave)
+
+
+# =========================
+# Reference reader
+# =========================
+
+class ReferenceReader(threading.Thread):
+    """Drains the slave side; latency = read time - write time of the last byte of each write."""
+
+    def __init__(self, fd: int, writes: Deque[Tuple[int, float]], lock: threading.Lock) -> None:
+        super().__init__(daemon=True)
+        self.fd = fd
+        self.writes = writes
+        self.lock = lock
+        self.received = 0
+        self.crc = 0
+        self.latencies: List[float] = []
+        self.last_read = time.perf_counter()
+        self.stop = threading.Event()
+
+    def run(self) -> None:
+        poller = select.poll()
+        poller.register(self.fd, select.POLLIN)
+        while not self.stop.is_set():
+            if not poller.poll(20):
+                continue
+            try:
+                data = os.read(self.fd, MAX_WRITE)
+            except OSError as e:
+                if e.errno in (errno.EAGAIN, errno.EINTR):
+                    continue
+                raise
+            now = time.perf_counter()
+            self.crc = zlib.crc32(data, self.crc)
+            with self.lock:
+                self.received += len(data)
+                self.last_read = now
+                while self.writes and self.writes[0][0] <= self.received:
+                    self.latencies.append(now - self.writes.popleft()[1])
+
+
+# =========================
+# Generator loop
+# =========================
+
+def run_load(args: argparse.Namespace, master: int, reader: Optional[ReferenceReader],
+             writes: Deque[Tuple[int, float]], lock: threading.Lock, stop: threading.Event) -> Dict[str, object]:
+    pattern = make_pattern(args)
+    rate = float(args.rate) if args.rate else args.baud / 10.0
+    tick = args.tick / 1000.0
+    record = open(args.record, "w", encoding="utf-8") if args.record else None
+
+    generated = written = dropped = echoed = 0
+    crc = 0
+    start = time.perf_counter()
+    next_report = start + args.report_every if args.report_every else math.inf
+    try:
+        while not stop.is_set():
+            now = time.perf_counter()
+            elapsed = now - start
+            if args.duration and elapsed >= args.duration:
+                break
+            if args.bytes and generated >= args.bytes:
+                break
+
+            if args.echo:
+                try:
+                    tx = os.read(master, MAX_WRITE)
+                except (BlockingIOError, OSError):
+                    tx = b""
+                if tx:
+                    n = _write(master, tx)
+                    echoed += n
+                    written += n
+                    crc = zlib.crc32(tx[:n], crc)
+                    if record:
+                        record.write(json.dumps({"t": round(elapsed, 6), "echo": n, "offset": written - n}) + "\n")
+
+            budget = int(rate * elapsed) - generated
+            if args.bytes:
+                budget = min(budget, args.bytes - generated)
+            if budget <= 0:
+                time.sleep(tick)
+                continue
+            data = pattern.take(min(budget, MAX_WRITE))
+            t_write = time.perf_counter()
+            n = _write(master, data)
+            generated += len(data)
+            dropped += len(data) - n
+            if n:
+                crc = zlib.crc32(data[:n], crc)
+                written += n
+                with lock:
+                    if reader is not None and reader.received >= written:
+                        # read back before this thread got the lock again
+                        reader.latencies.append(reader.last_read - t_write)
+                    elif reader is not None:
+                        writes.append((written, t_write))
+            if record:
+                record.write(json.dumps({"t": round(t_write - start, 6), "offset": written - n, "bytes": n, "dropped": len(data) - n}) + "\n")
+            if now >= next_report:
+                _progress(elapsed, written, dropped, reader)
+                next_report += args.report_every
+    finally:
+        if record:
+            record.close()
+    send_s = time.perf_counter() - start
+
+    if reader is not None:
+        # let the reader catch up with what is still in the pty buffer
+        while reader.received < written and time.perf_counter() - reader.last_read < DRAIN_IDLE_S:
+            time.sleep(0.01)
+        reader.stop.set()
+        reader.join()
+
+    result: Dict[str, object] = {
+        "pattern": args.pattern,
+        "target_bytes_per_s": rate,
+        "target_baud": rate * 10,
+        "seconds": round(send_s, 3),
+        "generated": generated,
+        "written": written,
+        "echoed": echoed,
+        "dropped_at_source": dropped,
+        "achieved_bytes_per_s": round(written / send_s, 1) if send_s > 0 else 0.0,
+    }
+    if reader is not None:
+        lat = sorted(reader.latencies)
+        result.update({
+            "received": reader.received,
+            "lost_in_transit": written - reader.received,
+            "integrity": "ok" if reader.received == written and reader.crc == crc else "mismatch",
+            "received_bytes_per_s": round(reader.received / send_s, 1) if send_s > 0 else 0.0,
+        })
+        if lat:
+            result["latency_ms"] = {
+                "n": len(lat),
+                "p50": round(statistics.median(lat) * 1000, 3),
+                "p95": round(lat[min(len(lat) - 1, int(len(lat) * 0.95))] * 1000, 3),
+                "p99": round(lat[min(len(lat) - 1, int(len(lat) * 0.99))] * 1000, 3),
+                "max": round(lat[-1] * 1000, 3),
+            }
+    return result
+
+
+def _write(fd: int, data: bytes) -> int:
+    """Bytes the pty accepted; the rest is what an overrun UART would have lost."""
+    try:
+        return os.write(fd, data)
+    except BlockingIOError:
+        return 0
+    except OSError as e:
+        if e.errno == errno.EIO:  # no reader has the slave open (macOS)
+            return 0
+        raise
+
+
+def _progress(elapsed: float, written: int, dropped: int, reader: Optional[ReferenceReader]) -> None:
+    line = f"[{elapsed:7.1f}s] written {written} B ({written / elapsed:.0f} B/s), dropped {dropped} B"
+    if reader is not None:
+        line += f", received {reader.received} B"
+    print(line, file=sys.stderr)
+
+
+def _print_result(result: Dict[str, object], out) -> None:
+    print(
+        f"{result['pattern']}: {result['written']} B in {result['seconds']} s = {result['achieved_bytes_per_s']} B/s "
+        f"(target {result['target_bytes_per_s']:.0f} B/s, {result['target_baud']:.0f} baud 8N1)",
+        file=out,
+    )
+    print(f"  dropped at source (pty full): {result['dropped_at_source']} B, echoed: {result['echoed']} B", file=out)
+    if "received" in result:
+        print(
+            f"  reference reader: {result['received']} B ({result['received_bytes_per_s']} B/s), "
+            f"lost in transit {result['lost_in_transit']} B, integrity {result['integrity']}",
+            file=out,
+        )
+    lat = result.get("latency_ms")
+    if lat:
+        print(f"  latency ms: p50 {lat['p50']}  p95 {lat['p95']}  p99 {lat['p99']}  max {lat['max']}  (n={lat['n']})", file=out)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="Stream synthetic UART traffic through a pty pair and measure throughput/latency")
+    ap.add_argument("--baud", type=int, default=921600, help="Line rate, 8N1 = baud/10 bytes/s (default: 921600)")
+    ap.add_argument("--rate", type=int, default=None, help="Bytes per second, overrides --baud (e.g. beyond the terminal's 921600 baud)")
+    ap.add_argument("--pattern", choices=("text", "hex", "wave"), default="text", help="Traffic pattern (default: text)")
+    ap.add_argument("--line", default="The quick brown fox jumps over the lazy dog", help="text: line body after the sequence number")
+    ap.add_argument("--burst", type=int, default=16, help="hex: bytes per burst (default: 16)")
+    ap.add_argument("--seed", type=int, default=1, help="hex: random seed (default: 1)")
+    ap.add_argument("--mode", choices=MODES, default="1", help="wave: sample encoding like the oscilloscope: 1, 2BE, 2LE (default: 1)")
+    ap.add_argument("--signed", action="store_true", help="wave: signed samples (default: unsigned)")
+    ap.add_argument("--shape", choices=SHAPES, default="sine", help="wave: waveform (default: sine)")
+    ap.add_argument("--period", type=int, default=200, help="wave: samples per period (default: 200)")
+    ap.add_argument("--duration", type=float, default=None, help="Stop after this many seconds (default: 10, or run until Ctrl-C with --external)")
+    ap.add_argument("--bytes", type=int, default=None, help="Stop after generating this many bytes")
+    ap.add_argument("--tick", type=float, default=1.0, help="Pacing granularity in ms (default: 1)")
+    ap.add_argument("--external", action="store_true", help="No reference reader: leave the slave side for another program")
+    ap.add_argument("--link", default=None, help="Create a symlink to the slave device at this path (e.g. /tmp/ttyUD0)")
+    ap.add_argument("--echo", action="store_true", help="Echo bytes written to the port (TX) back into the stream")
+    ap.add_argument("--record", default=None, metavar="NDJSON", help="Record time, stream offset and size of every write")
+    ap.add_argument("--report-every", type=float, default=0.0, help="Print progress every N seconds to stderr")
+    ap.add_argument("--json", default=None, metavar="PATH", help="Write the result as JSON ('-' = stdout)")
+    args = ap.parse_args(argv)
+
+    if args.duration is None and args.bytes is None and not args.external:
+        args.duration = 10.0
+    if (args.rate is not None and args.rate <= 0) or args.baud <= 0 or args.burst <= 0 or args.period <= 0:
+        ap.error("--rate/--baud/--burst/--period must be positive")
+
+    master, slave, slave_path = open_pty(None if args.rate else args.baud)
+    if args.link:
+        if os.path.islink(args.link):
+            os.unlink(args.link)
+        os.symlink(slave_path, args.link)
+    print(f"pty slave: {args.link or slave_path}" + (f" -> {slave_path}" if args.link else ""), file=sys.stderr)
+
+    stop = threading.Event()
+    signal.signal(signal.SIGINT, lambda *_: stop.set())
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    writes: Deque[Tuple[int, float]] = collections.deque()
+    lock = threading.Lock()
+    reader = None if args.external else ReferenceReader(slave, writes, lock)
+    try:
+        if reader is not None:
+            reader.start()
+        result = run_load(args, master, reader, writes, lock, stop)
+    finally:
+        if args.link and os.path.islink(args.link):
+            os.unlink(args.link)
+        os.close(master)
+        os.close(slave)
+
+    to_stdout = args.json == "-"
+    _print_result(result, sys.stderr if to_stdout else sys.stdout)
+    if args.json:
+        text = json.dumps(result, indent=1) + "\n"
+        if to_stdout:
+            sys.stdout.write(text)
+        else:
+            with open(args.json, "w", encoding="utf-8") as f:
+                f.write(text)
+    return 0 if result.get("integrity", "ok") == "ok" else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
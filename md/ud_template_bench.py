@@ -0,0 +1,385 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+UartDebug: benchmarks for the template -> C filler (ud_template_fill.py)
+
+Subcommands:
+  run     - time each pipeline stage on synthetic workloads, plus the end-to-end CLI (cold start)
+  compare - compare two `run` result files and flag slowdowns beyond a threshold
+  serve   - latency/throughput of the long-lived --serve mode vs. one CLI process per request
+
+Usage:
+  python ud_template_bench.py run --out bench.json [--quick]
+  python ud_template_bench.py compare baseline.json bench.json --threshold 0.15
+  python ud_template_bench.py serve
+  python ud_template_bench.py serve --requests 500 --workers 4 --json serve_bench.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import datetime as _dt
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+FILL = os.path.join(HERE, "ud_template_fill.py")
+
+sys.path.insert(0, HERE)
+import ud_template_fill as udf  # noqa: E402
+
+
+def _read_text(path: str) -> str:
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read()
+
+
+def _summary(lat_ms: List[float], wall_s: float) -> Dict[str, float]:
+    lat = sorted(lat_ms)
+    return {
+        "n": len(lat),
+        "p50_ms": round(statistics.median(lat), 3),
+        "p95_ms": round(lat[min(len(lat) - 1, int(len(lat) * 0.95))], 3),
+        "mean_ms": round(statistics.fmean(lat), 3),
+        "req_per_s": round(len(lat) / wall_s, 1) if wall_s > 0 else 0.0,
+    }
+
+
+# =========================
+# Synthetic workloads
+# =========================
+
+SYNTH_TYPE = "SYNTH"
+
+
+def synth_template(n_params: int, n_values: int = 8, c_lines: int = 1000) -> str:
+    """$S params @P<i> with values P<i>_V<j>, a conditional $S+ block and a $C+ block of c_lines lines."""
+    out = ["$V 1.0.0 Synthetic", f"$N {SYNTH_TYPE}", "$D ATTINY1624", ""]
+    for i in range(n_params):
+        vals = "|".join(f"P{i}_V{j}" for j in range(n_values))
+        out.append(f'$S @P{i} {vals} 0 "Param {i}"')
+    out.append("$S+ @SNIPPET")
+    for j in range(n_values):
+        out.append(f"\t?P0_V{j} PORTA.OUTSET = PIN{j % 8}_bm; // @P1")
+    out.append("\tPORTB.DIRSET = PIN0_bm;")
+    out.append("$S- @SNIPPET")
+    out.append("$P //$I @P0 P0_V0 // first param")
+    out.append("$H #include <xc.h>")
+    out.append("#define SYNTH_RATE 115200")
+    out.append("$C+")
+    out.append("void Synth_Init(void) {")
+    out.append("    @SNIPPET")
+    for k in range(c_lines):
+        out.append(f"    REG{k % 64} = @P{k % max(1, n_params)} + {k}; // @P{(k * 7) % max(1, n_params)}")
+    out.append("}")
+    out.append("$C-")
+    out.append("$I Synth_Init();")
+    return "\n".join(out) + "\n"
+
+
+def synth_project(n_instances: int, n_params: int, n_values: int = 8) -> str:
+    """n_instances instances of the synthetic type, each setting every param by value."""
+    out = ["// synthetic project"]
+    for k in range(n_instances):
+        out.append(f"Inst{k} {SYNTH_TYPE}")
+        for i in range(n_params):
+            out.append(f"    Param {i} - P{i}_V{(i + k) % n_values} // comment")
+    out.append("")
+    out.append('"Hello" -> Inst0')
+    return "\n".join(out) + "\n"
+
+
+def synth_skeleton(n_lines: int) -> str:
+    """C skeleton with all marker blocks and n_lines of user code split around main()."""
+    head = [
+        "//`V+ header", "//`V-", "//`P+ params", "//`P-", "//`D+ defines", "//`D-",
+        "//`H+ includes", "//`H-", "//`C+ functions", "//`C-",
+    ]
+    filler = [f"static int user_{k} = {k}; // user code" for k in range(n_lines // 2)]
+    main = [
+        "int main(void)", "{", "\t//`I+ init", "\t//`I-", "\twhile(1)", "\t{",
+        "\t\t//`C+ loop", "\t\t//`C-", "\t}", "    return 0;", "}",
+    ]
+    tail = [f"void user_fn_{k}(void) {{ }}" for k in range(n_lines - n_lines // 2)]
+    return "\n".join(head + filler + main + tail) + "\n"
+
+
+# =========================
+# run: per-stage and end-to-end timings
+# =========================
+
+def _time_call(fn: Callable[[], object], min_time: float, repeat: int) -> Dict[str, float]:
+    """timeit-style: calibrate a loop count, then take `repeat` samples (seconds per call)."""
+    number = 1
+    while True:
+        t0 = time.perf_counter()
+        for _ in range(number):
+            fn()
+        dt = time.perf_counter() - t0
+        if dt >= min_time or number >= 1 << 20:
+            break
+        number *= 2
+    samples = [dt / number]
+    for _ in range(repeat - 1):
+        t0 = time.perf_counter()
+        for _ in range(number):
+            fn()
+        samples.append((time.perf_counter() - t0) / number)
+    return {"median_s": statistics.median(samples), "min_s": min(samples), "loops": number, "repeat": repeat}
+
+
+def _time_process(cmd: List[str], repeat: int) -> Dict[str, float]:
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL)
+        samples.append(time.perf_counter() - t0)
+    return {"median_s": statistics.median(samples), "min_s": min(samples), "loops": 1, "repeat": repeat}
+
+
+def run_benchmarks(quick: bool = False, progress: Callable[[str], None] = lambda s: None) -> Dict[str, Dict[str, float]]:
+    min_time = 0.02 if quick else 0.2
+    repeat = 3 if quick else 5
+    param_sizes = [10, 100] if quick else [10, 100, 500]
+    instance_sizes = [10, 100] if quick else [10, 100, 500]
+    skeleton_sizes = [1000, 10000] if quick else [1000, 10000, 100000]
+    c_lines = 1000 if quick else 5000
+
+    results: Dict[str, Dict[str, float]] = {}
+
+    def bench(name: str, fn: Callable[[], object]) -> None:
+        progress(name)
+        results[name] = _time_call(fn, min_time, repeat)
+
+    for n in param_sizes:
+        text = synth_template(n, c_lines=c_lines)
+        bench(f"parse_template/params={n},c_lines={c_lines}", lambda: udf.parse_template(text))
+
+    n_params = param_sizes[-1]
+    tpl = udf.parse_template(synth_template(n_params, c_lines=c_lines))
+    for m in instance_sizes:
+        proj = synth_project(m, n_params)
+        last = f"Inst{m - 1}"
+        bench(f"parse_project_params/params={n_params},instances={m}",
+              lambda: udf.parse_project_params(proj, tpl, instance=last))
+
+    sel = udf.parse_project_params(synth_project(1, n_params), tpl)
+    bench(f"render_sections/params={n_params},c_lines={c_lines}", lambda: udf.render_sections(tpl, sel))
+    renderer = udf.Renderer(tpl)
+    bench(f"renderer_cached/params={n_params},c_lines={c_lines}", lambda: renderer.render(sel))
+    sections = udf.render_sections(tpl, sel)
+
+    for k in skeleton_sizes:
+        sk = synth_skeleton(k)
+        bench(f"fill_c_skeleton/lines={k}", lambda: udf.fill_c_skeleton(sk, sections))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        def cli(name: str, tpl_text: str, proj_text: str, c_text: str) -> None:
+            paths = {}
+            for key, txt in (("tpl", tpl_text), ("ud", proj_text), ("c", c_text)):
+                paths[key] = os.path.join(tmp, f"{name}.{key}")
+                with open(paths[key], "w", encoding="utf-8") as f:
+                    f.write(txt)
+            cmd = [sys.executable, FILL, "--template", paths["tpl"], "--project", paths["ud"],
+                   "--c-in", paths["c"], "--c-out", os.path.join(tmp, f"{name}.out.c"), "--no-cache"]
+            progress(f"cli/{name}")
+            results[f"cli/{name}"] = _time_process(cmd, repeat)
+
+        cli("md_example", _read_text(os.path.join(HERE, "usart.tpl")), _read_text(os.path.join(HERE, "project.ud")),
+            _read_text(os.path.join(HERE, "main.c")))
+        cli(f"synthetic_params={n_params},lines={skeleton_sizes[-1]}", synth_template(n_params, c_lines=c_lines),
+            synth_project(instance_sizes[-1], n_params), synth_skeleton(skeleton_sizes[-1]))
+
+    progress("cli/interpreter_startup")
+    results["cli/interpreter_startup"] = _time_process([sys.executable, "-c", "pass"], repeat)
+    return results
+
+
+def cmd_run(args: argparse.Namespace) -> int:
+    def progress(name: str) -> None:
+        print(f"  {name}", file=sys.stderr)
+
+    results = run_benchmarks(quick=args.quick, progress=progress)
+    doc = {
+        "meta": {
+            "created": _dt.datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "quick": args.quick,
+        },
+        "results": results,
+    }
+    for name, r in results.items():
+        print(f"{name:<60} {r['median_s'] * 1000.0:>12.4f} ms")
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(doc, f, indent=2)
+        print(f"results written to {args.out}")
+    return 0
+
+
+def cmd_compare(args: argparse.Namespace) -> int:
+    with open(args.baseline, "r", encoding="utf-8") as f:
+        base = json.load(f)["results"]
+    with open(args.current, "r", encoding="utf-8") as f:
+        cur = json.load(f)["results"]
+
+    slower = 0
+    print(f"{'benchmark':<60} {'base ms':>10} {'cur ms':>10} {'ratio':>7}")
+    for name in sorted(set(base) & set(cur)):
+        b, c = base[name]["median_s"], cur[name]["median_s"]
+        ratio = c / b if b > 0 else float("inf")
+        flag = ""
+        if ratio > 1.0 + args.threshold:
+            flag = "  SLOWER"
+            slower += 1
+        elif ratio < 1.0 - args.threshold:
+            flag = "  faster"
+        print(f"{name:<60} {b * 1000.0:>10.4f} {c * 1000.0:>10.4f} {ratio:>7.2f}{flag}")
+    for name in sorted(set(base) ^ set(cur)):
+        print(f"{name:<60} (only in {'baseline' if name in base else 'current'})")
+
+    if slower:
+        print(f"{slower} benchmark(s) slower than baseline by more than {args.threshold:.0%}")
+        return 1
+    return 0
+
+
+# =========================
+# serve: per-process CLI vs. --serve
+# =========================
+
+def _bench_cli(args: argparse.Namespace, runs: int) -> Dict[str, float]:
+    lat: List[float] = []
+    with tempfile.TemporaryDirectory() as tmp:
+        out = os.path.join(tmp, "out.c")
+        cmd = [sys.executable, FILL, "--template", args.template, "--project", args.project,
+               "--c-in", args.c_in, "--c-out", out]
+        t_all = time.perf_counter()
+        for _ in range(runs):
+            t0 = time.perf_counter()
+            subprocess.run(cmd, check=True)
+            lat.append((time.perf_counter() - t0) * 1000.0)
+        wall = time.perf_counter() - t_all
+    return _summary(lat, wall)
+
+
+def _bench_server(args: argparse.Namespace, requests: int) -> Dict[str, Dict[str, float]]:
+    req = {
+        "template_path": args.template,
+        "project": _read_text(args.project),
+        "skeleton": _read_text(args.c_in),
+    }
+    cmd = [sys.executable, FILL, "--serve"]
+    if args.workers is not None:
+        cmd += ["--workers", str(args.workers)]
+    proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+    assert proc.stdin is not None and proc.stdout is not None
+
+    def line(i: int) -> bytes:
+        return (json.dumps(dict(req, id=i)) + "\n").encode("utf-8")
+
+    try:
+        # warm-up: worker start and first template parse are not part of steady state
+        for i in range(4):
+            proc.stdin.write(line(-1 - i))
+        proc.stdin.flush()
+        for _ in range(4):
+            proc.stdout.readline()
+
+        # sequential: one request in flight
+        lat: List[float] = []
+        t_all = time.perf_counter()
+        for i in range(requests):
+            t0 = time.perf_counter()
+            proc.stdin.write(line(i))
+            proc.stdin.flush()
+            resp = json.loads(proc.stdout.readline())
+            if not resp.get("ok"):
+                raise SystemExit(f"server error: {resp.get('error')}")
+            lat.append((time.perf_counter() - t0) * 1000.0)
+        sequential = _summary(lat, time.perf_counter() - t_all)
+
+        # pipelined: all requests in flight, measures pool throughput
+        sent: Dict[int, float] = {}
+
+        def writer() -> None:
+            for i in range(requests):
+                sent[i] = time.perf_counter()
+                proc.stdin.write(line(i))
+            proc.stdin.flush()
+
+        lat = []
+        t_all = time.perf_counter()
+        th = threading.Thread(target=writer)
+        th.start()
+        for _ in range(requests):
+            resp = json.loads(proc.stdout.readline())
+            lat.append((time.perf_counter() - sent[resp["id"]]) * 1000.0)
+        th.join()
+        pipelined = _summary(lat, time.perf_counter() - t_all)
+    finally:
+        proc.stdin.close()
+        proc.wait()
+
+    return {"server_sequential": sequential, "server_pipelined": pipelined}
+
+
+def cmd_serve(args: argparse.Namespace) -> int:
+    results: Dict[str, Dict[str, float]] = {}
+    results["cli_per_process"] = _bench_cli(args, min(args.requests, args.cli_runs))
+    results.update(_bench_server(args, args.requests))
+
+    print(f"{'mode':<20} {'n':>6} {'p50 ms':>9} {'p95 ms':>9} {'req/s':>10}")
+    for mode, r in results.items():
+        print(f"{mode:<20} {r['n']:>6} {r['p50_ms']:>9.3f} {r['p95_ms']:>9.3f} {r['req_per_s']:>10.1f}")
+    base = results["cli_per_process"]["req_per_s"]
+    if base:
+        print(f"throughput vs CLI: sequential x{results['server_sequential']['req_per_s'] / base:.1f}, "
+              f"pipelined x{results['server_pipelined']['req_per_s'] / base:.1f}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="UartDebug template filler benchmarks")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+
+    rp = sub.add_parser("run", help="Time each stage and the end-to-end CLI on synthetic workloads")
+    rp.add_argument("--out", default=None, help="Write results as JSON to this path")
+    rp.add_argument("--quick", action="store_true", help="Smaller sizes and fewer samples")
+    rp.set_defaults(func=cmd_run)
+
+    cp = sub.add_parser("compare", help="Compare two result files, exit 1 on slowdowns")
+    cp.add_argument("baseline")
+    cp.add_argument("current")
+    cp.add_argument("--threshold", type=float, default=0.15, help="Allowed relative slowdown (default 0.15 = 15%%)")
+    cp.set_defaults(func=cmd_compare)
+
+    sp = sub.add_parser("serve", help="Compare --serve mode with one CLI process per request")
+    sp.add_argument("--template", default=os.path.join(HERE, "usart.tpl"))
+    sp.add_argument("--project", default=os.path.join(HERE, "project.ud"))
+    sp.add_argument("--c-in", default=os.path.join(HERE, "main.c"))
+    sp.add_argument("--requests", type=int, default=200, help="Requests sent to the server (default 200)")
+    sp.add_argument("--cli-runs", type=int, default=30, help="CLI process launches (default 30)")
+    sp.add_argument("--workers", type=int, default=None, help="Server worker processes (default: CPU count)")
+    sp.add_argument("--json", default=None, help="Write results as JSON to this path")
+    sp.set_defaults(func=cmd_serve)
+
+    args = ap.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
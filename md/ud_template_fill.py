@@ -29,6 +29,8 @@ Template directives (based on шаблоны.md):
   $H <text>                     - include section line
   $I <text>                     - init-calls section line (inside main)
   $C+ ... $C-                   - functions/code block (outside main)
+  $W <text>                     - line of the byte writer used by the work part
+                                  (sends `char c` to the instance, e.g. wait + TXDATAL)
 
 Placeholders:
   Any token like @NAME inside $C+, $H, $D, $I sections will be replaced:
@@ -38,11 +40,19 @@ Placeholders:
   Conditional snippet line syntax inside $S+ blocks:
     ?USART0 PORTB.DIRSET |= PIN2_bm;
 
+Constant folding:
+  Numeric #define chains of the D section are evaluated at generation time.
+  A USART BAUD register define computed from a clock (F_CPU/CLK*) and a baud
+  macro is emitted as an integer literal with the actual baud and error:
+    #define USART_BAUD_RATE 116U // 114943 baud (-0.22 %) = (((float) CLK_PER ...
+  Generation fails if the error exceeds UART_BAUD_TOLERANCE (2 %).
+
 Project file parameters (based on шаблоны.md):
   <InstanceName> <ProcessType>
       AnyKey - VALUE // comment
       AnyKey2 - VALUE2
-  "Hello World!" -> InstanceName   (work-part start, ignored here)
+  "Hello World!" -> InstanceName   (work part: compiled into the loop body //`C+
+                                    block inside main(), strings in a flash table)
 
 Mapping strategy for project params:
   - Prefer matching VALUE to allowed enum values from $S lines.
@@ -52,22 +62,50 @@ Mapping strategy for project params:
 Usage:
   python ud_template_fill.py --template usart.tpl --project project.ud --c-in main.c --c-out main_gen.c
   python ud_template_fill.py --template usart.tpl --project project.ud --c-in main.c --c-out main_gen.c --instance MyPORT
+  python ud_template_fill.py --template usart.tpl --project project.ud --c-in main.c --c-out main_gen.c --all-instances
+  python ud_template_fill.py --template-dir templates/ --project project.ud --c-in main.c --c-out main_gen.c
+  python ud_template_fill.py --template usart.tpl --project project.ud --c-in main.c --c-out main_gen.c --watch
+  python ud_template_fill.py --template usart.tpl --project project.ud --c-in main.c --c-out main_gen.c --reproducible --depfile main_gen.d
+  cat big.c | python ud_template_fill.py --template usart.tpl --project project.ud --c-in - --c-out - --stream
+  python ud_template_fill.py --serve [--socket /run/ud-fill.sock] [--workers 4]
+  python ud_template_fill.py --batch 'projects/*/project.ud' [--template usart.tpl] [--batch-state build/batch.json]
+  python ud_template_fill.py --template usart.tpl --c-in main.c --matrix build/matrix [--include @USART=USART0] [--exclude ...]
 
 """
 
 from __future__ import annotations
 
 import argparse
+import contextlib
 import datetime as _dt
+import functools
+import hashlib
+import io
+import json
+import os
 import re
+import sys
+import threading
+import time
+import itertools
+from collections import OrderedDict
 from dataclasses import dataclass, field
-from typing import Dict, List, Optional, Tuple
+from typing import TYPE_CHECKING, Callable, Dict, Iterable, List, Optional, TextIO, Tuple
+
+if TYPE_CHECKING:
+    from concurrent.futures import Executor, Future
+
+# Modules only --serve/--matrix/--batch/--watch need (concurrent.futures,
+# socketserver, tempfile, ...) are imported where they are used: they would
+# double the start-up time of a plain one-file run.
 
 
 # =========================
 # Template data structures
 # =========================
 
+_SECTION_TAGS = ["V", "P", "D", "H", "C", "I"]  # C-file marker blocks, in file order
+
 @dataclass
 class ParamDef:
     name: str
@@ -87,13 +125,101 @@ class Template:
     blocks: Dict[str, List[str]] = field(default_factory=dict)  # '@TXD_LOCATION' -> raw lines inside $S+ ... $S-
 
     # output sections for insertion into C blocks
-    sections: Dict[str, List[str]] = field(default_factory=lambda: {k: [] for k in ["P", "D", "H", "C", "I"]})
+    sections: Dict[str, List[str]] = field(default_factory=lambda: {k: [] for k in ["P", "D", "H", "C", "I", "W"]})
+
+    # lazily built ParamIndex (see param_index()); not part of the template value
+    _index: Optional["ParamIndex"] = field(default=None, init=False, repr=False, compare=False)
+
+
+# =========================
+# Instrumentation (--timings / library hook)
+# =========================
+
+_tls = threading.local()
+
+
+class Instrumentation:
+    """
+    Wall time per pipeline stage and work counters.
+
+    Library use:
+        ins = Instrumentation(callback=lambda stage, seconds, counters: ...)
+        with ins.active():
+            ...parse_template / parse_project_params / render / fill_c_skeleton...
+        ins.as_dict()
+
+    The callback runs after every instrumented call with the stage name, its
+    wall time and a snapshot of the counters. Nothing is measured (and the
+    counters cost nothing) while no Instrumentation is active in the thread.
+    """
+
+    def __init__(self, callback: Optional[Callable[[str, float, Dict[str, int]], None]] = None):
+        self.callback = callback
+        self.stages: Dict[str, List[float]] = {}  # name -> [seconds, calls]
+        self.counters: Dict[str, int] = {}
+
+    @contextlib.contextmanager
+    def active(self):
+        prev = getattr(_tls, "instr", None)
+        _tls.instr = self
+        try:
+            yield self
+        finally:
+            _tls.instr = prev
+
+    def count(self, name: str, n: int = 1) -> None:
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def record(self, stage: str, seconds: float) -> None:
+        st = self.stages.setdefault(stage, [0.0, 0])
+        st[0] += seconds
+        st[1] += 1
+        if self.callback is not None:
+            self.callback(stage, seconds, dict(self.counters))
+
+    def as_dict(self) -> dict:
+        return {
+            "stages": {k: {"ms": round(v[0] * 1000.0, 3), "calls": int(v[1])} for k, v in self.stages.items()},
+            "counters": dict(self.counters),
+        }
+
+
+def _instrumented(stage: Optional[str], counters: Optional[Callable[..., Dict[str, int]]] = None):
+    """
+    Time a function as `stage` and add counters(result, *args, **kwargs) to the
+    active Instrumentation. Counters are computed outside the timed region.
+    """
+    def deco(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            ins = getattr(_tls, "instr", None)
+            if ins is None:
+                return fn(*args, **kwargs)
+            t0 = time.perf_counter()
+            result = fn(*args, **kwargs)
+            dt = time.perf_counter() - t0
+            if counters is not None:
+                for k, v in counters(result, *args, **kwargs).items():
+                    ins.count(k, v)
+            if stage is not None:
+                ins.record(stage, dt)
+            return result
+        return wrapper
+    return deco
+
+
+def _line_count(text: str) -> int:
+    return text.count("\n") + (0 if text.endswith("\n") or not text else 1)
 
 
 # =========================
 # Parsing: template
 # =========================
 
+@_instrumented("parse_template", lambda t, text: {
+    "template_lines_scanned": _line_count(text),
+    "directives_parsed": sum(1 for l in text.splitlines() if l.lstrip().startswith("$")),
+})
 def parse_template(text: str) -> Template:
     t = Template()
     lines = text.splitlines()
@@ -183,6 +309,11 @@ def parse_template(text: str) -> Template:
             t.sections["I"].append(line.split("$I", 1)[1].lstrip())
             continue
 
+        if stripped.startswith("$W "):
+            # keep the indentation after "$W " so multi-line writers stay readable
+            t.sections["W"].append(line.split("$W ", 1)[1].rstrip())
+            continue
+
         if stripped.startswith("$C+"):
             # allow remainder after $C+ on the same line
             state = "C"
@@ -198,27 +329,321 @@ def parse_template(text: str) -> Template:
 
 
 # =========================
-# Parsing: project
+# Parsed template cache
 # =========================
 
-_INSTANCE_RE = re.compile(r'^\s*([A-Za-z0-9_]+)\s+([A-Za-z0-9_]+)\s*$')
-_PARAM_RE = re.compile(r'^\s*(.*?)\s*-\s*(.*?)\s*$')
+# Bump whenever parse_template() or the Template layout changes, so stale
+# cache entries are never loaded.
+PARSER_VERSION = 2
 
+DEFAULT_CACHE_MAX_BYTES = 16 * 1024 * 1024
 
-def parse_project_params(
+
+def default_cache_dir() -> str:
+    env = os.environ.get("UD_TEMPLATE_CACHE_DIR")
+    if env:
+        return env
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "uartdebug", "templates")
+
+
+def _template_to_json(t: Template) -> dict:
+    return {
+        "version": t.version,
+        "name": t.name,
+        "aliases": t.aliases,
+        "device": t.device,
+        "params": [[p.name, p.values, p.default_index, p.label] for p in t.params.values()],
+        "blocks": t.blocks,
+        "sections": t.sections,
+    }
+
+
+def _template_from_json(d: dict) -> Template:
+    return Template(
+        version=d["version"],
+        name=d["name"],
+        aliases=d["aliases"],
+        device=d["device"],
+        params={p[0]: ParamDef(name=p[0], values=p[1], default_index=p[2], label=p[3]) for p in d["params"]},
+        blocks=d["blocks"],
+        sections=d["sections"],
+    )
+
+
+class TemplateCache:
+    """
+    Persistent cache of parsed templates.
+
+    Entries are JSON files named by sha256(template text) + PARSER_VERSION.
+    A hit refreshes the entry mtime; when the directory grows beyond max_bytes
+    the least recently used entries are removed.
+    """
+
+    def __init__(self, cache_dir: Optional[str] = None, max_bytes: int = DEFAULT_CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir or default_cache_dir()
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+    def _entry_path(self, text: str) -> str:
+        digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, f"{digest}-p{PARSER_VERSION}.json")
+
+    @_instrumented("template_cache")
+    def load(self, text: str) -> Template:
+        path = self._entry_path(text)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                t = _template_from_json(json.load(f))
+            os.utime(path)
+            self.hits += 1
+            return t
+        except (OSError, ValueError, KeyError, IndexError, TypeError):
+            pass
+
+        self.misses += 1
+        t = parse_template(text)
+        try:
+            self._store(path, t)
+        except OSError:
+            pass  # cache is best effort (read-only home, full disk, ...)
+        return t
+
+    def _store(self, path: str, t: Template) -> None:
+        import tempfile
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(_template_to_json(t), f, ensure_ascii=False, separators=(",", ":"))
+            os.replace(tmp, path)
+        except BaseException:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+            raise
+        self._evict()
+
+    def _evict(self) -> None:
+        entries = []
+        total = 0
+        with os.scandir(self.cache_dir) as it:
+            for e in it:
+                if not e.name.endswith(".json"):
+                    continue
+                st = e.stat()
+                entries.append((st.st_mtime, st.st_size, e.path))
+                total += st.st_size
+        if total <= self.max_bytes:
+            return
+        entries.sort()
+        for _mtime, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.unlink(path)
+                total -= size
+            except OSError:
+                pass
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses}
+
+
+def load_template(text: str, cache: Optional[TemplateCache] = None) -> Template:
+    """parse_template() through an optional TemplateCache."""
+    if cache is None:
+        return parse_template(text)
+    return cache.load(text)
+
+
+# =========================
+# Template library (--template-dir)
+# =========================
+
+# Directives after which no more $V/$N header lines are expected.
+_BODY_DIRECTIVES = ("$S", "$P", "$H", "$I", "$W", "$C+")
+
+
+def read_template_header(text: str) -> Template:
+    """Only the $V/$N/$D header of a template (same rules as parse_template)."""
+    t = Template()
+    for raw in text.splitlines():
+        stripped = raw.strip()
+        if stripped.startswith(_BODY_DIRECTIVES):
+            break
+        if stripped.startswith("$V "):
+            parts = stripped.split(maxsplit=2)
+            if len(parts) >= 2:
+                t.version = parts[1]
+            if len(parts) >= 3:
+                t.name = parts[2].strip()
+        elif stripped.startswith("$N "):
+            t.aliases = [a.strip() for a in stripped[3:].strip().split("|") if a.strip()]
+        elif stripped.startswith("$D "):
+            rest = stripped[3:].strip()
+            if not (rest.startswith("#") or rest.startswith("//#") or "define" in rest):
+                t.device = rest
+    return t
+
+
+class TemplateLibrary:
+    """
+    Directory of *.tpl files with a persistent alias -> template index.
+
+    refresh() stats every template; files with unchanged (mtime, size) are not
+    opened, changed files are re-hashed and only their header is parsed again.
+    resolve() maps a project process type (e.g. USART) to a template path.
+    The index is stored as JSON in the template cache directory.
+    """
+
+    INDEX_VERSION = 1
+
+    def __init__(self, root: str, index_dir: Optional[str] = None):
+        self.root = os.path.abspath(root)
+        digest = hashlib.sha256(self.root.encode("utf-8")).hexdigest()[:16]
+        self.index_path = os.path.join(index_dir or default_cache_dir(), f"library-{digest}.idx")
+        self.entries: Dict[str, dict] = {}  # relpath -> {mtime_ns, size, sha256, name, version, aliases}
+        self.aliases: Dict[str, List[str]] = {}  # alias -> relpaths (sorted)
+        self._load()
+
+    def _load(self) -> None:
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                doc = json.load(f)
+            if doc.get("version") == self.INDEX_VERSION and doc.get("root") == self.root:
+                self.entries = doc["entries"]
+        except (OSError, ValueError, KeyError, TypeError):
+            self.entries = {}
+
+    def _save(self) -> None:
+        os.makedirs(os.path.dirname(self.index_path), exist_ok=True)
+        tmp = self.index_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"version": self.INDEX_VERSION, "root": self.root, "entries": self.entries}, f, ensure_ascii=False)
+        os.replace(tmp, self.index_path)
+
+    def refresh(self) -> Dict[str, int]:
+        stats = {"templates": 0, "unchanged": 0, "rehashed": 0, "reparsed": 0, "removed": 0}
+        seen: Dict[str, dict] = {}
+        for dirpath, _dirs, files in os.walk(self.root):
+            for fn in files:
+                if not fn.endswith(".tpl"):
+                    continue
+                path = os.path.join(dirpath, fn)
+                rel = os.path.relpath(path, self.root)
+                st = os.stat(path)
+                stats["templates"] += 1
+                old = self.entries.get(rel)
+                if old and old["mtime_ns"] == st.st_mtime_ns and old["size"] == st.st_size:
+                    seen[rel] = old
+                    stats["unchanged"] += 1
+                    continue
+                with open(path, "rb") as f:
+                    data = f.read()
+                digest = hashlib.sha256(data).hexdigest()
+                if old and old["sha256"] == digest:
+                    entry = dict(old, mtime_ns=st.st_mtime_ns, size=st.st_size)
+                    stats["rehashed"] += 1
+                else:
+                    hdr = read_template_header(data.decode("utf-8"))
+                    entry = {"mtime_ns": st.st_mtime_ns, "size": st.st_size, "sha256": digest,
+                             "name": hdr.name, "version": hdr.version, "aliases": hdr.aliases}
+                    stats["reparsed"] += 1
+                seen[rel] = entry
+
+        stats["removed"] = len(set(self.entries) - set(seen))
+        changed = seen != self.entries
+        self.entries = seen
+        self.aliases = {}
+        for rel in sorted(self.entries):
+            for a in self.entries[rel]["aliases"]:
+                self.aliases.setdefault(a, []).append(rel)
+        if changed:
+            try:
+                self._save()
+            except OSError:
+                pass  # index is a cache; a read-only cache dir only costs a rescan
+        return stats
+
+    def resolve(self, ptype: str) -> Optional[str]:
+        rels = self.aliases.get(ptype)
+        return os.path.join(self.root, rels[0]) if rels else None
+
+    def conflicts(self) -> Dict[str, List[str]]:
+        return {a: rels for a, rels in self.aliases.items() if len(rels) > 1}
+
+
+def render_project_library(
     project_text: str,
-    template: Template,
+    library: TemplateLibrary,
     *,
     instance: Optional[str] = None,
+    all_instances: bool = False,
+    cache: Optional[TemplateCache] = None,
+    warn: Callable[[str], None] = lambda msg: None,
+    reproducible: bool = False,
+    used_templates: Optional[List[str]] = None,
 ) -> Dict[str, str]:
     """
-    Extract params for one process instance that matches template aliases.
-    Returns mapping like: {'@USART': 'USART1', '@USART_LOCATION': 'USART_LOCATION_DEFAULT'}
+    Resolve every project instance to its template through the library and
+    render them into one set of sections. Only templates that the project uses
+    are read and parsed. Per template, the instances are picked like with a
+    single --template: the first one (or `instance`) without prefixes, or with
+    `all_instances` every one with "<Instance>_" symbol prefixes. The project
+    work part is compiled into the result (see apply_work_part). used_templates,
+    if given, receives the template paths read.
     """
-    lines = project_text.splitlines()
+    project = ProjectModel(project_text)
+    groups: Dict[str, List[ProjectInstance]] = {}
+    for pi in project.instances:
+        if instance and pi.name != instance:
+            continue
+        path = library.resolve(pi.ptype)
+        if path is None:
+            warn(f"no template in {library.root} for {pi.name} ({pi.ptype})")
+            continue
+        groups.setdefault(path, []).append(pi)
+    if not groups:
+        raise ValueError("No project instance resolves to a template of the library.")
+
+    texts = {path: _read_text(path) for path in groups}
+    if used_templates is not None:
+        used_templates.extend(texts)
+    generated = reproducible_stamp(*texts.values(), project_text) if reproducible else None
+
+    parts: List[Dict[str, str]] = []
+    for path, insts in groups.items():
+        tpl = load_template(texts[path], cache)
+        if all_instances:
+            parts.append(render_instances(tpl, [(pi.name, project.resolve(tpl, pi)) for pi in insts], generated=generated))
+            continue
+        if len(insts) > 1:
+            skipped = ", ".join(pi.name for pi in insts[1:])
+            warn(f"{os.path.relpath(path, library.root)}: rendering {insts[0].name} only, not {skipped} (use --all-instances)")
+        sec = render_sections(tpl, project.resolve(tpl, insts[0]), generated)
+        sec[_WRITER_PREFIX + insts[0].name] = sec.pop("W")
+        parts.append(sec)
+    return apply_work_part(merge_sections(parts), project)
+
+
+# =========================
+# Parsing: project
+# =========================
 
-    # Find candidate instances
-    blocks: List[Tuple[str, str, int, int]] = []  # (inst, type, start_line, end_line_excl)
+_INSTANCE_RE = re.compile(r'^\s*([A-Za-z0-9_]+)\s+([A-Za-z0-9_]+)\s*$')
+_PARAM_RE = re.compile(r'^\s*(.*?)\s*-\s*(.*?)\s*$')
+
+
+def _find_instance_blocks(lines: List[str]) -> List[Tuple[str, str, int, int]]:
+    """
+    Scan the parameter part of a project file (everything before the first
+    '->' line) and return (inst, type, start_line, end_line_excl) per instance.
+    """
+    blocks: List[Tuple[str, str, int, int]] = []
     i = 0
     while i < len(lines):
         raw = lines[i]
@@ -250,294 +675,2313 @@ def parse_project_params(
             i = j
         else:
             i += 1
+    return blocks
 
-    # choose block
-    aliases = set(template.aliases) if template.aliases else set()
-    chosen = None
-    for inst, ptype, start, end in blocks:
-        if instance and inst != instance:
-            continue
-        if aliases and ptype not in aliases:
-            continue
-        chosen = (inst, ptype, start, end)
-        break
 
-    if chosen is None:
-        # fallback: first block if user forced instance
-        if instance:
-            for inst, ptype, start, end in blocks:
-                if inst == instance:
-                    chosen = (inst, ptype, start, end)
-                    break
-        if chosen is None:
-            raise ValueError("Cannot find matching instance in project file (by template aliases / instance name).")
+_VAR_IN_KEY_RE = re.compile(r'(@\w+)')
+_WS_RE = re.compile(r'\s+')
 
-    inst, ptype, start, end = chosen
 
-    # parse params
-    selected: Dict[str, str] = {}
-    for k in range(start, end):
-        raw = lines[k]
-        s = raw.strip()
-        if not s or s.startswith("//"):
-            continue
-        # strip comment
-        s = s.split("//", 1)[0].strip()
-        if not s:
-            continue
-        pm = _PARAM_RE.match(s)
-        if not pm:
-            continue
-        key_raw, value_raw = pm.group(1).strip(), pm.group(2).strip()
-        if not value_raw:
-            continue
+class ParamIndex:
+    """
+    Lookup tables built once per template for project parameter resolution:
+      by_value  - enum value -> names of the $S params that allow it (template order)
+      key_names - '@USART' -> 'usart' (matched against the project key)
+      labels    - '@USART' -> lowercased label
+      defaults  - '@USART' -> default value
+    """
 
+    def __init__(self, template: Template):
+        self.by_value: Dict[str, List[str]] = {}
+        self.key_names: Dict[str, str] = {}
+        self.labels: Dict[str, str] = {}
+        self.defaults: Dict[str, str] = {}
+        for name, pd in template.params.items():
+            for v in dict.fromkeys(pd.values):
+                self.by_value.setdefault(v, []).append(name)
+            self.key_names[name] = name.lower().strip("@")
+            if pd.label:
+                self.labels[name] = pd.label.lower()
+            if pd.default_index is not None and 0 <= pd.default_index < len(pd.values):
+                self.defaults[name] = pd.values[pd.default_index]
+            elif pd.values:
+                self.defaults[name] = pd.values[0]
+
+
+def param_index(template: Template) -> ParamIndex:
+    if template._index is None:
+        template._index = ParamIndex(template)
+    return template._index
+
+
+def resolve_params(pairs: List[Tuple[str, str]], template: Template) -> Dict[str, str]:
+    """Map project (key, value) lines to template params; missing params get their defaults."""
+    idx = param_index(template)
+    params = template.params
+    selected: Dict[str, str] = {}
+    for key_raw, value_raw in pairs:
         # 1) if key contains @VAR, use it directly
-        m_var = re.search(r'(@\w+)', key_raw)
-        if m_var and m_var.group(1) in template.params:
+        m_var = _VAR_IN_KEY_RE.search(key_raw) if "@" in key_raw else None
+        if m_var and m_var.group(1) in params:
             selected[m_var.group(1)] = value_raw
             continue
 
         # 2) match by VALUE membership in enum lists
-        candidates = [p.name for p in template.params.values() if value_raw in p.values]
+        candidates = idx.by_value.get(value_raw)
+        if not candidates:
+            continue  # 3) unknown to this template
         if len(candidates) == 1:
             selected[candidates[0]] = value_raw
             continue
-        if len(candidates) > 1:
-            # disambiguate by label or by key similarity
-            key_norm = re.sub(r'\s+', ' ', key_raw).lower()
-            best = None
-            for cand in candidates:
-                pd = template.params[cand]
-                # match "@USART" with "USART" / "usart"
-                if cand.lower().strip("@") in key_norm.replace(" ", ""):
-                    best = cand
-                    break
-                if pd.label and pd.label.lower() in key_norm:
-                    best = cand
-                    break
-            if best:
-                selected[best] = value_raw
-            continue
 
-        # 3) otherwise ignore (unknown to this template)
+        # disambiguate by key similarity or by label
+        key_norm = _WS_RE.sub(' ', key_raw).lower()
+        key_compact = key_norm.replace(" ", "")
+        for cand in candidates:
+            label = idx.labels.get(cand)
+            if idx.key_names[cand] in key_compact or (label and label in key_norm):
+                selected[cand] = value_raw
+                break
 
     # apply defaults if missing
-    for name, pd in template.params.items():
-        if name in selected:
-            continue
-        if pd.default_index is not None and 0 <= pd.default_index < len(pd.values):
-            selected[name] = pd.values[pd.default_index]
-        elif pd.values:
-            selected[name] = pd.values[0]
-
+    for name, value in idx.defaults.items():
+        selected.setdefault(name, value)
     return selected
 
 
+_WORK_LINE_RE = re.compile(r'^\s*((?:"(?:[^"\\]|\\.)*"\s*)+)->\s*([A-Za-z0-9_]+)\s*(?://.*)?$')
+_WORK_STR_RE = re.compile(r'"((?:[^"\\]|\\.)*)"')
+_C_ESCAPE_RE = re.compile(r'\\(x[0-9A-Fa-f]+|[0-7]{1,3}|.)', re.S)
+_C_SIMPLE_ESCAPES = {"n": 10, "r": 13, "t": 9, "a": 7, "b": 8, "f": 12, "v": 11,
+                     "\\": 92, "'": 39, '"': 34, "?": 63}
+
+
+def _c_string_bytes(body: str, line_no: int) -> bytes:
+    """Bytes of a C string literal body (escapes resolved, other text as UTF-8)."""
+    out = bytearray()
+    pos = 0
+    for m in _C_ESCAPE_RE.finditer(body):
+        out += body[pos: m.start()].encode("utf-8")
+        esc = m.group(1)
+        if esc[0] == "x":
+            value = int(esc[1:], 16)
+        elif esc[0] in "01234567":
+            value = int(esc, 8)
+        elif esc in _C_SIMPLE_ESCAPES:
+            value = _C_SIMPLE_ESCAPES[esc]
+        else:
+            raise ValueError(f"Project line {line_no}: unknown escape sequence \\{esc}")
+        if value > 0xFF:
+            raise ValueError(f"Project line {line_no}: escape sequence \\{esc} out of range")
+        out.append(value)
+        pos = m.end()
+    out += body[pos:].encode("utf-8")
+    return bytes(out)
+
+
+@dataclass
+class WorkSend:
+    line: int  # 1-based project line
+    instance: str
+    data: bytes
+
+
+@dataclass
+class ProjectInstance:
+    name: str
+    ptype: str
+    start: int  # first line after the instance header
+    end: int    # end of the instance block (exclusive)
+    params: Optional[List[Tuple[str, str]]] = None  # (key, value) lines, filled on first use
+
+
+class ProjectModel:
+    """
+    Project file parsed once and indexed by instance name and process type.
+    Parameter lines of an instance are split on first use and resolved
+    selections are memoized per (template, instance), so repeated lookups for
+    other instances or templates do not rescan the text. The work part
+    ('"text" -> Instance' lines) is parsed on first use by work().
+    """
+
+    def __init__(self, project_text: str):
+        self._lines = project_text.splitlines()
+        self.instances: List[ProjectInstance] = []
+        self.by_name: Dict[str, List[ProjectInstance]] = {}
+        self.by_type: Dict[str, List[ProjectInstance]] = {}
+        self._order: Dict[int, int] = {}
+        self._resolved: Dict[Tuple[int, int], Tuple[Template, Dict[str, str]]] = {}
+        self._work: Optional[List[WorkSend]] = None
+
+        for inst, ptype, start, end in _find_instance_blocks(self._lines):
+            pi = ProjectInstance(inst, ptype, start, end)
+            self._order[id(pi)] = len(self.instances)
+            self.instances.append(pi)
+            self.by_name.setdefault(inst, []).append(pi)
+            self.by_type.setdefault(ptype, []).append(pi)
+
+    def pairs(self, pi: ProjectInstance) -> List[Tuple[str, str]]:
+        if pi.params is None:
+            pairs: List[Tuple[str, str]] = []
+            for k in range(pi.start, pi.end):
+                s = self._lines[k].strip()
+                if not s or s.startswith("//"):
+                    continue
+                # strip comment
+                s = s.split("//", 1)[0].strip()
+                if not s:
+                    continue
+                pm = _PARAM_RE.match(s)
+                if not pm:
+                    continue
+                key_raw, value_raw = pm.group(1).strip(), pm.group(2).strip()
+                if value_raw:
+                    pairs.append((key_raw, value_raw))
+            pi.params = pairs
+        return pi.params
+
+    def find(self, template: Template, instance: Optional[str] = None) -> ProjectInstance:
+        """First instance matching template aliases (and `instance`, if given)."""
+        aliases = template.aliases
+        if instance:
+            named = self.by_name.get(instance, [])
+            for pi in named:
+                if not aliases or pi.ptype in aliases:
+                    return pi
+            if named:
+                return named[0]  # user forced the instance
+        elif not aliases:
+            if self.instances:
+                return self.instances[0]
+        else:
+            firsts = [self.by_type[a][0] for a in dict.fromkeys(aliases) if a in self.by_type]
+            if firsts:
+                return min(firsts, key=lambda pi: self._order[id(pi)])
+        raise ValueError("Cannot find matching instance in project file (by template aliases / instance name).")
+
+    def matching(self, template: Template) -> List[ProjectInstance]:
+        """All instances whose type matches template aliases, in project order."""
+        if not template.aliases:
+            return list(self.instances)
+        found = [pi for a in dict.fromkeys(template.aliases) for pi in self.by_type.get(a, [])]
+        return sorted(found, key=lambda pi: self._order[id(pi)])
+
+    def resolve(self, template: Template, pi: ProjectInstance) -> Dict[str, str]:
+        key = (id(template), id(pi))
+        hit = self._resolved.get(key)
+        if hit is None or hit[0] is not template:
+            hit = (template, resolve_params(self.pairs(pi), template))
+            self._resolved[key] = hit
+        return dict(hit[1])
+
+    def work(self) -> List[WorkSend]:
+        """
+        Sends of the work part in project order. Adjacent literals on one line
+        are concatenated like in C; raises ValueError for lines that are not
+        '"text" -> Instance' and for instances the project does not declare.
+        """
+        if self._work is None:
+            start = self.instances[-1].end if self.instances else 0
+            sends: List[WorkSend] = []
+            for k in range(start, len(self._lines)):
+                s = self._lines[k].strip()
+                if not s or s.startswith("//"):
+                    continue
+                m = _WORK_LINE_RE.match(s)
+                if m is None:
+                    if not sends and "->" not in s:
+                        continue  # stray parameter-part text before the first send
+                    raise ValueError(f"Project line {k + 1}: expected '\"text\" -> Instance', got {s!r}")
+                inst = m.group(2)
+                if inst not in self.by_name:
+                    raise ValueError(f"Project line {k + 1}: unknown instance {inst!r}")
+                data = b"".join(_c_string_bytes(body, k + 1) for body in _WORK_STR_RE.findall(m.group(1)))
+                sends.append(WorkSend(k + 1, inst, data))
+            self._work = sends
+        return self._work
+
+    def params_for(self, template: Template, instance: Optional[str] = None) -> Dict[str, str]:
+        return self.resolve(template, self.find(template, instance))
+
+    def all_params_for(self, template: Template) -> List[Tuple[str, Dict[str, str]]]:
+        found = self.matching(template)
+        if not found:
+            raise ValueError("Cannot find matching instances in project file (by template aliases).")
+        return [(pi.name, self.resolve(template, pi)) for pi in found]
+
+
+@_instrumented("select", lambda r, project_text, *a, **kw: {"project_lines_scanned": _line_count(project_text)})
+def parse_project_params(
+    project_text: str,
+    template: Template,
+    *,
+    instance: Optional[str] = None,
+) -> Dict[str, str]:
+    """
+    Extract params for one process instance that matches template aliases.
+    Returns mapping like: {'@USART': 'USART1', '@USART_LOCATION': 'USART_LOCATION_DEFAULT'}
+    """
+    return ProjectModel(project_text).params_for(template, instance)
+
+
+@_instrumented("select", lambda r, project_text, *a, **kw: {"project_lines_scanned": _line_count(project_text)})
+def parse_all_instance_params(project_text: str, template: Template) -> List[Tuple[str, Dict[str, str]]]:
+    """
+    Extract params for every process instance whose type matches template aliases.
+    The project text is split and scanned once; returns [(instance_name, selected), ...]
+    in project order.
+    """
+    return ProjectModel(project_text).all_params_for(template)
+
+
+# =========================
+# Generation-time constant folding (D section)
+# =========================
+
+# Receiver tolerance of an 8N1 frame that the baud setting may use up, in
+# percent (the tinyAVR datasheets recommend staying within +-2 %).
+UART_BAUD_TOLERANCE = 2.0
+
+_DEFINE_VALUE_RE = re.compile(r'^(\s*#\s*define\s+([A-Za-z_]\w*))\s+(.*?)\s*(//.*)?$')
+_C_TOKEN_RE = re.compile(
+    r'\s*(?:(?P<num>0[xX][0-9A-Fa-f]+[uUlL]*|(?:\d+\.\d*|\.\d+|\d+)(?:[eE][+-]?\d+)?[uUlLfF]*)'
+    r'|(?P<id>[A-Za-z_]\w*)|(?P<op><<|>>|[-+*/%()~&|^]))'
+)
+_C_FLOAT_TYPES = {"float", "double"}
+_C_INT_TYPES = {"char", "short", "int", "long", "signed", "unsigned"}
+_CLOCK_NAME_RE = re.compile(r'F_CPU|CLK')
+
+
+class _NotConstant(Exception):
+    """Expression uses something that is not a known numeric macro."""
+
+
+def _c_tokens(expr: str) -> List[Tuple[str, str]]:
+    toks: List[Tuple[str, str]] = []
+    pos = 0
+    expr = expr.rstrip()
+    while pos < len(expr):
+        m = _C_TOKEN_RE.match(expr, pos)
+        if m is None or m.end() == pos:
+            raise _NotConstant(expr[pos:])
+        toks.append((m.lastgroup or "", m.group(m.lastgroup or 0)))
+        pos = m.end()
+    return toks
+
+
+def _c_number(text: str):
+    t = text.rstrip("uUlL")
+    if t[:2] in ("0x", "0X"):
+        return int(t, 16)
+    if any(ch in t for ch in ".eE") or text[-1:] in "fF":
+        return float(t.rstrip("fF"))
+    return int(t, 8) if len(t) > 1 and t[0] == "0" else int(t)
+
+
+def _c_div(a, b, op: str):
+    if b == 0:
+        raise _NotConstant("division by zero")
+    if isinstance(a, float) or isinstance(b, float):
+        if op == "%":
+            raise _NotConstant("% on floating operands")
+        return a / b
+    q = abs(a) // abs(b) * (1 if (a < 0) == (b < 0) else -1)  # C truncates toward zero
+    return q if op == "/" else a - q * b
+
+
+_C_BINARY: List[Dict[str, Callable]] = [  # lowest precedence first
+    {"|": lambda a, b: a | b},
+    {"^": lambda a, b: a ^ b},
+    {"&": lambda a, b: a & b},
+    {"<<": lambda a, b: a << b, ">>": lambda a, b: a >> b},
+    {"+": lambda a, b: a + b, "-": lambda a, b: a - b},
+    {"*": lambda a, b: a * b, "/": lambda a, b: _c_div(a, b, "/"), "%": lambda a, b: _c_div(a, b, "%")},
+]
+
+
+@functools.lru_cache(maxsize=1024)
+def _compile_c_expr(expr: str) -> Tuple[Callable[[Dict[str, object]], object], Tuple[str, ...]]:
+    """
+    Compile a constant C expression (integer/floating literals, macro names,
+    arithmetic and bit operators, casts to arithmetic types) into a function of
+    the macro values, plus the macro names it uses. Raises _NotConstant.
+    """
+    toks = _c_tokens(expr)
+    names: List[str] = []
+    pos = 0
+
+    def peek() -> Tuple[str, str]:
+        return toks[pos] if pos < len(toks) else ("", "")
+
+    def take() -> Tuple[str, str]:
+        nonlocal pos
+        if pos >= len(toks):
+            raise _NotConstant(expr)
+        pos += 1
+        return toks[pos - 1]
+
+    def cast_type() -> Optional[str]:
+        # "(float)", "(unsigned long)", "(uint16_t)" ... -> "float" / "int"
+        end = pos + 1
+        words: List[str] = []
+        while end < len(toks) and toks[end][0] == "id":
+            words.append(toks[end][1])
+            end += 1
+        if not words or end >= len(toks) or toks[end][1] != ")":
+            return None
+        if all(w in _C_FLOAT_TYPES for w in words):
+            return "float"
+        if all(w in _C_INT_TYPES or w.endswith("_t") for w in words):
+            return "int"
+        return None
+
+    def binary(level: int):
+        if level == len(_C_BINARY):
+            return unary()
+        ops = _C_BINARY[level]
+        left = binary(level + 1)
+        while peek()[0] == "op" and peek()[1] in ops:
+            fn = ops[take()[1]]
+            right = binary(level + 1)
+            left = (lambda f, l, r: lambda env: f(l(env), r(env)))(fn, left, right)
+        return left
+
+    def unary():
+        nonlocal pos
+        kind, text = peek()
+        if kind == "op" and text in "+-~":
+            take()
+            inner = unary()
+            if text == "-":
+                return lambda env: -inner(env)
+            if text == "~":
+                return lambda env: ~inner(env)
+            return inner
+        if kind == "op" and text == "(":
+            ctype = cast_type()
+            if ctype is not None:
+                while take()[1] != ")":
+                    pass
+                inner = unary()
+                if ctype == "float":
+                    return lambda env: float(inner(env))
+                return lambda env: int(inner(env))  # int() truncates toward zero like C
+            take()
+            inner = binary(0)
+            if take()[1] != ")":
+                raise _NotConstant(expr)
+            return inner
+        take()
+        if kind == "num":
+            value = _c_number(text)
+            return lambda env: value
+        if kind == "id":
+            names.append(text)
+
+            def lookup(env, name=text):
+                if name not in env:
+                    raise _NotConstant(name)
+                return env[name]
+            return lookup
+        raise _NotConstant(expr)
+
+    fn = binary(0)
+    if pos != len(toks):
+        raise _NotConstant(expr)
+    return fn, tuple(dict.fromkeys(names))
+
+
+@functools.lru_cache(maxsize=1024)
+def fold_baud(expr: str, clock: int, baud: int,
+              consts: Tuple[Tuple[str, object], ...]) -> Optional[Tuple[int, float, float]]:
+    """
+    BAUD register setting of the tinyAVR/megaAVR 0 USART for `clock` and
+    `baud`: (register, actual baud, error %). `expr` is the template formula,
+    evaluated with the macro values in `consts` (which include the clock and
+    baud macros); the result is memoized per (clock, baud) of every formula,
+    so matrix and batch runs fold each pair once per process.
+
+    The register follows BAUD = 64 * f_CLK_PER / (S * f_BAUD) with S = 16
+    (normal) or 8 (CLK2X); S is the one the formula's value matches. Returns
+    None for values that fit neither (another kind of divider). Raises
+    ValueError if the setting is out of range or its error exceeds
+    UART_BAUD_TOLERANCE.
+    """
+    fn, _names = _compile_c_expr(expr)
+    value = fn(dict(consts))
+    reg = int(value)  # stored into the 16-bit register: C conversion truncates
+    if reg <= 0 or baud <= 0:
+        return None
+    samples = min((16, 8), key=lambda s: abs(64.0 * clock / (s * baud * reg) - 1.0))
+    if abs(64.0 * clock / (samples * baud * reg) - 1.0) > 0.25:
+        return None
+    if not 64 <= reg <= 0xFFFF:
+        raise ValueError(f"{baud} baud at {clock} Hz needs BAUD = {reg}, outside the register range 64..65535")
+    actual = 64.0 * clock / (samples * reg)
+    error = (actual - baud) * 100.0 / baud
+    if abs(error) > UART_BAUD_TOLERANCE:
+        raise ValueError(
+            f"{baud} baud at {clock} Hz: BAUD = {reg} gives {actual:.0f} baud ({error:+.2f} %), "
+            f"beyond the +-{UART_BAUD_TOLERANCE:g} % UART tolerance"
+        )
+    return reg, actual, error
+
+
+def fold_defines(d_text: str) -> str:
+    """
+    Evaluate the numeric #define chain of a rendered D section and replace
+    USART BAUD register defines (a *BAUD* macro computed from a clock macro -
+    F_CPU/CLK* - and a baud macro) by the integer register value, with the
+    actual baud and error as a comment. Generation fails (ValueError) when the
+    error exceeds UART_BAUD_TOLERANCE. Other lines are kept as they are.
+    """
+    if "define" not in d_text:
+        return d_text
+    lines = d_text.split("\n")
+    values: Dict[str, object] = {}
+    deps: Dict[str, Tuple[str, ...]] = {}  # macro -> literal macros it is computed from
+    for i, line in enumerate(lines):
+        m = _DEFINE_VALUE_RE.match(line)
+        if m is None:
+            continue
+        head, name, expr = m.group(1), m.group(2), m.group(3)
+        try:
+            fn, names = _compile_c_expr(expr)
+            value = fn(values)
+        except (_NotConstant, ArithmeticError, TypeError, ValueError):
+            values.pop(name, None)  # redefined as something non-numeric
+            continue
+        values[name] = value
+        deps[name] = tuple(dict.fromkeys(leaf for n in names for leaf in (deps.get(n) or (n,))))
+        if "BAUD" not in name or not names:
+            continue
+        clocks = [n for n in deps[name] if _CLOCK_NAME_RE.search(n)]
+        bauds = [n for n in deps[name] if "BAUD" in n]
+        if len(clocks) != 1 or len(bauds) != 1:
+            continue
+        clock, baud = values[clocks[0]], values[bauds[0]]
+        consts = tuple((n, values[n]) for n in names)
+        folded = fold_baud(expr, int(clock), int(baud), consts)  # type: ignore[call-overload]
+        if folded is not None:
+            reg, actual, error = folded
+            note = f" {m.group(4)[2:].strip()}" if m.group(4) and m.group(4)[2:].strip() else ""
+            lines[i] = f"{head} {reg}U // {actual:.0f} baud ({error:+.2f} %) = {expr}{note}"
+            values[name] = reg  # later defines see what the compiler sees
+            deps[name] = (name,)  # a define built on the register is not another setting
+    return "\n".join(lines)
+
+
 # =========================
 # Rendering / substitution
 # =========================
 
 _PLACEHOLDER_RE = re.compile(r'@([A-Z0-9_]+)')  # placeholders are assumed UPPERCASE/underscore
+_COND_LINE_RE = re.compile(r'^\s*\?(\S+)\s+(.*)$')
+_P_VALUE_RE = re.compile(r'(//\s*\$?I\s+)(@\w+)\s+(\S+)')
+
+
+def _compile_segments(line: str) -> Tuple[str, ...]:
+    """
+    Split a line into (literal, key, literal, key, ..., literal).
+    Keys keep the leading '@' so they can be looked up in the replacements directly.
+    """
+    parts = _PLACEHOLDER_RE.split(line)
+    for i in range(1, len(parts), 2):
+        parts[i] = "@" + parts[i]
+    return tuple(parts)
+
+
+def _render_segments(parts: Tuple[str, ...], repl: Dict[str, str]) -> str:
+    if len(parts) == 1:
+        return parts[0]
+    out = [parts[0]]
+    for i in range(1, len(parts), 2):
+        key = parts[i]
+        out.append(repl.get(key, key))
+        out.append(parts[i + 1])
+    return "".join(out)
+
+
+@dataclass
+class _LineOp:
+    parts: Tuple[str, ...]          # inline substitution of the whole line
+    whole_key: Optional[str] = None  # '@KEY' if the line is a lone placeholder
+    indent: str = ""
+
 
+@dataclass
+class _BlockLine:
+    cond: Optional[str]        # '?COND' value, None for unconditional lines
+    text: str
+    parts: Tuple[str, ...]
+    parts_rstrip: Tuple[str, ...]  # used when the line ends the snippet (value is rstripped)
 
-def _build_replacements(template: Template, selected: Dict[str, str]) -> Dict[str, str]:
-    repl = dict(selected)
 
-    selected_values = set(selected.values())
+class RenderPlan:
+    """
+    Template compiled for rendering.
+
+    All regex work (placeholder splitting, ?COND parsing, whole-line snippet
+    detection, P-section value lookup) happens once here; render() only does
+    dictionary lookups and joins, so one plan can serve many selections.
+    """
 
-    # compute snippet blocks ($S+ ... $S-)
-    for blk_name, raw_lines in template.blocks.items():
-        out_lines: List[str] = []
-        for l in raw_lines:
-            m = re.match(r'^\s*\?(\S+)\s+(.*)$', l)
+    @_instrumented("compile_plan")
+    def __init__(self, template: Template):
+        self.template = template
+
+        header_lines: List[str] = []
+        if template.name:
+            header_lines.append(f"// Template: {template.name}")
+        if template.version:
+            header_lines.append(f"// Template version: {template.version}")
+        if template.device:
+            header_lines.append(f"// Device: {template.device}")
+        self.header_lines = header_lines
+
+        # P: (static line) or (head, prefix, var, old, tail)
+        self.p_ops: List[Tuple[str, ...]] = []
+        for l in template.sections["P"]:
+            m = _P_VALUE_RE.search(l)
             if m:
-                cond, code = m.group(1), m.group(2)
-                if cond in selected_values:
-                    out_lines.append(code)
+                self.p_ops.append((l[: m.start()], m.group(1), m.group(2), m.group(3), l[m.end():]))
+            else:
+                self.p_ops.append((l,))
+
+        self.blocks: Dict[str, List[_BlockLine]] = {}
+        for blk_name, raw_lines in template.blocks.items():
+            ops: List[_BlockLine] = []
+            for l in raw_lines:
+                m = _COND_LINE_RE.match(l)
+                cond, text = (m.group(1), m.group(2)) if m else (None, l)
+                ops.append(_BlockLine(cond, text, _compile_segments(text), _compile_segments(text.rstrip())))
+            self.blocks[blk_name] = ops
+
+        self.sections: Dict[str, List[_LineOp]] = {}
+        for sec in ["D", "H", "C", "I", "W"]:
+            ops2: List[_LineOp] = []
+            for line in template.sections[sec]:
+                m_whole = _PLACEHOLDER_RE.fullmatch(line.strip())
+                if m_whole:
+                    indent = line[: len(line) - len(line.lstrip())]
+                    ops2.append(_LineOp(_compile_segments(line), "@" + m_whole.group(1), indent))
+                else:
+                    ops2.append(_LineOp(_compile_segments(line)))
+            self.sections[sec] = ops2
+
+        self.slot_keys: List[str] = [
+            k for sec in self.sections.values() for op in sec for k in op.parts[1::2]
+        ]
+
+    def _replacements(self, selected: Dict[str, str]) -> Tuple[Dict[str, str], Dict[str, List[_BlockLine]]]:
+        repl = dict(selected)
+        selected_values = set(selected.values())
+
+        # snippet blocks ($S+ ... $S-)
+        kept_lines: Dict[str, List[_BlockLine]] = {}
+        for blk_name, ops in self.blocks.items():
+            kept = [b for b in ops if b.cond is None or b.cond in selected_values]
+            kept_lines[blk_name] = kept
+            repl[blk_name] = "\n".join(b.text for b in kept).rstrip()
+        return repl, kept_lines
+
+    def _render_lines(self, ops: List[_LineOp], repl: Dict[str, str], kept_lines: Dict[str, List[_BlockLine]]) -> List[str]:
+        multiline_keys = {k for k, v in repl.items() if "\n" in v}
+        out: List[str] = []
+        for op in ops:
+            key = op.whole_key
+            if key is not None and key in multiline_keys:
+                kept = kept_lines.get(key)
+                if kept is not None:
+                    # the value is '\n'.join(kept texts).rstrip(): all lines but the last are intact
+                    n = repl[key].count("\n") + 1
+                    for i in range(n):
+                        parts = kept[i].parts if i < n - 1 else kept[i].parts_rstrip
+                        out.append(op.indent + _render_segments(parts, repl).lstrip())
+                else:
+                    # multi-line value supplied by the caller: no precompiled segments
+                    for sl in repl[key].split("\n"):
+                        sl2 = _PLACEHOLDER_RE.sub(lambda m: repl.get("@" + m.group(1), "@" + m.group(1)), sl)
+                        out.append(op.indent + sl2.lstrip())
+                continue
+            out.append(_render_segments(op.parts, repl))
+        return out
+
+    @_instrumented("render", lambda r, self, selected, *a, **kw: {
+        "placeholders_substituted": sum(1 for k in self.slot_keys if k in selected or k in self.blocks),
+    })
+    def render(self, selected: Dict[str, str], generated: Optional[str] = None) -> Dict[str, str]:
+        """generated: value for the '// Generated:' header line (default: current local time)."""
+        sections = {"V": self.render_header(generated)}
+        sections.update(self.render_body(selected))
+        return sections
+
+    def render_header(self, generated: Optional[str] = None) -> str:
+        """V: auto header (inserted into //`V block); the only time-dependent section."""
+        if generated is None:
+            generated = _dt.datetime.now().isoformat(timespec='seconds')
+        header_lines = self.header_lines + [f"// Generated: {generated}"]
+        return "\n".join(header_lines).rstrip() + "\n"
+
+    def render_body(self, selected: Dict[str, str]) -> Dict[str, str]:
+        """P/D/H/C/I/W sections; they only depend on `selected`. Numeric D defines are folded (fold_defines)."""
+        repl, kept_lines = self._replacements(selected)
+
+        sections: Dict[str, str] = {}
+
+        # P: keep template's param metadata, but update values in lines like "//$I @VAR VALUE"
+        p_lines: List[str] = []
+        for op in self.p_ops:
+            if len(op) == 1:
+                p_lines.append(op[0])
             else:
-                out_lines.append(l)
-        repl[blk_name] = "\n".join(out_lines).rstrip()
+                head, prefix, var, old, tail = op
+                p_lines.append(f"{head}{prefix}{var} {selected.get(var, old)}{tail}")
 
-    return repl
+        p_lines.append("// --- Selected parameters ---")
+        for k in sorted(selected.keys()):
+            p_lines.append(f"// {k} = {selected[k]}")
+        sections["P"] = "\n".join(p_lines).rstrip() + "\n"
 
+        # D/H/C/I/W: apply placeholder substitution
+        for sec in ["D", "H", "C", "I", "W"]:
+            lns = self._render_lines(self.sections[sec], repl, kept_lines)
+            sections[sec] = "\n".join(lns).rstrip() + ("\n" if lns else "")
+        sections["D"] = fold_defines(sections["D"])
 
-def _replace_placeholders_in_lines(lines: List[str], repl: Dict[str, str]) -> List[str]:
-    multiline_keys = {k for k, v in repl.items() if "\n" in v}
-    out: List[str] = []
+        return sections
 
-    for line in lines:
-        stripped = line.strip()
 
-        # Whole-line snippet replacement: "@TXD_LOCATION"
-        m_whole = re.fullmatch(r'@([A-Z0-9_]+)', stripped)
-        if m_whole:
-            key = "@" + m_whole.group(1)
-            if key in repl and key in multiline_keys:
-                indent = re.match(r'^(\s*)', line).group(1)
-                for sl in repl[key].split("\n"):
-                    sl2 = _PLACEHOLDER_RE.sub(lambda m: repl.get("@" + m.group(1), "@" + m.group(1)), sl)
-                    out.append(indent + sl2.lstrip())
-                continue
+class Renderer(RenderPlan):
+    """
+    RenderPlan with a bounded LRU cache of rendered sections, keyed by the
+    frozen selection (the V header is rebuilt on every call, so the
+    '// Generated:' stamp never comes from the cache). For callers that render
+    the same selections over and over: server requests with default
+    parameters, re-renders of an unchanged project window.
+
+    max_entries / max_bytes cap the cache (UTF-8 size of the cached sections);
+    results larger than max_bytes are returned but not stored. Thread-safe.
+    """
 
-        # Inline replacement inside a line
-        def sub_fn(m):
-            key = "@" + m.group(1)
-            return repl.get(key, "@" + m.group(1))
+    def __init__(self, template: Template, max_entries: int = 256, max_bytes: Optional[int] = 4 * 1024 * 1024):
+        super().__init__(template)
+        if max_entries < 1:
+            raise ValueError("max_entries must be >= 1")
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._cache: "OrderedDict[frozenset, Tuple[Dict[str, str], int]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def render(self, selected: Dict[str, str], generated: Optional[str] = None) -> Dict[str, str]:
+        key = frozenset(selected.items())
+        with self._lock:
+            hit = self._cache.get(key)
+            if hit is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+        if hit is not None:
+            body = hit[0]
+        else:
+            body = super().render(selected, generated)
+            del body["V"]
+            size = sum(len(v.encode("utf-8")) for v in body.values())
+            with self._lock:
+                if (self.max_bytes is None or size <= self.max_bytes) and key not in self._cache:
+                    self._cache[key] = (body, size)
+                    self.bytes += size
+                    while len(self._cache) > self.max_entries or (self.max_bytes is not None and self.bytes > self.max_bytes):
+                        _k, (_b, old) = self._cache.popitem(last=False)
+                        self.bytes -= old
+                        self.evictions += 1
+        sections = {"V": self.render_header(generated)}
+        sections.update(body)  # fresh dict: callers may edit sections (render_instances, matrix)
+        return sections
+
+    def clear(self) -> None:
+        with self._lock:
+            self._cache.clear()
+            self.bytes = 0
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"entries": len(self._cache), "bytes": self.bytes, "hits": self.hits,
+                    "misses": self.misses, "evictions": self.evictions}
+
+
+def render_sections(template: Template, selected: Dict[str, str], generated: Optional[str] = None) -> Dict[str, str]:
+    """One-shot render. Use RenderPlan (or the caching Renderer) to render many selections of one template."""
+    return RenderPlan(template).render(selected, generated=generated)
+
+
+def reproducible_stamp(*inputs: str) -> str:
+    """
+    Value for the '// Generated:' header that only depends on the inputs:
+    SOURCE_DATE_EPOCH (reproducible-builds.org) as UTC time if set, otherwise
+    a sha256 over the given input texts (templates and project).
+    """
+    epoch = os.environ.get("SOURCE_DATE_EPOCH")
+    if epoch:
+        try:
+            return _dt.datetime.fromtimestamp(int(epoch), _dt.timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+        except ValueError:
+            raise ValueError(f"SOURCE_DATE_EPOCH must be an integer, got {epoch!r}") from None
+    h = hashlib.sha256()
+    for text in inputs:
+        h.update(text.encode("utf-8"))
+        h.update(b"\0")
+    return "sha256:" + h.hexdigest()[:16]
+
+
+# =========================
+# Multi-instance rendering
+# =========================
 
-        out.append(_PLACEHOLDER_RE.sub(sub_fn, line))
+_DEFINE_SYM_RE = re.compile(r'^\s*#\s*define\s+([A-Za-z_]\w*)')
+_FUNC_SYM_RE = re.compile(r'^[A-Za-z_][\w\s\*]*?\b([A-Za-z_]\w*)\s*\([^;{]*\)\s*(?:\{.*|//.*)?$')
+_GLOBAL_SYM_RE = re.compile(r'^[A-Za-z_][\w\s\*]*?\s\**([A-Za-z_]\w*)\s*(?:\[[^\]]*\])?\s*[=;]')
+_WRITER_PREFIX = "W:"  # "W:<Instance>": W section rendered for that instance
+_C_KEYWORDS = {
+    "if", "else", "for", "while", "do", "switch", "case", "return", "goto",
+    "sizeof", "typedef", "struct", "union", "enum", "static", "const", "volatile",
+}
 
+
+def template_symbols(template: Template) -> List[str]:
+    """
+    Names defined by the template itself: #define macros of the D section and
+    top-level functions/globals of the C section. These are the symbols that
+    would collide when one template is rendered for several instances.
+    """
+    found: List[str] = []
+    for l in template.sections["D"]:
+        m = _DEFINE_SYM_RE.match(l)
+        if m:
+            found.append(m.group(1))
+    for l in template.sections["C"]:
+        m = _FUNC_SYM_RE.match(l) or _GLOBAL_SYM_RE.match(l)
+        if m and m.group(1) not in _C_KEYWORDS:
+            found.append(m.group(1))
+    return list(dict.fromkeys(found))
+
+
+def merge_sections(parts: List[Dict[str, str]]) -> Dict[str, str]:
+    """
+    Concatenate several rendered section sets into one: identical V headers and
+    H lines are emitted once, the other sections are appended in order.
+    Per-instance writers ("W:<Instance>", see render_instances) are kept.
+    """
+    merged: Dict[str, List[str]] = {k: [] for k in _SECTION_TAGS}
+    seen_v: set = set()
+    seen_h: set = set()
+    for sec in parts:
+        v = sec.get("V", "")
+        if v and v not in seen_v:
+            seen_v.add(v)
+            merged["V"].append(v)
+        for ln in sec.get("H", "").splitlines(keepends=True):
+            if ln not in seen_h:
+                seen_h.add(ln)
+                merged["H"].append(ln)
+        for k in ["P", "D", "C", "I"]:
+            merged[k].append(sec.get(k, ""))
+    out = {k: "".join(v) for k, v in merged.items()}
+    for sec in parts:
+        out.update((k, v) for k, v in sec.items() if k.startswith(_WRITER_PREFIX))
     return out
 
 
-def render_sections(template: Template, selected: Dict[str, str]) -> Dict[str, str]:
-    repl = _build_replacements(template, selected)
+def render_instances(
+    template: Template,
+    instances: List[Tuple[str, Dict[str, str]]],
+    plan: Optional[RenderPlan] = None,
+    generated: Optional[str] = None,
+) -> Dict[str, str]:
+    """
+    Render one template for several instances and merge the result into a single
+    set of sections. Template-defined symbols get an "<Instance>_" prefix so the
+    per-instance code can live in one C file; H lines are emitted once. The W
+    section of each instance is returned as "W:<Instance>".
+    """
+    symbols = template_symbols(template)
+    sym_re = re.compile(r'\b(?:' + "|".join(map(re.escape, symbols)) + r')\b') if symbols else None
+
+    plan = plan or RenderPlan(template)
+    generated = generated or _dt.datetime.now().isoformat(timespec='seconds')
+    parts: List[Dict[str, str]] = []
+
+    for inst, selected in instances:
+        sec = plan.render(selected, generated=generated)
+        sec["P"] = f"// --- Instance {inst} ---\n" + sec["P"]
+        for k in ["D", "C", "I", "W"]:
+            if sym_re is not None and sec[k]:
+                sec[k] = sym_re.sub(lambda m, p=inst + "_": p + m.group(0), sec[k])
+        sec[_WRITER_PREFIX + inst] = sec.pop("W")
+        parts.append(sec)
 
-    sections: Dict[str, str] = {}
+    return merge_sections(parts)
 
-    # V: auto header (inserted into //`V block)
-    header_lines: List[str] = []
-    if template.name:
-        header_lines.append(f"// Template: {template.name}")
-    if template.version:
-        header_lines.append(f"// Template version: {template.version}")
-    if template.device:
-        header_lines.append(f"// Device: {template.device}")
-    header_lines.append(f"// Generated: {_dt.datetime.now().isoformat(timespec='seconds')}")
-    sections["V"] = "\n".join(header_lines).rstrip() + "\n"
 
-    # P: keep template's param metadata, but update values in lines like "//$I @VAR VALUE"
-    p_lines: List[str] = []
-    for l in template.sections["P"]:
-        m = re.search(r'(//\s*\$?I\s+)(@\w+)\s+(\S+)', l)
-        if m:
-            prefix, var, old = m.group(1), m.group(2), m.group(3)
-            new_val = selected.get(var, old)
-            l = l[: m.start()] + f"{prefix}{var} {new_val}" + l[m.end():]
-        p_lines.append(l)
+# =========================
+# Work part -> loop body
+# =========================
 
-    p_lines.append("// --- Selected parameters ---")
-    for k in sorted(selected.keys()):
-        p_lines.append(f"// {k} = {selected[k]}")
-    sections["P"] = "\n".join(p_lines).rstrip() + "\n"
+# avrxmega3 (tinyAVR 0/1/2, megaAVR 0) maps flash into the data space and links
+# const data there; other AVRs need the __flash address space. Either way the
+# table costs no SRAM and no startup copy.
+_FLASH_DEFINE = """\
+// --- Work part: flash-resident string table ---
+#ifndef UD_FLASH
+#if defined(__AVR_ARCH__) && __AVR_ARCH__ == 103
+#define UD_FLASH const
+#elif defined(__FLASH)
+#define UD_FLASH const __flash
+#else
+#define UD_FLASH const
+#endif
+#endif
+"""
+_WORK_COMMENT_MAX = 48
+
+
+def _c_literal(data: bytes) -> str:
+    out = ['"']
+    for b in data:
+        ch = chr(b)
+        if ch in '"\\':
+            out.append("\\" + ch)
+        elif ch == "\n":
+            out.append("\\n")
+        elif ch == "\r":
+            out.append("\\r")
+        elif ch == "\t":
+            out.append("\\t")
+        elif 0x20 <= b < 0x7F:
+            out.append(ch)
+        else:
+            out.append(f"\\{b:03o}")  # octal: never swallows a following hex digit
+    out.append('"')
+    return "".join(out)
 
-    # D/H/C/I: apply placeholder substitution
-    for sec in ["D", "H", "C", "I"]:
-        lns = _replace_placeholders_in_lines(list(template.sections[sec]), repl)
-        sections[sec] = "\n".join(lns).rstrip() + ("\n" if lns else "")
 
-    return sections
+def _string_table(chunks: List[bytes]) -> Tuple[List[bytes], List[Tuple[int, int]]]:
+    """
+    Deduplicated table for `chunks`: returns the stored strings (in order of
+    first use) and (entry, offset) per chunk. Lengths are passed explicitly, so
+    a chunk contained in a longer one points into it instead of being stored.
+    """
+    stored: List[bytes] = []
+    where: Dict[bytes, Tuple[int, int]] = {}
+    for data in sorted(set(chunks), key=lambda b: (-len(b), b)):
+        for k, big in enumerate(stored):
+            off = big.find(data)
+            if off >= 0:
+                where[data] = (k, off)
+                break
+        else:
+            where[data] = (len(stored), 0)
+            stored.append(data)
+
+    order: Dict[int, int] = {}
+    for data in chunks:
+        order.setdefault(where[data][0], len(order))
+    table = [b""] * len(order)
+    for k, n in order.items():
+        table[n] = stored[k]
+    return table, [(order[where[d][0]], where[d][1]) for d in chunks]
+
+
+@_instrumented("work_part", lambda r, sends, writers: {"work_sends": len(sends)})
+def compile_work_part(sends: List[WorkSend], writers: Dict[str, str]) -> Dict[str, str]:
+    """
+    Compile the project work part into D/C additions and the loop body (L).
+
+    Consecutive sends to one instance become one write call, the strings go to
+    a deduplicated UD_FLASH table and every instance gets a UD_write_<Instance>()
+    loop around its template's $W lines (`writers`: instance -> rendered W
+    section). Sends to instances without a writer (not rendered here, or their
+    template has no $W lines) are left as comments. Returns {} when nothing
+    can be compiled, so templates without $W keep the loop body untouched.
+    """
+    runs: List[Tuple[str, bytearray, List[int]]] = []
+    for snd in sends:
+        if runs and runs[-1][0] == snd.instance:
+            runs[-1][1].extend(snd.data)
+            runs[-1][2].append(snd.line)
+        else:
+            runs.append((snd.instance, bytearray(snd.data), [snd.line]))
+
+    writers = {inst: w for inst, w in writers.items() if w.strip()}
+    writes = [(inst, bytes(data), lines) for inst, data, lines in runs if data and inst in writers]
+    if not writes:
+        return {}
+    table, refs = _string_table([data for _inst, data, _lines in writes])
+
+    body: List[str] = []
+    ref_iter = iter(refs)
+    for inst, data, lines in runs:
+        if not data:
+            continue
+        where = "project line" + ("s " + ", ".join(map(str, lines)) if len(lines) > 1 else f" {lines[0]}")
+        lit = _c_literal(data)
+        if len(lit) > _WORK_COMMENT_MAX:
+            lit = lit[: _WORK_COMMENT_MAX - 3] + "..."
+        if inst not in writers:
+            body.append(f"// {lit} -> {inst} ({where}): no $W writer for this instance")
+            continue
+        k, off = next(ref_iter)
+        ptr = f"UD_STR_{k}" + (f" + {off}" if off else "")
+        body.append(f"UD_write_{inst}({ptr}, {len(data)}); // {lit} ({where})")
+
+    code: List[str] = []
+    for k, data in enumerate(table):
+        code.append(f"static UD_FLASH char UD_STR_{k}[{len(data)}] = {_c_literal(data)};")
+    for inst in dict.fromkeys(inst for inst, _data, _lines in writes):
+        code.append("")
+        code.append(f"static void UD_write_{inst}(UD_FLASH char *s, unsigned int n)")
+        code.append("{")
+        code.append("    while (n--) {")
+        code.append("        char c = *s++;")
+        code.extend("        " + ln if ln.strip() else "" for ln in writers[inst].rstrip("\n").split("\n"))
+        code.append("    }")
+        code.append("}")
+
+    return {
+        "D": _FLASH_DEFINE,
+        "C": "// --- Work part: strings and buffered writers ---\n" + "\n".join(code) + "\n",
+        "L": "\n".join(body) + "\n",
+    }
+
+
+def apply_work_part(sections: Dict[str, str], project: ProjectModel) -> Dict[str, str]:
+    """
+    Sections with the compiled work part of `project` added (D/C appended, loop
+    body as "L"). The writers are taken from the "W:<Instance>" entries, which
+    are not part of the result.
+    """
+    writers = {k[len(_WRITER_PREFIX):]: v for k, v in sections.items() if k.startswith(_WRITER_PREFIX)}
+    out = {k: v for k, v in sections.items() if k != "W" and not k.startswith(_WRITER_PREFIX)}
+    work = compile_work_part(project.work(), writers)
+    for k in ("D", "C"):
+        if work.get(k):
+            out[k] = out.get(k, "").rstrip("\n") + "\n" + work[k] if out.get(k, "").strip() else work[k]
+    if work.get("L"):
+        out["L"] = work["L"]
+    return out
+
+
+@_instrumented("select", lambda r, project, *a, **kw: {"project_lines_scanned": len(project._lines)})
+def _project_selection(project: ProjectModel, template: Template, instance: Optional[str],
+                       all_instances: bool) -> Tuple[str, object]:
+    if all_instances:
+        return "", project.all_params_for(template)
+    pi = project.find(template, instance)
+    return pi.name, project.resolve(template, pi)
+
+
+def render_project(
+    template: Template,
+    project_text: str,
+    *,
+    instance: Optional[str] = None,
+    all_instances: bool = False,
+    plan: Optional[RenderPlan] = None,
+    generated: Optional[str] = None,
+) -> Dict[str, str]:
+    """
+    Render `template` for one project instance (or every matching one, like
+    render_instances) and compile the project work part into the result.
+    """
+    project = ProjectModel(project_text)
+    name, sel = _project_selection(project, template, instance, all_instances)
+    return _render_selection(template, project, name, sel, plan or RenderPlan(template), generated)
+
+
+def _render_selection(template: Template, project: ProjectModel, name: str, sel: object,
+                      plan: RenderPlan, generated: Optional[str]) -> Dict[str, str]:
+    if name:
+        sections = plan.render(sel, generated=generated)  # type: ignore[arg-type]
+        sections[_WRITER_PREFIX + name] = sections.pop("W")
+    else:
+        sections = render_instances(template, sel, plan, generated=generated)  # type: ignore[arg-type]
+    return apply_work_part(sections, project)
 
 
 # =========================
 # C skeleton filling
 # =========================
 
-def _find_marker_pairs(c_lines: List[str], tag: str) -> List[Tuple[int, int]]:
-    start_re = re.compile(rf'^\s*//`{re.escape(tag)}\+(?=\s|$)')
-    end_re = re.compile(rf'^\s*//`{re.escape(tag)}-(?=\s|$)')
+_MARKER_RE = re.compile(r'^\s*//`([VPDHCI])([+-])(?=\s|$)')
+_MAIN_RE = re.compile(r'\bint\s+main\s*\(')
 
-    starts = [i for i, l in enumerate(c_lines) if start_re.search(l)]
-    ends = [i for i, l in enumerate(c_lines) if end_re.search(l)]
 
-    pairs: List[Tuple[int, int]] = []
-    for s in starts:
-        e = next((j for j in ends if j > s), None)
-        if e is not None:
-            pairs.append((s, e))
+@dataclass
+class MarkerPair:
+    tag: str
+    start: int  # line index of //`X+
+    end: int    # line index of //`X-
+    in_main: bool
+    indent: str  # leading whitespace of the start marker
 
-    # remove overlaps
-    uniq: List[Tuple[int, int]] = []
-    last_end = -1
-    for s, e in pairs:
-        if s > last_end:
-            uniq.append((s, e))
-            last_end = e
-    return uniq
 
+@dataclass
+class MarkerIndex:
+    pairs: Dict[str, List[MarkerPair]] = field(default_factory=dict)  # tag -> pairs in file order
+    main_line: Optional[int] = None
+
+    def target(self, tag: str) -> Optional[MarkerPair]:
+        """
+        Pair that receives the section for `tag`: the first one, except for C,
+        where the block before main() is preferred (inside while() there may be another //`C+).
+        """
+        pairs = self.pairs.get(tag)
+        if not pairs:
+            return None
+        if tag == "C" and self.main_line is not None:
+            for p in pairs:
+                if p.start < self.main_line:
+                    return p
+        return pairs[0]
+
+    def loop_target(self) -> Optional[MarkerPair]:
+        """Pair that receives the loop body (L): the first //`C pair inside main() not taken by C."""
+        c_pair = self.target("C")
+        for p in self.pairs.get("C", []):
+            if p.in_main and p is not c_pair:
+                return p
+        return None
+
+
+@_instrumented(None, lambda idx, c_lines: {
+    "c_lines_scanned": len(c_lines),
+    "markers_found": 2 * sum(len(v) for v in idx.pairs.values()),
+})
+def index_markers(c_lines: List[str]) -> MarkerIndex:
+    """
+    Single pass over the C lines: locate main() and pair every //`X+ with its //`X-.
+    Raises ValueError for unmatched markers and for markers inside another block.
+    """
+    idx = MarkerIndex()
+    open_pair: Optional[MarkerPair] = None
 
+    for i, l in enumerate(c_lines):
+        if idx.main_line is None and "main" in l and _MAIN_RE.search(l):
+            idx.main_line = i
+        if "//`" not in l:
+            continue
+        m = _MARKER_RE.match(l)
+        if not m:
+            continue
+        tag, sign = m.group(1), m.group(2)
+
+        if sign == "+":
+            if open_pair is not None:
+                raise ValueError(
+                    f"Line {i + 1}: //`{tag}+ inside //`{open_pair.tag}+ block opened at line {open_pair.start + 1}"
+                )
+            in_main = idx.main_line is not None and i > idx.main_line
+            open_pair = MarkerPair(tag, i, -1, in_main, l[: len(l) - len(l.lstrip())])
+            continue
+
+        if open_pair is None:
+            raise ValueError(f"Line {i + 1}: //`{tag}- without matching //`{tag}+")
+        if open_pair.tag != tag:
+            raise ValueError(
+                f"Line {i + 1}: //`{tag}- closes //`{open_pair.tag}+ block opened at line {open_pair.start + 1}"
+            )
+        open_pair.end = i
+        idx.pairs.setdefault(tag, []).append(open_pair)
+        open_pair = None
+
+    if open_pair is not None:
+        raise ValueError(f"Line {open_pair.start + 1}: //`{open_pair.tag}+ without matching //`{open_pair.tag}-")
+    return idx
+
+
+def _section_block(tag: str, content: str, marker: str) -> List[str]:
+    """Lines replacing the interior of the //`X+ line `marker`; they end like the marker line (CRLF skeletons stay CRLF)."""
+    if not content.strip():
+        return []
+    eol = "\r\n" if marker.endswith("\r\n") else "\n"
+    if tag in ("I", "L"):
+        # indent with the same leading whitespace as the marker line
+        indent = marker[: len(marker) - len(marker.lstrip())]
+        block: List[str] = []
+        for ln in content.rstrip("\n").split("\n"):
+            if ln.strip():
+                block.append(indent + ln.lstrip() + eol)
+            else:
+                block.append(eol)
+        return block
+    return [ln + eol for ln in content.rstrip("\n").split("\n")]
+
+
+@_instrumented("fill")
 def fill_c_skeleton(c_text: str, sections: Dict[str, str]) -> str:
     lines = c_text.splitlines(keepends=True)
+    idx = index_markers(lines)
+
+    targets: List[Tuple[MarkerPair, str]] = []
+    for tag in _SECTION_TAGS:
+        pair = idx.target(tag)
+        if pair is not None:
+            targets.append((pair, tag))
+    if sections.get("L", "").strip():
+        pair = idx.loop_target()
+        if pair is None:
+            raise ValueError("The project has a work part, but the C file has no //`C+ ... //`C- block inside main()")
+        targets.append((pair, "L"))
+    targets.sort(key=lambda t: t[0].start)
+
+    # one output pass: untouched spans are copied, marker interiors replaced
+    out: List[str] = []
+    pos = 0
+    for p, key in targets:
+        out.extend(lines[pos: p.start + 1])
+        out.extend(_section_block(key, sections.get(key, ""), lines[p.start]))
+        pos = p.end
+    out.extend(lines[pos:])
 
-    main_idx: Optional[int] = None
-    for i, l in enumerate(lines):
-        if re.search(r'\bint\s+main\s*\(', l):
-            main_idx = i
-            break
+    return "".join(out)
 
-    out_lines = lines[:]
 
-    # order matters a bit (but not critical)
-    for tag in ["V", "P", "D", "H", "C", "I"]:
-        content = sections.get(tag, "")
-        pairs = _find_marker_pairs(out_lines, tag)
-        if not pairs:
+@_instrumented("fill", lambda r, *a, **kw: {"c_lines_scanned": r["lines"], "markers_found": r["markers"]})
+def fill_c_stream(src: Iterable[str], dst: TextIO, sections: Dict[str, str]) -> Dict[str, int]:
+    """
+    Streaming fill_c_skeleton(): lines are copied from src to dst as they are
+    read and each section is injected at the first //`X+ ... //`X- pair of its
+    tag (the same pair fill_c_skeleton() picks: if a //`C pair exists before
+    main() it is necessarily the first one); the loop body (L) goes to the next
+    //`C pair inside main(). Memory does not depend on input
+    size. Marker errors raise ValueError after part of the output was written,
+    so write to a temp file (see _atomic_text_output) when that matters.
+    """
+    open_tag: Optional[str] = None
+    open_line = 0
+    skipping = False
+    done: set = set()
+    in_main = False
+    loop = sections.get("L", "")
+    n = 0
+    markers = 0
+
+    for n, l in enumerate(src, 1):
+        m = _MARKER_RE.match(l) if "//`" in l else None
+        if m is None:
+            if not in_main and "main" in l and _MAIN_RE.search(l):
+                in_main = True
+            if not skipping:
+                dst.write(l)
+            continue
+        markers += 1
+        tag, sign = m.group(1), m.group(2)
+
+        if sign == "+":
+            if open_tag is not None:
+                raise ValueError(f"Line {n}: //`{tag}+ inside //`{open_tag}+ block opened at line {open_line}")
+            open_tag, open_line = tag, n
+            dst.write(l)
+            key = tag
+            if tag == "C" and "C" in done and in_main and loop.strip():
+                key = "L"
+            if key not in done:
+                done.add(key)
+                skipping = True
+                dst.writelines(_section_block(key, sections.get(key, ""), l))
+            continue
+
+        if open_tag is None:
+            raise ValueError(f"Line {n}: //`{tag}- without matching //`{tag}+")
+        if open_tag != tag:
+            raise ValueError(f"Line {n}: //`{tag}- closes //`{open_tag}+ block opened at line {open_line}")
+        open_tag = None
+        skipping = False
+        dst.write(l)
+
+    if open_tag is not None:
+        raise ValueError(f"Line {open_line}: //`{open_tag}+ without matching //`{open_tag}-")
+    if loop.strip() and "L" not in done:
+        raise ValueError("The project has a work part, but the C file has no //`C+ ... //`C- block inside main()")
+    return {"lines": n, "markers": markers}
+
+
+@contextlib.contextmanager
+def _atomic_text_output(path: str):
+    """
+    Text file written next to `path` and renamed over it only if the block
+    succeeds and the content differs from the current file (mtime is kept
+    for unchanged output, so make/ccache do not rebuild).
+    """
+    import filecmp
+    import tempfile
+
+    d = os.path.dirname(os.path.abspath(path))
+    fd, tmp = tempfile.mkstemp(dir=d, prefix=os.path.basename(path) + ".", suffix=".tmp")
+    try:
+        try:
+            mode = os.stat(path).st_mode & 0o777
+        except OSError:
+            umask = os.umask(0)
+            os.umask(umask)
+            mode = 0o666 & ~umask
+        os.fchmod(fd, mode)
+        with os.fdopen(fd, "w", encoding="utf-8", newline="\n") as f:
+            yield f
+        if os.path.exists(path) and filecmp.cmp(tmp, path, shallow=False):
+            os.unlink(tmp)
+        else:
+            os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+
+
+# =========================
+# Parameter matrix
+# =========================
+
+def _parse_filter(spec: str, template: Template) -> Dict[str, List[str]]:
+    """'@USART=USART0|USART1,@USART_LOCATION=...' -> {'@USART': ['USART0', 'USART1'], ...}"""
+    out: Dict[str, List[str]] = {}
+    for item in spec.split(","):
+        if not item.strip():
+            continue
+        name, sep, vals = item.partition("=")
+        name = name.strip()
+        if not sep or name not in template.params:
+            raise ValueError(f"Bad filter '{item}': expected @PARAM=V1|V2 with a $S parameter of the template")
+        values = [v.strip() for v in vals.split("|") if v.strip()]
+        unknown = [v for v in values if v not in template.params[name].values]
+        if unknown:
+            raise ValueError(f"Bad filter '{item}': {', '.join(unknown)} not in {name} values")
+        out[name] = values
+    return out
+
+
+def matrix_combinations(
+    template: Template,
+    include: Optional[List[str]] = None,
+    exclude: Optional[List[str]] = None,
+):
+    """
+    Lazily yield every selection of the $S enum values (cartesian product).
+      include: restrict parameters to the listed values ('@P=V1|V2', ...)
+      exclude: drop selections matching all pairs of any one spec
+    """
+    axes: Dict[str, List[str]] = {n: list(p.values) for n, p in template.params.items() if p.values}
+    for spec in include or []:
+        axes.update(_parse_filter(spec, template))
+    excl = [_parse_filter(spec, template) for spec in exclude or []]
+    names = list(axes)
+
+    def gen():
+        for values in itertools.product(*(axes[n] for n in names)):
+            sel = dict(zip(names, values))
+            if any(all(sel[n] in vs for n, vs in f.items()) for f in excl):
+                continue
+            yield sel
+
+    return gen()
+
+
+_matrix_state: Dict[str, object] = {}
+
+
+def _matrix_init(template_text: str, skeleton_text: str, out_dir: str, generated: str) -> None:
+    tpl = parse_template(template_text)
+    _matrix_state.update(plan=RenderPlan(tpl), skeleton=skeleton_text, out_dir=out_dir, generated=generated)
+
+
+def _matrix_job(
+    batch: List[Tuple[int, Dict[str, str]]],
+) -> List[Tuple[int, Dict[str, str], Optional[str], Optional[str], int, bool, Optional[str]]]:
+    """
+    Render+fill a batch of selections into the same C a --template run writes
+    (P section included); files are content-addressed. Each result also carries
+    a hash of the sections other than P, which groups selections that generate
+    the same program. A selection that fails to render (ValueError,
+    e.g. a baud setting out of tolerance) gets no file and its error message instead.
+    """
+    import tempfile
+
+    plan: RenderPlan = _matrix_state["plan"]  # type: ignore[assignment]
+    out_dir: str = _matrix_state["out_dir"]  # type: ignore[assignment]
+    skeleton: str = _matrix_state["skeleton"]  # type: ignore[assignment]
+    results = []
+    for index, sel in batch:
+        try:
+            sections = plan.render(sel, generated=_matrix_state["generated"])  # type: ignore[arg-type]
+            data = fill_c_skeleton(skeleton, sections).encode("utf-8")
+        except ValueError as e:
+            results.append((index, sel, None, None, 0, False, str(e)))
             continue
+        code_digest = _sha256_text("\0".join(f"{k}\0{v}" for k, v in sorted(sections.items()) if k != "P"))[:16]
+        digest = hashlib.sha256(data).hexdigest()
+        name = f"{digest[:16]}.c"
+        path = os.path.join(out_dir, name)
+        created = False
+        if not os.path.exists(path):
+            fd, tmp = tempfile.mkstemp(dir=out_dir, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    f.write(data)
+                os.replace(tmp, path)
+            finally:
+                if os.path.exists(tmp):
+                    os.unlink(tmp)
+            created = True
+        results.append((index, sel, name, code_digest, len(data), created, None))
+    return results
+
+
+def run_matrix(
+    template_text: str,
+    skeleton_text: str,
+    out_dir: str,
+    *,
+    include: Optional[List[str]] = None,
+    exclude: Optional[List[str]] = None,
+    workers: Optional[int] = None,
+    batch_size: int = 32,
+    generated: Optional[str] = None,
+) -> Dict[str, object]:
+    """
+    Generate C for every parameter combination in parallel and write
+    out_dir/manifest.json mapping each combination to its file and to the hash
+    of its code without the P section ("code": equal for combinations that
+    generate the same program). Combinations that fail to render are listed
+    with "file": null and their
+    "error"; the manifest is written either way. Only a bounded number of
+    batches is in flight; outputs go straight to disk.
+    """
+    from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+    tpl = parse_template(template_text)
+    combos = matrix_combinations(tpl, include, exclude)  # filters are validated here, before the pool starts
+    os.makedirs(out_dir, exist_ok=True)
+    generated = generated or _dt.datetime.now().isoformat(timespec='seconds')
+
+    entries: List[Tuple[int, Dict[str, str], Optional[str], Optional[str], Optional[str]]] = []
+    files: Dict[str, int] = {}
+
+    def collect(done) -> None:
+        for fut in done:
+            for index, sel, name, code, size, _created, error in fut.result():
+                entries.append((index, sel, name, code, error))
+                if name is not None:
+                    files[name] = size
+
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers, initializer=_matrix_init,
+                             initargs=(template_text, skeleton_text, out_dir, generated)) as pool:
+        window = 4 * workers
+        inflight: set = set()
+        numbered = enumerate(combos)
+        while True:
+            batch = list(itertools.islice(numbered, batch_size))
+            if not batch:
+                break
+            inflight.add(pool.submit(_matrix_job, batch))
+            if len(inflight) >= window:
+                done, inflight = wait(inflight, return_when=FIRST_COMPLETED)
+                collect(done)
+        collect(wait(inflight)[0])
+
+    entries.sort(key=lambda e: e[0])
+    manifest = {
+        "template": tpl.name,
+        "template_version": tpl.version,
+        "params": list(tpl.params),
+        "combinations": [
+            {"params": sel, "file": name, "code": code, **({"error": error} if error is not None else {})}
+            for _i, sel, name, code, error in entries
+        ],
+        "files": files,
+    }
+    tmp = os.path.join(out_dir, "manifest.json.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1)
+    os.replace(tmp, os.path.join(out_dir, "manifest.json"))
+    failed = [{"params": sel, "error": error} for _i, sel, _name, _code, error in entries if error is not None]
+    codes = {code for _i, _sel, _name, code, _error in entries if code is not None}
+    return {"combinations": len(entries), "unique_files": len(files), "unique_code": len(codes), "failed": failed}
+
+
+# =========================
+# Batch build (--batch)
+# =========================
+
+# Manifest (JSON, paths relative to the manifest file):
+#   {"jobs": [{"template": "usart.tpl", "project": "a/project.ud", "c_in": "a/main.c",
+#              "c_out": "a/main_gen.c", "instance": null, "all_instances": false}, ...]}
+# or a glob of project files; each matching dir then provides <dir>/*.tpl (or --template),
+# <dir>/main.c and <dir>/main_gen.c.
+# The state file maps every c_out to the sha256 of its inputs and output; a job is
+# skipped while it still reads the same input paths and all hashes still match.
+
+BATCH_STATE_VERSION = 1
 
-        # choose pair: for C we want the one before main() (because inside while() there may be another //`C+)
-        if tag == "C" and main_idx is not None:
-            before_main = [p for p in pairs if p[0] < main_idx]
-            s, e = before_main[0] if before_main else pairs[0]
+
+@dataclass
+class BatchJob:
+    template: str
+    project: str
+    c_in: str
+    c_out: str
+    instance: Optional[str] = None
+    all_instances: bool = False
+
+
+def load_batch_jobs(spec: str, template: Optional[str] = None) -> List[BatchJob]:
+    """Jobs from a JSON manifest or from a glob of project files."""
+    import glob
+
+    if spec.endswith(".json") and os.path.isfile(spec):
+        with open(spec, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        base = os.path.dirname(os.path.abspath(spec))
+        jobs = []
+        for i, d in enumerate(data["jobs"] if isinstance(data, dict) else data):
+            try:
+                paths = {k: os.path.join(base, d[k]) for k in ("template", "project", "c_in", "c_out")}
+            except KeyError as e:
+                raise ValueError(f"{spec}: job {i} has no {e.args[0]!r}") from None
+            if template:
+                paths["template"] = template
+            jobs.append(BatchJob(instance=d.get("instance"), all_instances=bool(d.get("all_instances")), **paths))
+        return jobs
+
+    jobs = []
+    for project in sorted(glob.glob(spec, recursive=True)):
+        d = os.path.dirname(project)
+        tpl = template
+        if not tpl:
+            found = sorted(glob.glob(os.path.join(glob.escape(d), "*.tpl")))
+            if len(found) != 1:
+                raise ValueError(f"{d or '.'}: expected exactly one *.tpl (found {len(found)}), use --template")
+            tpl = found[0]
+        jobs.append(BatchJob(tpl, project, os.path.join(d, "main.c"), os.path.join(d, "main_gen.c")))
+    if not jobs:
+        raise ValueError(f"no projects match {spec!r}")
+    return jobs
+
+
+def _sha256_file(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 16), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _sha256_text(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+_batch_state: Dict[str, object] = {}
+
+
+def _batch_init(templates: Dict[str, str], reproducible: bool) -> None:
+    _batch_state.update(templates=templates, plans={}, reproducible=reproducible)
+
+
+def _batch_job(job: BatchJob, tpl_sha: str) -> dict:
+    """Render one project in a worker; templates are parsed once per worker and shared by sha."""
+    t0 = time.perf_counter()
+    plans: Dict[str, Tuple[Template, Renderer]] = _batch_state["plans"]  # type: ignore[assignment]
+    plan_hit = tpl_sha in plans
+    try:
+        if not plan_hit:
+            tpl = parse_template(_batch_state["templates"][tpl_sha])  # type: ignore[index]
+            plans[tpl_sha] = (tpl, Renderer(tpl))
+        tpl, plan = plans[tpl_sha]
+        project_text = _read_text(job.project)
+        skeleton = _read_text(job.c_in)
+        generated = None
+        if _batch_state["reproducible"]:
+            generated = reproducible_stamp(_batch_state["templates"][tpl_sha], project_text)  # type: ignore[index]
+        sec = render_project(tpl, project_text, instance=job.instance, all_instances=job.all_instances,
+                             plan=plan, generated=generated)
+        out = fill_c_skeleton(skeleton, sec)
+        written = _write_if_changed(job.c_out, out)
+    except (OSError, ValueError) as e:
+        return {"ok": False, "error": f"{type(e).__name__}: {e}", "ms": (time.perf_counter() - t0) * 1000.0}
+    return {
+        "ok": True,
+        "inputs": {
+            os.path.abspath(job.template): tpl_sha,
+            os.path.abspath(job.project): _sha256_text(project_text),
+            os.path.abspath(job.c_in): _sha256_text(skeleton),
+        },
+        "output": _sha256_text(out),
+        "written": written,
+        "plan_cached": plan_hit,
+        "ms": (time.perf_counter() - t0) * 1000.0,
+    }
+
+
+def _batch_options(job: BatchJob, reproducible: bool) -> dict:
+    return {"instance": job.instance, "all_instances": job.all_instances, "reproducible": reproducible}
+
+
+def run_batch(
+    jobs: List[BatchJob],
+    state_path: str,
+    *,
+    workers: Optional[int] = None,
+    reproducible: bool = False,
+    force: bool = False,
+    report: Callable[[BatchJob, dict], None] = lambda job, res: None,
+) -> Dict[str, int]:
+    """
+    Run fill jobs across a process pool (workers=0: in-process), skipping jobs
+    whose input hashes, options and output match the state file. `report` is
+    called once per job with its result ({"skipped": True} for unchanged jobs).
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    try:
+        with open(state_path, "r", encoding="utf-8") as f:
+            state = json.load(f)
+        if state.get("version") != BATCH_STATE_VERSION:
+            state = {}
+    except (OSError, ValueError):
+        state = {}
+    entries: Dict[str, dict] = state.get("jobs", {})
+
+    hashes: Dict[str, Optional[str]] = {}
+
+    def file_hash(path: str) -> Optional[str]:
+        if path not in hashes:
+            try:
+                hashes[path] = _sha256_file(path)
+            except OSError:
+                hashes[path] = None
+        return hashes[path]
+
+    templates: Dict[str, str] = {}
+    todo: List[Tuple[BatchJob, str]] = []
+    counts = {"jobs": len(jobs), "rendered": 0, "written": 0, "skipped": 0, "failed": 0, "plan_hits": 0}
+    for job in jobs:
+        key = os.path.abspath(job.c_out)
+        prev = entries.get(key)
+        if (not force and prev is not None
+                and prev["options"] == _batch_options(job, reproducible)
+                and set(prev["inputs"]) == {os.path.abspath(p) for p in (job.template, job.project, job.c_in)}
+                and all(file_hash(p) == h for p, h in prev["inputs"].items())
+                and file_hash(job.c_out) == prev["output"]):
+            counts["skipped"] += 1
+            report(job, {"ok": True, "skipped": True})
+            continue
+        try:
+            tpl_text = _read_text(job.template)
+        except OSError as e:
+            entries.pop(key, None)
+            counts["failed"] += 1
+            report(job, {"ok": False, "error": f"{type(e).__name__}: {e}", "ms": 0.0})
+            continue
+        sha = _sha256_text(tpl_text)
+        templates[sha] = tpl_text
+        todo.append((job, sha))
+
+    if todo:
+        if workers is None:
+            workers = os.cpu_count() or 1
+        if workers == 0:
+            _batch_init(templates, reproducible)
+            pool: Executor = _inline_executor()
         else:
-            s, e = pairs[0]
+            pool = ProcessPoolExecutor(max_workers=min(workers, len(todo)), initializer=_batch_init,
+                                       initargs=(templates, reproducible))
+        with pool:
+            futures = {pool.submit(_batch_job, job, sha): job for job, sha in todo}
+            for fut in futures:
+                job = futures[fut]
+                res = fut.result()
+                key = os.path.abspath(job.c_out)
+                if res["ok"]:
+                    counts["rendered"] += 1
+                    counts["written"] += res["written"]
+                    counts["plan_hits"] += res["plan_cached"]
+                    entries[key] = {"inputs": res["inputs"], "options": _batch_options(job, reproducible),
+                                    "output": res["output"], "ms": round(res["ms"], 3)}
+                else:
+                    entries.pop(key, None)  # retried next run
+                    counts["failed"] += 1
+                report(job, res)
+
+    tmp = state_path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"version": BATCH_STATE_VERSION, "jobs": entries}, f, ensure_ascii=False, indent=1, sort_keys=True)
+    os.replace(tmp, state_path)
+    return counts
+
 
-        if not content.strip():
-            new_block: List[str] = []
+# =========================
+# Incremental pipeline / watch mode
+# =========================
+
+class FillSession:
+    """
+    In-memory generation pipeline that recomputes only the stages whose input changed:
+
+      template text -> Template + RenderPlan
+      project text  -> selected params + work part
+      selection     -> rendered sections (work part compiled in)
+      C skeleton    -> filled C (reuses the rendered sections)
+    """
+
+    def __init__(self, *, instance: Optional[str] = None, all_instances: bool = False,
+                 cache: Optional[TemplateCache] = None, reproducible: bool = False):
+        self.instance = instance
+        self.all_instances = all_instances
+        self.cache = cache
+        self.reproducible = reproducible
+        self._stamp: Optional[str] = None
+
+        self.template: Optional[Template] = None
+        self.plan: Optional[RenderPlan] = None
+        self._template_text: Optional[str] = None
+        self._project_text: Optional[str] = None
+        self._skeleton_text: Optional[str] = None
+
+        self._project_dirty = True
+        self._project: Optional[ProjectModel] = None
+        self._selection: object = None
+        self._work: Optional[List[WorkSend]] = None
+        self.sections: Optional[Dict[str, str]] = None
+        self._output: Optional[str] = None
+        self.last_stages: List[str] = []
+
+    def set_template(self, text: str) -> bool:
+        if text == self._template_text:
+            return False
+        self.template = load_template(text, self.cache)
+        self.plan = RenderPlan(self.template)
+        self._template_text = text
+        self._project_dirty = True
+        self._selection = None
+        self.sections = None
+        self.last_stages.append("template")
+        return True
+
+    def set_project(self, text: str) -> bool:
+        if text == self._project_text:
+            return False
+        self._project_text = text
+        self._project_dirty = True
+        return True
+
+    def set_skeleton(self, text: str) -> bool:
+        if text == self._skeleton_text:
+            return False
+        self._skeleton_text = text
+        self._output = None
+        return True
+
+    def output(self) -> str:
+        if self.template is None or self._project_text is None or self._skeleton_text is None:
+            raise ValueError("FillSession needs template, project and skeleton text")
+
+        if self._project_dirty:
+            project = ProjectModel(self._project_text)
+            sel = _project_selection(project, self.template, self.instance, self.all_instances)
+            work = project.work()
+            self._project = project
+            self._project_dirty = False
+            self.last_stages.append("select")
+            if sel != self._selection or work != self._work:
+                self._selection = sel
+                self._work = work
+                self.sections = None
+            if self.reproducible:
+                stamp = reproducible_stamp(self._template_text or "", self._project_text)
+                if stamp != self._stamp:
+                    self._stamp = stamp
+                    self.sections = None
+
+        if self.sections is None:
+            assert self.plan is not None and self._project is not None
+            name, sel = self._selection  # type: ignore[misc]
+            self.sections = _render_selection(self.template, self._project, name, sel, self.plan, self._stamp)
+            self._output = None
+            self.last_stages.append("render")
+
+        if self._output is None:
+            self._output = fill_c_skeleton(self._skeleton_text, self.sections)
+            self.last_stages.append("fill")
+
+        return self._output
+
+
+class _PollWatcher:
+    """Portable fallback: compare (mtime_ns, size) of every path each interval."""
+
+    def __init__(self, paths: List[str], interval: float):
+        self.paths = [os.path.abspath(p) for p in paths]
+        self.interval = interval
+        self._state = {p: self._stat(p) for p in self.paths}
+
+    @staticmethod
+    def _stat(path: str) -> Optional[Tuple[int, int]]:
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def wait(self) -> List[str]:
+        while True:
+            time.sleep(self.interval)
+            changed = []
+            for p in self.paths:
+                cur = self._stat(p)
+                if cur != self._state[p]:
+                    self._state[p] = cur
+                    changed.append(p)
+            if changed:
+                return changed
+
+    def close(self) -> None:
+        pass
+
+
+class _InotifyWatcher:
+    """
+    Linux inotify through libc (no third-party modules).
+    Parent directories are watched, so editors that save via rename are seen too.
+    """
+
+    _IN_CLOSE_WRITE = 0x00000008
+    _IN_MOVED_TO = 0x00000080
+    _IN_CREATE = 0x00000100
+    _IN_CLOEXEC = 0o2000000
+    _SETTLE = 0.003  # coalesce the burst of events a single save produces
+
+    def __init__(self, paths: List[str]):
+        import ctypes
+        import ctypes.util
+        import struct
+
+        self._event = struct.Struct("iIII")
+
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = libc.inotify_init1(self._IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+        mask = self._IN_CLOSE_WRITE | self._IN_MOVED_TO | self._IN_CREATE
+        self._wd_dir: Dict[int, str] = {}
+        self._targets = {os.path.abspath(p) for p in paths}
+        for d in {os.path.dirname(p) for p in self._targets}:
+            wd = libc.inotify_add_watch(self.fd, os.fsencode(d), mask)
+            if wd < 0:
+                os.close(self.fd)
+                raise OSError(ctypes.get_errno(), f"inotify_add_watch failed for {d}")
+            self._wd_dir[wd] = d
+
+    def _drain(self, changed: set) -> None:
+        buf = os.read(self.fd, 65536)
+        off = 0
+        while off + self._event.size <= len(buf):
+            wd, _mask, _cookie, name_len = self._event.unpack_from(buf, off)
+            off += self._event.size
+            name = buf[off: off + name_len].split(b"\0", 1)[0]
+            off += name_len
+            d = self._wd_dir.get(wd)
+            if d is not None and name:
+                path = os.path.join(d, os.fsdecode(name))
+                if path in self._targets:
+                    changed.add(path)
+
+    def wait(self) -> List[str]:
+        import select
+
+        changed: set = set()
+        while not changed:
+            select.select([self.fd], [], [])
+            self._drain(changed)
+        while select.select([self.fd], [], [], self._SETTLE)[0]:
+            self._drain(changed)
+        return sorted(changed)
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+
+def _make_watcher(paths: List[str], poll_interval: float, force_poll: bool = False):
+    if not force_poll and sys.platform.startswith("linux"):
+        try:
+            return _InotifyWatcher(paths)
+        except OSError:
+            pass
+    return _PollWatcher(paths, poll_interval)
+
+
+# =========================
+# Generation server (newline-delimited JSON)
+# =========================
+#
+# Request  (one JSON object per line):
+#   {"id": 1, "template": "<text>" | "template_path": "usart.tpl",
+#    "project": "<text>", "skeleton": "<C text>", "instance": "MyPORT", "all_instances": false}
+# Response (one JSON object per line, possibly out of order - match by "id"):
+#   {"id": 1, "ok": true, "sections": {"V": ..., ...}, "c": "<filled C or null>", "ms": 0.42}
+#   {"id": 1, "ok": false, "error": "ValueError: ..."}
+
+_SERVER_PLANS_MAX = 64
+_server_plans: "OrderedDict[str, Tuple[Template, Renderer]]" = OrderedDict()
+_server_cache: Optional[TemplateCache] = None
+
+
+def _server_init(cache_dir: Optional[str], use_cache: bool) -> None:
+    global _server_cache
+    _server_cache = TemplateCache(cache_dir) if use_cache else None
+
+
+def _server_plan(text: str) -> Tuple[Template, Renderer]:
+    key = hashlib.sha256(text.encode("utf-8")).hexdigest()
+    hit = _server_plans.get(key)
+    if hit is not None:
+        _server_plans.move_to_end(key)
+        return hit
+    tpl = load_template(text, _server_cache)
+    entry = (tpl, Renderer(tpl))
+    _server_plans[key] = entry
+    if len(_server_plans) > _SERVER_PLANS_MAX:
+        _server_plans.popitem(last=False)
+    return entry
+
+
+def serve_request(req: dict) -> dict:
+    """Handle one generation request; never raises for bad input."""
+    t0 = time.perf_counter()
+    rid = req.get("id") if isinstance(req, dict) else None
+    try:
+        if not isinstance(req, dict):
+            raise ValueError("request must be a JSON object")
+        for key in ("template", "template_path", "project", "skeleton", "instance"):
+            if req.get(key) is not None and not isinstance(req[key], str):
+                raise ValueError(f"'{key}' must be a string, got {type(req[key]).__name__}")
+        text = req.get("template")
+        if text is None:
+            path = req.get("template_path")
+            if not path:
+                raise ValueError("request needs 'template' or 'template_path'")
+            text = _read_text(path)
+        project = req.get("project")
+        if project is None:
+            raise ValueError("request needs 'project' text")
+
+        tpl, plan = _server_plan(text)
+        sections = render_project(tpl, project, instance=req.get("instance"),
+                                  all_instances=bool(req.get("all_instances")), plan=plan)
+
+        skeleton = req.get("skeleton")
+        c_text = fill_c_skeleton(skeleton, sections) if skeleton is not None else None
+        return {"id": rid, "ok": True, "sections": sections, "c": c_text,
+                "ms": round((time.perf_counter() - t0) * 1000.0, 3)}
+    except Exception as e:  # a bug hit by one request must not end the stream
+        return {"id": rid, "ok": False, "error": f"{type(e).__name__}: {e}"}
+
+
+def _inline_executor() -> Executor:
+    """--workers 0: run requests in the reading thread."""
+    from concurrent.futures import Executor, Future
+
+    class _InlineExecutor(Executor):
+        def submit(self, fn, *args, **kwargs):  # type: ignore[override]
+            fut: Future = Future()
+            fut.set_result(fn(*args, **kwargs))
+            return fut
+
+    return _InlineExecutor()
+
+
+def _serve_stream(rfile, wfile, pool: Executor) -> None:
+    """Read NDJSON requests from rfile, write responses to wfile as they complete."""
+    from concurrent.futures import BrokenExecutor, wait
+
+    lock = threading.Lock()
+    pending: List[Future] = []
+
+    def send(resp: dict) -> None:
+        data = (json.dumps(resp, ensure_ascii=False) + "\n").encode("utf-8")
+        with lock:
+            wfile.write(data)
+            wfile.flush()
+
+    def reply(fut: Future, rid: object) -> None:
+        # serve_request() never raises, but the pool can (e.g. BrokenProcessPool when a worker dies)
+        exc = fut.exception()
+        if exc is not None:
+            send({"id": rid, "ok": False, "error": f"{type(exc).__name__}: {exc}"})
         else:
-            if tag == "I":
-                # indent with the same leading whitespace as the marker line
-                indent = re.match(r'^(\s*)', out_lines[s]).group(1)
-                new_block = []
-                for ln in content.rstrip("\n").split("\n"):
-                    if ln.strip():
-                        new_block.append(indent + ln.lstrip() + "\n")
-                    else:
-                        new_block.append("\n")
-            else:
-                new_block = [ln + "\n" for ln in content.rstrip("\n").split("\n")]
+            send(fut.result())
+
+    for raw in rfile:
+        if not raw.strip():
+            continue
+        try:
+            req = json.loads(raw)
+        except ValueError as e:
+            send({"id": None, "ok": False, "error": f"bad JSON: {e}"})
+            continue
+        rid = req.get("id") if isinstance(req, dict) else None
+        try:
+            fut = pool.submit(serve_request, req)
+        except (BrokenExecutor, RuntimeError) as e:  # pool broken or shut down: later requests fail too
+            send({"id": rid, "ok": False, "error": f"{type(e).__name__}: {e}"})
+            continue
+        fut.add_done_callback(lambda f, rid=rid: reply(f, rid))
+        pending.append(fut)
+        pending = [f for f in pending if not f.done()]
 
-        out_lines = out_lines[: s + 1] + new_block + out_lines[e:]
+    wait(pending)
 
-    return "".join(out_lines)
+
+def serve(*, socket_path: Optional[str] = None, workers: Optional[int] = None,
+          cache_dir: Optional[str] = None, use_cache: bool = True) -> int:
+    """
+    Long-lived generator: NDJSON on stdin/stdout, or on a Unix socket (one
+    request stream per connection). Requests run on a process pool whose
+    workers keep parsed templates and render plans in memory.
+    """
+    import signal
+    import socketserver
+    from concurrent.futures import ProcessPoolExecutor
+
+    _server_init(cache_dir, use_cache)
+    if workers == 0:
+        pool: Executor = _inline_executor()
+    else:
+        pool = ProcessPoolExecutor(max_workers=workers, initializer=_server_init, initargs=(cache_dir, use_cache))
+
+    try:
+        if socket_path is None:
+            _serve_stream(sys.stdin.buffer, sys.stdout.buffer, pool)
+            return 0
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self) -> None:
+                _serve_stream(self.rfile, self.wfile, pool)
+
+        def _interrupt(signum, frame):
+            raise KeyboardInterrupt
+
+        signal.signal(signal.SIGTERM, _interrupt)  # service stop: remove the socket file too
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        with socketserver.ThreadingUnixStreamServer(socket_path, Handler) as srv:
+            srv.daemon_threads = True
+            print(f"[serve] listening on {socket_path}", file=sys.stderr)
+            try:
+                srv.serve_forever()
+            except KeyboardInterrupt:
+                pass
+            finally:
+                os.unlink(socket_path)
+        return 0
+    finally:
+        pool.shutdown()
 
 
 # =========================
 # CLI
 # =========================
 
+@_instrumented("read", lambda text, path: {"bytes_read": len(text.encode("utf-8"))})
 def _read_text(path: str) -> str:
-    with open(path, "r", encoding="utf-8") as f:
+    # newline="": CRLF skeletons are filled as CRLF; the template and project parsers split any line ending
+    with open(path, "r", encoding="utf-8", newline="") as f:
         return f.read()
 
 
+@_instrumented("write", lambda r, path, text: {"bytes_written": len(text.encode("utf-8"))})
 def _write_text(path: str, text: str) -> None:
     with open(path, "w", encoding="utf-8", newline="\n") as f:
         f.write(text)
 
 
+def _write_if_changed(path: str, text: str) -> bool:
+    """Write only when the file content differs; returns True if written."""
+    try:
+        with open(path, "r", encoding="utf-8", newline="") as f:
+            if f.read() == text:
+                return False
+    except (OSError, UnicodeDecodeError):
+        pass
+    _write_text(path, text)
+    return True
+
+
+def _make_escape(path: str) -> str:
+    return path.replace("\\", "\\\\").replace(" ", "\\ ").replace("#", "\\#").replace("$", "$$")
+
+
+def write_depfile(path: str, target: str, deps: List[str]) -> bool:
+    """
+    make-style dependency file (like gcc -MD -MP): `target: deps...` plus an
+    empty rule per dependency so a deleted input does not break the build.
+    Written only if changed.
+    """
+    deps = list(dict.fromkeys(deps))
+    lines = [f"{_make_escape(target)}:" + "".join(f" \\\n  {_make_escape(d)}" for d in deps), ""]
+    for d in deps:
+        lines.append(f"{_make_escape(d)}:")
+        lines.append("")
+    return _write_if_changed(path, "\n".join(lines))
+
+
+def _watch(args: argparse.Namespace, cache: Optional[TemplateCache]) -> int:
+    session = FillSession(instance=args.instance, all_instances=args.all_instances, cache=cache,
+                          reproducible=args.reproducible)
+    inputs = {
+        os.path.abspath(args.template): session.set_template,
+        os.path.abspath(args.project): session.set_project,
+        os.path.abspath(args.c_in): session.set_skeleton,
+    }
+
+    def regenerate(paths: List[str]) -> None:
+        t0 = time.perf_counter()
+        session.last_stages = []
+        try:
+            for p in paths:
+                inputs[p](_read_text(p))
+            out = session.output()
+        except (OSError, ValueError) as e:
+            print(f"[watch] error: {e}", file=sys.stderr)
+            return
+        wrote = _write_if_changed(args.c_out, out)
+        dt_ms = (time.perf_counter() - t0) * 1000.0
+        stages = ",".join(session.last_stages) or "-"
+        state = "written" if wrote else "unchanged"
+        print(f"[watch] {stages}: {args.c_out} {state} in {dt_ms:.2f} ms", file=sys.stderr)
+
+    regenerate(sorted(inputs))
+
+    watcher = _make_watcher(list(inputs), args.poll_interval, args.poll)
+    print(f"[watch] {type(watcher).__name__.strip('_')} on {len(inputs)} files, Ctrl+C to stop", file=sys.stderr)
+    try:
+        while True:
+            regenerate(watcher.wait())
+    except KeyboardInterrupt:
+        return 0
+    finally:
+        watcher.close()
+
+
 def main(argv: Optional[List[str]] = None) -> int:
     ap = argparse.ArgumentParser(description="UartDebug template -> C filler")
-    ap.add_argument("--template", required=True, help="Path to process template file")
-    ap.add_argument("--project", required=True, help="Path to project file (window-project text)")
-    ap.add_argument("--c-in", required=True, help="Path to input C file with markup markers")
-    ap.add_argument("--c-out", required=True, help="Path to output C file")
+    ap.add_argument("--template", help="Path to process template file")
+    ap.add_argument("--template-dir", default=None, help="Template library: pick the template of each project instance by its type ($N aliases)")
+    ap.add_argument("--project", help="Path to project file (window-project text)")
+    ap.add_argument("--c-in", help="Path to input C file with markup markers ('-' = stdin)")
+    ap.add_argument("--c-out", help="Path to output C file ('-' = stdout)")
     ap.add_argument("--instance", default=None, help="Instance name (e.g., MyPORT). If omitted, first matching by aliases is used.")
+    ap.add_argument("--all-instances", action="store_true", help="Render every instance matching template aliases (symbols prefixed by instance name)")
     ap.add_argument("--dump", action="store_true", help="Print rendered sections to stdout (debug)")
+    ap.add_argument("--no-cache", action="store_true", help="Always parse the template, do not use the on-disk template cache")
+    ap.add_argument("--cache-dir", default=None, help="Parsed template cache directory (default: $UD_TEMPLATE_CACHE_DIR or ~/.cache/uartdebug/templates)")
+
+    ap.add_argument("--watch", action="store_true", help="Keep running and regenerate when template/project/C input changes")
+    ap.add_argument("--poll", action="store_true", help="With --watch: use mtime polling instead of inotify")
+    ap.add_argument("--poll-interval", type=float, default=0.1, help="With --watch: polling interval in seconds (default 0.1)")
+    ap.add_argument("--serve", action="store_true", help="Run as a generation server: NDJSON requests on stdin, responses on stdout")
+    ap.add_argument("--socket", default=None, help="With --serve: listen on this Unix socket instead of stdin/stdout")
+    ap.add_argument("--workers", type=int, default=None, help="With --serve/--matrix/--batch: worker processes (default: CPU count, 0 = in-process for --serve)")
+
+    ap.add_argument("--matrix", default=None, metavar="OUT_DIR", help="Generate C for every $S value combination into OUT_DIR (+ manifest.json)")
+    ap.add_argument("--include", action="append", default=[], help="With --matrix: restrict values, e.g. @USART=USART0|USART1 (repeatable)")
+    ap.add_argument("--exclude", action="append", default=[], help="With --matrix: skip combinations, e.g. @USART=USART1,@USART_LOCATION=USART_LOCATION_ALTERNATIVE (repeatable)")
+
+    ap.add_argument("--batch", default=None, metavar="MANIFEST|GLOB", help="Fill many projects: JSON job manifest or glob of project files (e.g. 'projects/*/project.ud')")
+    ap.add_argument("--batch-state", default="ud_batch_state.json", help="With --batch: input/output hash file used to skip unchanged jobs (default: ud_batch_state.json)")
+    ap.add_argument("--force", action="store_true", help="With --batch: run every job even if its inputs are unchanged")
+
+    ap.add_argument("--stream", action="store_true", help="Stream --c-in to --c-out line by line (bounded memory, atomic replace)")
+    ap.add_argument("--reproducible", action="store_true", help="Stamp '// Generated:' with SOURCE_DATE_EPOCH or an input content hash instead of the current time")
+    ap.add_argument("--depfile", default=None, help="Write a make-style dependency file (like gcc -MD) for --c-out")
+    ap.add_argument("--depfile-target", default=None, metavar="TARGET", help="Target named in --depfile (default: --c-out; required with --c-out -)")
+    ap.add_argument("--timings", action="store_true", help="Print per-stage wall time and counters as JSON to stderr")
+    ap.add_argument("--profile", default=None, metavar="STATS_FILE", help="Run under cProfile and write stats to STATS_FILE (view with python -m pstats)")
 
     args = ap.parse_args(argv)
 
-    tpl = parse_template(_read_text(args.template))
-    sel = parse_project_params(_read_text(args.project), tpl, instance=args.instance)
-    sec = render_sections(tpl, sel)
+    ins = Instrumentation() if args.timings else None
+    prof = None
+    if args.profile:
+        import cProfile
+        prof = cProfile.Profile()
+
+    t0 = time.perf_counter()
+    with ins.active() if ins is not None else contextlib.nullcontext():
+        if prof is not None:
+            rc = prof.runcall(_run, ap, args)
+        else:
+            rc = _run(ap, args)
+    total = time.perf_counter() - t0
+
+    if prof is not None:
+        prof.dump_stats(args.profile)
+        print(f"profile written to {args.profile}", file=sys.stderr)
+    if ins is not None:
+        report = ins.as_dict()
+        report["total_ms"] = round(total * 1000.0, 3)
+        print(json.dumps(report), file=sys.stderr)
+    return rc
+
+
+def _run(ap: argparse.ArgumentParser, args: argparse.Namespace) -> int:
+    if args.serve:
+        return serve(socket_path=args.socket, workers=args.workers, cache_dir=args.cache_dir, use_cache=not args.no_cache)
+
+    if args.matrix:
+        if not args.template or not args.c_in:
+            ap.error("--matrix needs --template and --c-in")
+        try:
+            tpl_text = _read_text(args.template)
+            res = run_matrix(tpl_text, _read_text(args.c_in), args.matrix,
+                             include=args.include, exclude=args.exclude, workers=args.workers,
+                             generated=reproducible_stamp(tpl_text) if args.reproducible else None)
+        except ValueError as e:
+            ap.error(str(e))
+        for fail in res["failed"]:
+            sel = ", ".join(f"{k}={v}" for k, v in fail["params"].items())
+            print(f"[matrix] {sel}: error: {fail['error']}", file=sys.stderr)
+        print(f"{res['combinations']} combinations -> {res['unique_files']} files "
+              f"({res['unique_code']} distinct programs) in {args.matrix}"
+              + (f", {len(res['failed'])} failed (see manifest.json)" if res["failed"] else ""))
+        return 1 if res["failed"] else 0
+
+    if args.batch:
+        return _batch(ap, args)
+
+    if args.template_dir:
+        if args.template:
+            ap.error("--template and --template-dir are mutually exclusive")
+        if args.watch:
+            ap.error("--watch needs --template")
+    if args.watch and "-" in (args.c_in, args.c_out):
+        ap.error("--watch needs real files for --c-in and --c-out, not '-'")
+    for opt in ("project", "c_in", "c_out") if args.template_dir else ("template", "project", "c_in", "c_out"):
+        if getattr(args, opt) is None:
+            ap.error(f"--{opt.replace('_', '-')} is required")
+    if args.all_instances and args.instance:
+        ap.error("--instance and --all-instances are mutually exclusive")
+    if args.depfile_target and not args.depfile:
+        ap.error("--depfile-target needs --depfile")
+    if args.depfile and args.c_out == "-" and not args.depfile_target:
+        ap.error("--depfile with --c-out - needs --depfile-target (stdout has no file name to depend on)")
+
+    cache = None if args.no_cache else TemplateCache(args.cache_dir)
+    if args.watch:
+        return _watch(args, cache)
+    try:
+        _generate(args, cache)
+    except ValueError as e:
+        ap.error(str(e))
+    return 0
+
+
+def _generate(args: argparse.Namespace, cache: Optional[TemplateCache]) -> None:
+    """Single-file path of _run(): render, fill and write --c-out (and --depfile)."""
+    project_text = _read_text(args.project)
+    deps: List[str] = []
+    if args.template_dir:
+        lib = TemplateLibrary(args.template_dir, args.cache_dir)
+        lib.refresh()
+        for alias, rels in lib.conflicts().items():
+            print(f"warning: alias {alias} is defined by {', '.join(rels)}; using {rels[0]}", file=sys.stderr)
+        deps.append(args.template_dir)  # adding/removing a template can change the resolution
+        sec = render_project_library(project_text, lib, instance=args.instance, all_instances=args.all_instances,
+                                     cache=cache, warn=lambda msg: print(f"warning: {msg}", file=sys.stderr),
+                                     reproducible=args.reproducible, used_templates=deps)
+    else:
+        tpl_text = _read_text(args.template)
+        deps.append(args.template)
+        generated = reproducible_stamp(tpl_text, project_text) if args.reproducible else None
+        tpl = load_template(tpl_text, cache)
+        sec = render_project(tpl, project_text, instance=args.instance, all_instances=args.all_instances,
+                             generated=generated)
+    deps.append(args.project)
+    if args.c_in != "-":
+        deps.append(args.c_in)
 
     if args.dump:
-        for k in ["V", "P", "D", "H", "C", "I"]:
+        for k in _SECTION_TAGS + ["L"]:
             print(f"\n===== {k} =====")
             print(sec.get(k, ""))
+        if cache is not None:
+            print(f"\n===== template cache: {cache.stats()} =====")
+
+    if args.stream:
+        _fill_stream(args.c_in, args.c_out, sec)
+    else:
+        if args.c_in == "-":
+            c_text = io.TextIOWrapper(sys.stdin.buffer, encoding="utf-8", newline="").read()
+        else:
+            c_text = _read_text(args.c_in)
+        out = fill_c_skeleton(c_text, sec)
+        if args.c_out == "-":
+            sys.stdout.buffer.write(out.encode("utf-8"))
+            sys.stdout.buffer.flush()
+        else:
+            _write_if_changed(args.c_out, out)
 
-    out = fill_c_skeleton(_read_text(args.c_in), sec)
-    _write_text(args.c_out, out)
-    return 0
+    if args.depfile:
+        write_depfile(args.depfile, args.depfile_target or args.c_out, deps)
+
+
+def _batch(ap: argparse.ArgumentParser, args: argparse.Namespace) -> int:
+    try:
+        jobs = load_batch_jobs(args.batch, args.template)
+    except (OSError, ValueError) as e:
+        ap.error(str(e))
+
+    def report(job: BatchJob, res: dict) -> None:
+        if res.get("skipped"):
+            print(f"[batch] {job.c_out}: unchanged inputs, skipped", file=sys.stderr)
+        elif res["ok"]:
+            plan = "plan cached" if res["plan_cached"] else "plan parsed"
+            state = "written" if res["written"] else "unchanged"
+            print(f"[batch] {job.c_out}: {state} in {res['ms']:.2f} ms ({plan})", file=sys.stderr)
+        else:
+            print(f"[batch] {job.c_out}: error: {res['error']}", file=sys.stderr)
+
+    t0 = time.perf_counter()
+    counts = run_batch(jobs, args.batch_state, workers=args.workers, reproducible=args.reproducible,
+                       force=args.force, report=report)
+    dt_ms = (time.perf_counter() - t0) * 1000.0
+    print(f"{counts['jobs']} jobs: {counts['rendered']} rendered ({counts['written']} written, "
+          f"{counts['plan_hits']} plan cache hits), {counts['skipped']} skipped, {counts['failed']} failed "
+          f"in {dt_ms:.1f} ms", file=sys.stderr)
+    return 1 if counts["failed"] else 0
+
+
+def _fill_stream(c_in: str, c_out: str, sections: Dict[str, str]) -> None:
+    if c_in == "-":
+        src_cm = contextlib.nullcontext(io.TextIOWrapper(sys.stdin.buffer, encoding="utf-8", newline=""))
+    else:
+        src_cm = open(c_in, "r", encoding="utf-8", newline="")
+    with src_cm as src:
+        if c_out == "-":
+            dst = io.TextIOWrapper(sys.stdout.buffer, encoding="utf-8", newline="\n")
+            fill_c_stream(src, dst, sections)
+            dst.flush()
+            dst.detach()
+        else:
+            with _atomic_text_output(c_out) as dst:
+                fill_c_stream(src, dst, sections)
 
 
 if __name__ == "__main__":
@@ -44,3 +44,8 @@ void USART_Init(void) {
 $C- // End of the initialization section.
 
 $I USART_Init();
+
+$W while (!(@USART.STATUS & USART_DREIF_bm)) {
+$W     ;
+$W }
+$W @USART.TXDATAL = c;
@@ -917,6 +917,85 @@
     return builtInMiniProjectCardsPromise;
   }
 
+  // True when the service worker precache already holds every file of the
+  // project, so the per-file requests are answered locally.
+  async function isBuiltInMiniProjectPrecached(descriptor) {
+    if (!navigator.serviceWorker?.controller || typeof caches === "undefined") {
+      return false;
+    }
+    const urls = [
+      descriptor.source?.url,
+      ...(descriptor.guides || []).map((guide) => guide?.url),
+      ...(descriptor.assets || []).map((asset) => asset?.url),
+    ];
+    try {
+      const hits = await Promise.all(
+        urls.map((rawUrl) =>
+          rawUrl
+            ? caches.match(new URL(String(rawUrl), window.location.href).href, {
+                ignoreSearch: true,
+              })
+            : null
+        )
+      );
+      return hits.every(Boolean);
+    } catch {
+      return false;
+    }
+  }
+
+  // One request for source, guides and images when the catalog lists a bundle
+  // and the files are not precached; null falls back to fetching every file
+  // separately (from the service worker cache when it has them).
+  async function loadBuiltInMiniProjectBundle(descriptor) {
+    const archiveApi = window.UartDebugAvrMiniProjectArchive;
+    if (!descriptor.bundle?.url || !archiveApi?.parseMiniProjectArchive) {
+      return null;
+    }
+    if (await isBuiltInMiniProjectPrecached(descriptor)) {
+      return null;
+    }
+
+    try {
+      const url = new URL(String(descriptor.bundle.url), window.location.href);
+      if (url.origin !== window.location.origin) return null;
+      // The content hash versions the URL, so the HTTP cache may serve it.
+      if (descriptor.bundle.sha256) {
+        url.searchParams.set("v", String(descriptor.bundle.sha256).slice(0, 10));
+      }
+      const response = await fetch(url.href, { credentials: "same-origin" });
+      if (!response.ok) {
+        throw new Error(`Bundle could not be loaded (${response.status}).`);
+      }
+      const definition = await archiveApi.parseMiniProjectArchive(
+        await response.arrayBuffer(),
+        { limits: MINI_PROJECT_ARCHIVE_WORKSPACE_LIMITS }
+      );
+
+      const files = new Map();
+      for (const file of [
+        definition.files.source,
+        ...[].concat(definition.files.guide),
+      ]) {
+        files.set(file.name, file.content);
+      }
+      const names = [
+        descriptor.source.name,
+        ...(descriptor.guides || []).map((guide) => guide?.name),
+      ];
+      if (!names.every((name) => files.has(name))) {
+        throw new Error("Bundle does not match the catalog entry.");
+      }
+      return { files, assets: definition.assets || [] };
+    } catch (error) {
+      console.warn(
+        `Mini-project bundle could not be used for ${descriptor.id}:`,
+        error
+      );
+      return null;
+    }
+  }
+
   async function loadBuiltInMiniProjectDefinition(templateId) {
     const catalog = await loadBuiltInMiniProjectCatalog();
     const descriptor = catalog.get(String(templateId || ""));
@@ -930,12 +1009,18 @@
     const guideDescriptors = Array.isArray(descriptor.guides)
       ? descriptor.guides
       : [];
-    const [sourceContent, ...guideContents] = await Promise.all([
-      fetchBuiltInMiniProjectText(sourceDescriptor.url, "Source file"),
-      ...guideDescriptors.map((guide) =>
-        fetchBuiltInMiniProjectText(guide?.url, "Guide file")
-      ),
-    ]);
+    const bundle = await loadBuiltInMiniProjectBundle(descriptor);
+    const [sourceContent, ...guideContents] = bundle
+      ? [
+          bundle.files.get(sourceDescriptor.name),
+          ...guideDescriptors.map((guide) => bundle.files.get(guide?.name)),
+        ]
+      : await Promise.all([
+          fetchBuiltInMiniProjectText(sourceDescriptor.url, "Source file"),
+          ...guideDescriptors.map((guide) =>
+            fetchBuiltInMiniProjectText(guide?.url, "Guide file")
+          ),
+        ]);
     const defaultGuide = getBuiltInMiniProjectDefaultGuide(descriptor);
     const defaultGuideIndex = defaultGuide
       ? guideDescriptors.indexOf(defaultGuide)
@@ -976,6 +1061,7 @@
           assetBaseUrl: guide.assetBaseUrl,
         })),
       ],
+      ...(bundle?.assets.length ? { assets: bundle.assets } : {}),
       ...(descriptor.aiSpecRef &&
         typeof descriptor.aiSpecRef === "object" &&
         !Array.isArray(descriptor.aiSpecRef)
@@ -1,72 +1,16 @@
-const CACHE_NAME = "uartdebug-shell-20260821-ai-chat-v1";
-const APP_SHELL_ASSETS = [
-  "/",
-  "/index.html",
-  "/avr",
-  "/avr.html",
-  "/uart",
-  "/uart.html",
-  "/manifest.webmanifest",
-  "/uart.css",
-  "/uart.js",
-  "/AVR-Programming.css",
-  "/avr-mini-projects.js",
-  "/avr-mini-project-archive.js",
-  "/avr-mini-projects/catalog.json",
-  "/avr-mini-projects/01_Minimum/01_Minimum_1.2.3-d.c",
-  "/avr-mini-projects/01_Minimum/01_Minimum_help_1.2.3-d.md",
-  "/avr-mini-projects/01_Minimum/Pasted%20image%2020260720202929.png",
-  "/avr-mini-projects/01_Minimum/Pasted%20image%2020260720203447.png",
-  "/avr-mini-projects/01_Minimum/Pasted%20image%2020260720203718.png",
-  "/avr-mini-projects/01_Minimum/Pasted%20image%2020260720203813.png",
-  "/avr-mini-projects/02_CPU_Clock/02_CPU_Clock_1.2.3-b.c",
-  "/avr-mini-projects/02_CPU_Clock/02_CPU_Clock_help_1.2.3-b.md",
-  "/avr-mini-projects/03_Delay-Based_Blink/03_Delay-Based_Blink_1.2.3-b.c",
-  "/avr-mini-projects/03_Delay-Based_Blink/03_Delay-Based_Blink_help_1.2.3-b.md",
-  "/avr-mini-projects/04_Timer_Interrupt_Blink/04_Timer_Interrupt_Blink_1.2.3-d.c",
-  "/avr-mini-projects/04_Timer_Interrupt_Blink/04_Timer_Interrupt_Blink_help(en)_1.2.3-d.md",
-  "/avr-mini-projects/04_Timer_Interrupt_Blink/04_Timer_Interrupt_Blink_help(es)_1.2.3-d.md",
-  "/avr-mini-projects/04_Timer_Interrupt_Blink/04_Timer_Interrupt_Blink_help(ru)_1.2.3-d.md",
-  "/avr-mini-projects/05_UART_Basic_Transmission/05_UART_Basic_Transmission_1.2.3-c.c",
-  "/avr-mini-projects/05_UART_Basic_Transmission/05_UART_Basic_Transmission_help(en)_1.2.3-c.md",
-  "/avr-mini-projects/05_UART_Basic_Transmission/05_UART_Basic_Transmission_help(es)_1.2.3-c.md",
-  "/avr-mini-projects/05_UART_Basic_Transmission/05_UART_Basic_Transmission_help(ru)_1.2.3-c.md",
-  "/avr-mini-projects/05_UART_Basic_Transmission/Pasted%20image%2020260726152153.png",
-  "/avr-mini-projects/05_UART_Basic_Transmission/Pasted%20image%2020260726152302.png",
-  "/avr-mini-projects/05_UART_Basic_Transmission/Pasted%20image%2020260726152346.png",
-  "/avr-mini-projects/05_UART_Basic_Transmission/Pasted%20image%2020260726152507.png",
-  "/avr-mini-projects/05_UART_Basic_Transmission/Pasted%20image%2020260726152540.png",
-  "/avr-mini-projects/05_UART_Basic_Transmission/Pasted%20image%2020260726152615.png",
-  "/avr-mini-projects/06_UART_Basic_Receive/06_UART_Basic_Receive_1.2.3-a.c",
-  "/avr-mini-projects/06_UART_Basic_Receive/06_UART_Basic_Receive_help(en)_1.2.3-a.md",
-  "/avr-mini-projects/06_UART_Basic_Receive/06_UART_Basic_Receive_help(es)_1.2.3-a.md",
-  "/avr-mini-projects/06_UART_Basic_Receive/06_UART_Basic_Receive_help(ru)_1.2.3-a.md",
-  "/avr-mini-projects/07_Printf_Redirect_USART0/07_Printf_Redirect_USART0_1.2.3-a.c",
-  "/avr-mini-projects/07_Printf_Redirect_USART0/07_Printf_Redirect_USART0_help(en)_1.2.3-a.md",
-  "/avr-mini-projects/07_Printf_Redirect_USART0/07_Printf_Redirect_USART0_help(ru)_1.2.3-a.md",
-  "/avr-mini-projects/08_Printf_Redirect_USART1/08_Printf_Redirect_USART1_1.2.3-a.c",
-  "/avr-mini-projects/08_Printf_Redirect_USART1/08_Printf_Redirect_USART1_help(en)_1.2.3-a.md",
-  "/avr-mini-projects/08_Printf_Redirect_USART1/08_Printf_Redirect_USART1_help(ru)_1.2.3-a.md",
-  "/AVR-Programming.js",
-  "/updi-test.js",
-  "/updi-test.css",
-  "/vendor/codemirror/5.65.16/codemirror.min.css",
-  "/vendor/codemirror/5.65.16/theme/material-darker.min.css",
-  "/vendor/codemirror/5.65.16/addon/hint/show-hint.min.css",
-  "/vendor/codemirror/5.65.16/codemirror.min.js",
-  "/vendor/codemirror/5.65.16/mode/clike/clike.min.js",
-  "/vendor/codemirror/5.65.16/addon/edit/matchbrackets.min.js",
-  "/vendor/codemirror/5.65.16/addon/hint/show-hint.min.js",
-  "/vendor/codemirror/5.65.16/addon/hint/anyword-hint.min.js",
-  "/vendor/codemirror/5.65.16/addon/edit/closebrackets.min.js",
-  "/vendor/chart.umd.js",
-  "/favicon.ico",
-  "/icons/favicon-192.png",
-  "/icons/logo-512.png",
-  "/icons/apple-touch-icon.png",
-];
-
-const APP_SHELL_PATHS = new Set(APP_SHELL_ASSETS);
+const CACHE_NAME = "uartdebug-shell-v2";
+// URL -> content hash, filled in by .github/scripts/stamp_frontend_build.py when
+// deploying. Empty in the repository, so an unstamped checkout precaches nothing.
+const APP_SHELL_ASSETS = {
+};
+
+const APP_SHELL_PATHS = new Set(Object.keys(APP_SHELL_ASSETS));
+
+// Cache entries are keyed by content hash, so an update only fetches changed assets.
+function shellCacheKey(pathname) {
+  return `${pathname}?v=${APP_SHELL_ASSETS[pathname]}`;
+}
+
 const LEGACY_PATHS = new Set([
   "/index_old.html",
   "/c-canvas.html",
@@ -88,7 +32,7 @@ self.addEventListener("install", (event) => {
   event.waitUntil(
     caches
       .open(CACHE_NAME)
-      .then((cache) => cache.addAll(APP_SHELL_ASSETS))
+      .then((cache) => Promise.all([...APP_SHELL_PATHS].map((path) => precacheAsset(cache, path))))
       .then(() => self.skipWaiting())
   );
 });
@@ -101,7 +45,9 @@ self.addEventListener("activate", (event) => {
           .filter((key) => key.startsWith("uartdebug-shell-") && key !== CACHE_NAME)
           .map((key) => caches.delete(key))
       )
-    ).then(() => self.clients.claim())
+    )
+      .then(() => pruneShellCache())
+      .then(() => self.clients.claim())
   );
 });
 
@@ -134,6 +80,28 @@ self.addEventListener("fetch", (event) => {
   }
 });
 
+async function precacheAsset(cache, path) {
+  const cacheKey = shellCacheKey(path);
+  if (await cache.match(cacheKey)) return;
+
+  const response = await fetch(cacheKey);
+  if (!response.ok) {
+    throw new Error(`Failed to precache ${path}: ${response.status}`);
+  }
+  await cache.put(cacheKey, response);
+}
+
+async function pruneShellCache() {
+  const cache = await caches.open(CACHE_NAME);
+  const current = new Set(
+    [...APP_SHELL_PATHS].map((path) => new URL(shellCacheKey(path), self.location.origin).href)
+  );
+  const requests = await cache.keys();
+  await Promise.all(
+    requests.filter((request) => !current.has(request.url)).map((request) => cache.delete(request))
+  );
+}
+
 function shouldUseNetworkFirstForAsset(request) {
   return (
     request.destination === "style" ||
@@ -145,7 +113,7 @@ function shouldUseNetworkFirstForAsset(request) {
 async function handleNavigationRequest(request) {
   const cache = await caches.open(CACHE_NAME);
   const url = new URL(request.url);
-  const cacheKey = APP_SHELL_PATHS.has(url.pathname) ? url.pathname : "/index.html";
+  const cacheKey = shellCacheKey(APP_SHELL_PATHS.has(url.pathname) ? url.pathname : "/index.html");
 
   try {
     const freshResponse = await fetch(request);
@@ -154,7 +122,7 @@ async function handleNavigationRequest(request) {
     }
     return freshResponse;
   } catch (error) {
-    const cachedPage = (await cache.match(cacheKey)) || (await cache.match("/index.html"));
+    const cachedPage = (await cache.match(cacheKey)) || (await cache.match(shellCacheKey("/index.html")));
     if (cachedPage) return cachedPage;
 
     return new Response("Offline", {
@@ -167,23 +135,24 @@ async function handleNavigationRequest(request) {
 
 async function cacheFirstWithBackgroundUpdate(event, request) {
   const cache = await caches.open(CACHE_NAME);
-  const cachedResponse = await cache.match(request);
+  const cacheKey = shellCacheKey(new URL(request.url).pathname);
+  const cachedResponse = await cache.match(cacheKey);
 
   if (cachedResponse) {
-    event.waitUntil(updateCachedAsset(cache, request));
+    event.waitUntil(updateCachedAsset(cache, request, cacheKey));
     return cachedResponse;
   }
 
   const networkResponse = await fetch(request);
   if (networkResponse && networkResponse.ok) {
-    cache.put(request, networkResponse.clone());
+    cache.put(cacheKey, networkResponse.clone());
   }
   return networkResponse;
 }
 
 async function networkFirstWithCacheFallback(request) {
   const cache = await caches.open(CACHE_NAME);
-  const cacheKey = new URL(request.url).pathname;
+  const cacheKey = shellCacheKey(new URL(request.url).pathname);
 
   try {
     const freshResponse = await fetch(request);
@@ -198,11 +167,11 @@ async function networkFirstWithCacheFallback(request) {
   }
 }
 
-async function updateCachedAsset(cache, request) {
+async function updateCachedAsset(cache, request, cacheKey) {
   try {
     const freshResponse = await fetch(request);
     if (freshResponse && freshResponse.ok) {
-      await cache.put(request, freshResponse.clone());
+      await cache.put(cacheKey, freshResponse.clone());
     }
   } catch (error) {
     // Keep serving last cached version when update fails.
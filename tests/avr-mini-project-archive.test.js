@@ -1,7 +1,9 @@
 "use strict";
 
 const assert = require("node:assert/strict");
+const { execFileSync } = require("node:child_process");
 const fs = require("node:fs");
+const os = require("node:os");
 const path = require("node:path");
 const test = require("node:test");
 const vm = require("node:vm");
@@ -395,3 +397,53 @@ test("rejects unsupported project files and invalid UTF-8 text", async () => {
   };
   await expectCode(makeZip(invalidUtf8), "INVALID_TEXT");
 });
+
+// Bundles are build output (.gitignore), so they are built here from a copy of the
+// project folders; the checkout is not touched.
+function buildBundles() {
+  const repoRoot = path.join(__dirname, "..");
+  const workDir = fs.mkdtempSync(path.join(os.tmpdir(), "mini-project-bundles-"));
+  for (const dir of ["public/avr-mini-projects", "backend/ai/mini-projects"]) {
+    fs.cpSync(path.join(repoRoot, dir), path.join(workDir, dir), {
+      recursive: true,
+      filter: (source) => !source.endsWith(".zip"),
+    });
+  }
+  execFileSync(
+    "python3",
+    [path.join(repoRoot, ".github/scripts/build_mini_project_catalog.py"), "--force"],
+    { cwd: workDir, stdio: ["ignore", "ignore", "pipe"] }
+  );
+  return path.join(workDir, "public");
+}
+
+test("parses the built-in bundles listed in the public catalog", async (t) => {
+  const publicRoot = path.join(__dirname, "..", "public");
+  const catalog = JSON.parse(
+    fs.readFileSync(path.join(publicRoot, "avr-mini-projects", "catalog.json"), "utf8")
+  );
+  const bundled = catalog.projects.filter((project) => project.bundle);
+  assert.ok(bundled.length, "the public catalog lists no bundles");
+  const builtRoot = buildBundles();
+  t.after(() => fs.rmSync(path.dirname(builtRoot), { recursive: true, force: true }));
+  const bundlePath = (project) =>
+    path.join(builtRoot, decodeURIComponent(project.bundle.url));
+
+  for (const project of bundled) {
+    const bytes = fs.readFileSync(bundlePath(project));
+    assert.equal(bytes.byteLength, project.bundle.size);
+    assert.equal(
+      require("node:crypto").createHash("sha256").update(bytes).digest("hex"),
+      project.bundle.sha256
+    );
+
+    const definition = await archive.parseMiniProjectArchive(bytes);
+    const guides = [].concat(definition.files.guide);
+    assert.equal(definition.files.source.name, project.source.name);
+    assert.deepEqual(
+      guides.map((guide) => guide.name).sort(),
+      project.guides.map((guide) => guide.name).sort()
+    );
+    assert.equal(definition.assets.length, (project.assets || []).length);
+  }
+});
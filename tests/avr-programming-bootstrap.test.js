@@ -2,7 +2,9 @@
 
 const assert = require("node:assert/strict");
 const crypto = require("node:crypto");
+const { execFileSync } = require("node:child_process");
 const fs = require("node:fs");
+const os = require("node:os");
 const path = require("node:path");
 const test = require("node:test");
 const vm = require("node:vm");
@@ -213,6 +215,25 @@ test("does not render the obsolete AI context row", () => {
   assert.match(source, /mcu:\s*String\(mcuSelect\?\.value/);
 });
 
+test("loads mini-project bundles only when the files are not precached", () => {
+  const source = fs.readFileSync(
+    path.join(__dirname, "../public/AVR-Programming.js"),
+    "utf8"
+  );
+  const loader = source.match(
+    /async function loadBuiltInMiniProjectBundle\(descriptor\) \{[\s\S]*?\n  \}\n/
+  )?.[0];
+
+  assert.ok(loader);
+  assert.match(
+    loader,
+    /if \(await isBuiltInMiniProjectPrecached\(descriptor\)\) \{\s*return null;/
+  );
+  assert.match(loader, /searchParams\.set\("v", String\(descriptor\.bundle\.sha256\)/);
+  assert.doesNotMatch(loader, /no-cache/);
+  assert.match(source, /caches\.match\([\s\S]*?ignoreSearch: true/);
+});
+
 test("lets the guide pane grow until the editor reaches its minimum width", () => {
   const source = fs.readFileSync(
     path.join(__dirname, "../public/AVR-Programming.js"),
@@ -292,6 +313,27 @@ test("renames a mini-project display name without renaming its linked files", ()
   );
 });
 
+// public/sw.js is committed with an empty APP_SHELL_ASSETS map; the deploy
+// stamps it, so read the precache list from a stamped copy.
+function stampedServiceWorker() {
+  const repoRoot = path.join(__dirname, "..");
+  const workDir = fs.mkdtempSync(path.join(os.tmpdir(), "stamped-public-"));
+  try {
+    fs.cpSync(path.join(repoRoot, "public"), path.join(workDir, "public"), {
+      recursive: true,
+      filter: (source) => !/\.(zip|gz|br)$/.test(source),
+    });
+    execFileSync(
+      "python3",
+      [path.join(repoRoot, ".github/scripts/stamp_frontend_build.py")],
+      { cwd: workDir, stdio: ["ignore", "ignore", "pipe"] }
+    );
+    return fs.readFileSync(path.join(workDir, "public/sw.js"), "utf8");
+  } finally {
+    fs.rmSync(workDir, { recursive: true, force: true });
+  }
+}
+
 test("renders every built-in card from its catalog and default guide", () => {
   const html = fs.readFileSync(
     path.join(__dirname, "../public/avr.html"),
@@ -301,10 +343,7 @@ test("renders every built-in card from its catalog and default guide", () => {
     path.join(__dirname, "../public/AVR-Programming.js"),
     "utf8"
   );
-  const sw = fs.readFileSync(
-    path.join(__dirname, "../public/sw.js"),
-    "utf8"
-  );
+  const sw = stampedServiceWorker();
   const publicCatalog = JSON.parse(
     fs.readFileSync(
       path.join(__dirname, "../public/avr-mini-projects/catalog.json"),
@@ -0,0 +1,30 @@
+import os
+import sys
+
+import pytest
+
+# md/ holds stand-alone scripts, not a package: make ud_template_fill importable.
+MD_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "md")
+if MD_DIR not in sys.path:
+    sys.path.insert(0, MD_DIR)
+
+GOLDEN_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "golden")
+
+
+@pytest.fixture
+def golden():
+    """
+    Compare text with tests/golden/<name> byte for byte. UD_UPDATE_GOLDEN=1
+    rewrites the files instead (review the diff before committing it).
+    """
+    def check(name: str, text: str) -> None:
+        path = os.path.join(GOLDEN_DIR, name)
+        if os.environ.get("UD_UPDATE_GOLDEN"):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "w", encoding="utf-8", newline="") as f:
+                f.write(text)
+            return
+        with open(path, "r", encoding="utf-8", newline="") as f:
+            assert text == f.read(), f"output differs from tests/golden/{name}"
+
+    return check
@@ -0,0 +1,42 @@
+//`V+ 1.0.0  Auto-generated header section
+// v
+//`V-
+// User code can be placed here
+
+//`P+   User-selected parameters section
+//`P-
+// User code can be placed here
+
+//`D+   Define section
+//`D-
+// User code can be placed here
+
+//`H+   Include section
+//`H-
+// User code can be placed here
+
+//`C+   Function definition section
+int x;
+
+int y;
+//`C-
+// User code can be placed here
+
+int main(void)
+{
+	//`I+   Initialization call section
+	a();
+
+	b();
+	//`I-
+	// User code can be placed here
+	
+	//`Csss   Auto-generated sei() insertion section
+	while(1)
+	{
+		//`C+   Loop body section
+		//`C-
+		// User code can be placed here
+	}
+    return 0;
+}
@@ -0,0 +1,68 @@
+import json
+import shutil
+import subprocess
+import sys
+import zipfile
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+SCRIPT = ROOT / ".github" / "scripts" / "build_mini_project_catalog.py"
+PUBLIC = Path("public/avr-mini-projects")
+AI = Path("backend/ai/mini-projects")
+
+
+def _build(cwd, *args):
+    return subprocess.run([sys.executable, str(SCRIPT), *args], cwd=cwd, capture_output=True, text=True)
+
+
+@pytest.fixture
+def site(tmp_path):
+    for rel in (PUBLIC, AI):
+        shutil.copytree(ROOT / rel, tmp_path / rel, ignore=shutil.ignore_patterns("*.zip"))
+    return tmp_path
+
+
+def _bundles(site):
+    return {path.name: path.read_bytes() for path in sorted((site / PUBLIC).glob("*/*.zip"))}
+
+
+def test_committed_catalogs_are_current_on_a_fresh_clone(site):
+    res = _build(site, "--check")
+    assert res.returncode == 0, res.stdout + res.stderr
+    assert "skipped (not built)" in res.stdout and not _bundles(site)
+
+
+def test_bundles_are_listed_in_the_catalog_and_reproducible(site):
+    res = _build(site)
+    assert res.returncode == 0, res.stderr
+    first = _bundles(site)
+    catalog = json.loads((site / PUBLIC / "catalog.json").read_text(encoding="utf-8"))
+    listed = {project["bundle"]["name"] for project in catalog["projects"] if project.get("bundle")}
+    assert first and listed == set(first)
+    for path in (site / PUBLIC).glob("*/*.zip"):
+        with zipfile.ZipFile(path) as bundle:
+            assert bundle.testzip() is None
+            assert all(info.date_time == (1980, 1, 1, 0, 0, 0) for info in bundle.infolist())
+
+    assert _build(site, "--force").returncode == 0
+    assert _bundles(site) == first
+    assert (site / PUBLIC / "catalog.json").read_bytes() == (ROOT / PUBLIC / "catalog.json").read_bytes()
+
+
+def test_unchanged_projects_reuse_their_bundle(site):
+    assert _build(site).returncode == 0
+    res = _build(site)
+    assert res.returncode == 0, res.stderr
+    assert " 0 bundles rebuilt (0 changed)" in res.stdout and "0 catalogs written" in res.stdout
+    assert _build(site, "--check").returncode == 0
+
+
+def test_check_reports_an_edited_source(site):
+    assert _build(site).returncode == 0
+    source = next((site / PUBLIC).glob("01_*/*.c"))
+    source.write_text(source.read_text(encoding="utf-8") + "// edited\n", encoding="utf-8")
+    res = _build(site, "--check")
+    assert res.returncode == 1
+    assert "out of date" in res.stdout and "catalog.json" in res.stdout
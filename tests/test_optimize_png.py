@@ -0,0 +1,119 @@
+import importlib.util
+import json
+import random
+import struct
+import subprocess
+import sys
+import zlib
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+SCRIPT = ROOT / ".github" / "scripts" / "optimize_png.py"
+
+
+def _load_script():
+    spec = importlib.util.spec_from_file_location("optimize_png", SCRIPT)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+png = _load_script()
+
+
+def _paeth(a, b, c):
+    p = a + b - c
+    pa, pb, pc = abs(p - a), abs(p - b), abs(p - c)
+    return a if pa <= pb and pa <= pc else (b if pb <= pc else c)
+
+
+def _filter_row(kind, row, prior, bpp):
+    # Straight from the PNG specification, one byte at a time.
+    out = bytearray()
+    for i, x in enumerate(row):
+        a = row[i - bpp] if i >= bpp else 0
+        b = prior[i]
+        c = prior[i - bpp] if i >= bpp else 0
+        predictor = [0, a, b, (a + b) >> 1, _paeth(a, b, c)][kind]
+        out.append((x - predictor) & 0xFF)
+    return bytes([kind]) + bytes(out)
+
+
+def _png(width, height, color, rows, extra=()):
+    ihdr = struct.pack(">IIBBBBB", width, height, 8, color, 0, 0, 0)
+    raw = b"".join(b"\x00" + row for row in rows)
+    chunks = [(b"IHDR", ihdr), *extra, (b"IDAT", zlib.compress(raw, 0)), (b"IEND", b"")]
+    return png.SIGNATURE + b"".join(png.chunk_bytes(kind, body) for kind, body in chunks)
+
+
+@pytest.mark.parametrize("color, width", [(0, 1), (2, 7), (6, 33), (4, 5)])
+def test_unfilter_matches_the_reference_for_every_filter_type(color, width):
+    rng = random.Random(color * 100 + width)
+    info = {"width": width, "height": 10, "depth": 8, "color": color, "interlace": 0}
+    stride, bpp = png.geometry(info)
+    rows = [bytes(rng.randrange(256) for _ in range(stride)) for _ in range(info["height"])]
+    raw, prior = b"", bytes(stride)
+    for y, row in enumerate(rows):
+        raw += _filter_row(y % 5, row, prior, bpp)
+        prior = row
+    assert png.unfilter(raw, info) == rows
+    for adaptive in (False, True):
+        assert png.unfilter(png.filter_rows(rows, bpp, adaptive), info) == rows
+
+
+def test_optimize_reduces_opaque_grey_rgba_losslessly():
+    width, height = 40, 30
+    grey = [bytes((x * y) % 256 for x in range(width)) for y in range(height)]
+    rgba = [b"".join(bytes([v, v, v, 255]) for v in row) for row in grey]
+    srgb = (b"sRGB", b"\x00")
+    source = _png(width, height, 6, rgba, extra=[srgb, (b"tEXt", b"Comment\x00hello")])
+
+    packed = png.optimize(source, keep_color=False)
+    chunks, info, _raw, rows = png.decode(packed)
+    assert len(packed) < len(source)
+    assert info["color"] == 0 and rows == grey
+    assert [kind for kind, _body in chunks] == [b"IHDR", b"IDAT", b"IEND"]
+    kept = png.decode(png.optimize(source, keep_color=True))[0]
+    assert srgb in kept and b"tEXt" not in {kind for kind, _body in kept}
+
+
+def test_optimize_keeps_images_it_cannot_shrink_or_read():
+    rgb = [bytes(random.Random(y).randrange(256) for _ in range(3 * 16)) for y in range(4)]
+    tight = png.optimize(_png(16, 4, 2, rgb), keep_color=False)
+    assert png.optimize(tight, keep_color=False) == tight
+    with pytest.raises(png.NotSupported, match="not a PNG"):
+        png.optimize(b"GIF89a", keep_color=False)
+
+
+def _optimize(cwd, *args):
+    res = subprocess.run(
+        [sys.executable, str(SCRIPT), "--root", "site", "--cache-dir", "cache", "--workers", "1", *args],
+        cwd=cwd, capture_output=True, text=True,
+    )
+    assert res.returncode == 0, res.stdout + res.stderr
+    return res.stdout
+
+
+def test_cli_caches_results_and_writes_variants(tmp_path):
+    site = tmp_path / "site"
+    site.mkdir()
+    rows = [b"".join(bytes([x, y, (x + y) % 256, 255]) for x in range(64)) for y in range(64)]
+    (site / "pic.png").write_bytes(_png(64, 64, 6, rows))
+    (site / "fake.png").write_bytes(b"not a png at all")
+
+    out = _optimize(tmp_path, "--variant-width", "16", "--report", "report.json")
+    assert "fake.png" in out and "skipped: not a PNG file" in out
+    assert "shrank 1, 0 from cache, 1 variants" in out
+    variant = site / "variants" / "pic@16w.png"
+    info = png.decode(variant.read_bytes())[1]
+    assert (info["width"], info["height"], info["color"]) == (16, 16, 2)
+    assert png.decode((site / "pic.png").read_bytes())[3] == [
+        b"".join(bytes([x, y, (x + y) % 256]) for x in range(64)) for y in range(64)
+    ]
+
+    again = _optimize(tmp_path, "--variant-width", "16")
+    assert "shrank 0, 1 from cache, 1 variants" in again  # fake.png is never a cache hit
+    report = json.loads((tmp_path / "report.json").read_text(encoding="utf-8"))
+    assert report["totals"]["changed"] == 1 and report["totals"]["variants"] == 1
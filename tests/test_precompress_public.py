@@ -0,0 +1,71 @@
+import gzip
+import importlib.util
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+SCRIPT = ROOT / ".github" / "scripts" / "precompress_public.py"
+TEXT = "".join(f"<p>line {i}</p>\n" for i in range(400))
+
+
+def _load_script():
+    spec = importlib.util.spec_from_file_location("precompress_public", SCRIPT)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def _precompress(tmp_path, *args):
+    res = subprocess.run(
+        [sys.executable, str(SCRIPT), "--root", "public", "--state", "state.json", "--workers", "1", *args],
+        cwd=tmp_path, capture_output=True, text=True,
+    )
+    assert res.returncode == 0, res.stdout + res.stderr
+    return res.stdout
+
+
+def _site(tmp_path):
+    public = tmp_path / "public"
+    (public / "js").mkdir(parents=True)
+    (public / "index.html").write_text(TEXT, encoding="utf-8")
+    (public / "js" / "app.js").write_text(TEXT.replace("p>", "b>"), encoding="utf-8")
+    (public / "tiny.css").write_text("a{}", encoding="utf-8")
+    (public / "logo.png").write_bytes(b"\x89PNG" + bytes(4096))
+    return public
+
+
+def test_writes_gzip_siblings_for_text_assets_only(tmp_path):
+    public = _site(tmp_path)
+    _precompress(tmp_path)
+    assert gzip.decompress((public / "index.html.gz").read_bytes()).decode("utf-8") == TEXT
+    assert (public / "js" / "app.js.gz").is_file()
+    assert not (public / "tiny.css.gz").exists() and not (public / "logo.png.gz").exists()
+
+
+def test_unchanged_sources_are_skipped_and_deleted_ones_lose_siblings(tmp_path):
+    public = _site(tmp_path)
+    _precompress(tmp_path)
+    (public / "js" / "app.js").unlink()
+    out = _precompress(tmp_path)
+    assert "0 compressed, 1 unchanged" in out
+    assert not (public / "js" / "app.js.gz").exists()
+    assert list(json.loads((tmp_path / "state.json").read_text(encoding="utf-8"))["files"]) == ["index.html"]
+
+
+def test_missing_sibling_is_rebuilt_even_if_the_source_is_unchanged(tmp_path):
+    public = _site(tmp_path)
+    _precompress(tmp_path)
+    (public / "index.html.gz").unlink()
+    assert "1 compressed, 1 unchanged" in _precompress(tmp_path)
+    assert (public / "index.html.gz").is_file()
+
+
+def test_stale_brotli_sibling_is_removed_without_brotli(tmp_path):
+    public = _site(tmp_path)
+    stale = public / "index.html.br"
+    stale.write_bytes(b"left by an older run")
+    sizes = _load_script().compress_file(public / "index.html", False)
+    assert sizes["br"] is None and sizes["gz"] is not None
+    assert not stale.exists()
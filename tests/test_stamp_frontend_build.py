@@ -0,0 +1,100 @@
+import hashlib
+import json
+import re
+import shutil
+import subprocess
+import sys
+from pathlib import Path
+from urllib.parse import unquote
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+SCRIPT = ROOT / ".github" / "scripts" / "stamp_frontend_build.py"
+STAMPED_FILES = ["sw.js", "index.html", "uart.html", "avr.html", "manifest.webmanifest"]
+ASSETS_RE = re.compile(r"const APP_SHELL_ASSETS = (\{.*?\n\});\n", re.S)
+VERSION_RE = re.compile(r"\?v=[0-9a-f]{10}\b")
+
+
+def _stamp(cwd, *args):
+    return subprocess.run([sys.executable, str(SCRIPT), *args], cwd=cwd, capture_output=True, text=True)
+
+
+def _assets(public):
+    body = ASSETS_RE.search((public / "sw.js").read_text(encoding="utf-8")).group(1)
+    return json.loads(re.sub(r",(\s*\})$", r"\1", body))
+
+
+@pytest.fixture
+def site(tmp_path):
+    shutil.copytree(ROOT / "public", tmp_path / "public", ignore=shutil.ignore_patterns("*.zip", "*.gz", "*.br"))
+    return tmp_path
+
+
+def test_committed_sources_are_unstamped():
+    # Hashes are generated at deploy time; committing them only creates churn.
+    public = ROOT / "public"
+    assert _assets(public) == {}
+    for name in STAMPED_FILES:
+        assert not VERSION_RE.search((public / name).read_text(encoding="utf-8")), name
+
+
+def test_stamp_versions_every_precached_asset(site):
+    res = _stamp(site)
+    assert res.returncode == 0, res.stdout + res.stderr
+    public = site / "public"
+    assets = _assets(public)
+    assert assets["/"] == assets["/index.html"] and assets["/avr"] == assets["/avr.html"]
+    assert "/avr-mini-projects/catalog.json" in assets and "/manifest.webmanifest" in assets
+    for url, version in assets.items():
+        path = public / (unquote(url.lstrip("/")) or "index.html")
+        if not path.is_file():
+            path = path.with_name(path.name + ".html")
+        assert hashlib.sha256(path.read_bytes()).hexdigest()[:10] == version, url
+
+    index = (public / "index.html").read_text(encoding="utf-8")
+    assert f'href="/manifest.webmanifest?v={assets["/manifest.webmanifest"]}"' in index
+    assert 'navigator.serviceWorker.register("/sw.js", { updateViaCache: "none" })' in index
+
+
+def test_stamp_is_idempotent(site):
+    assert _stamp(site).returncode == 0
+    before = {name: (site / "public" / name).read_bytes() for name in STAMPED_FILES}
+    res = _stamp(site)
+    assert res.returncode == 0 and "(0/" in res.stdout
+    assert before == {name: (site / "public" / name).read_bytes() for name in STAMPED_FILES}
+
+
+def test_dry_run_writes_nothing(site):
+    res = _stamp(site, "--dry-run")
+    assert res.returncode == 0 and "would change" in res.stdout
+    for name in STAMPED_FILES:
+        assert (site / "public" / name).read_bytes() == (ROOT / "public" / name).read_bytes()
+
+
+def test_report_counts_each_precached_file_once(site):
+    res = _stamp(site, "--report", "report.json")
+    assert res.returncode == 0, res.stdout + res.stderr
+    report = json.loads((site / "report.json").read_text(encoding="utf-8"))
+    assets = report["assets"]
+    files = {asset["path"]: asset for asset in assets}
+    assert report["totals"]["entries"] == len(assets) == len(_assets(site / "public"))
+    assert report["totals"]["files"] == len(files) < len(assets)  # "/" and "/index.html" are one file
+    assert report["totals"]["gzip"] == sum(asset["gzip"] for asset in files.values())
+    assert all(asset["gzip"] <= asset["raw"] for asset in assets)
+    assert report["overBudget"] == [] and report["missing"] == [] and report["stale"] == []
+
+
+def test_over_budget_fails_after_writing_the_report(site):
+    res = _stamp(site, "--budget", "1000", "--asset-budget", "50000", "--report", "report.json")
+    assert res.returncode == 1
+    assert "Over budget: precache is " in res.stderr and ", budget 1000 B" in res.stderr
+    assert "/vendor/chart.umd.js is " in res.stderr
+    report = json.loads((site / "report.json").read_text(encoding="utf-8"))
+    assert report["budgets"] == {"total": 1000, "asset": 50000} and len(report["overBudget"]) >= 2
+
+
+def test_dry_run_weighs_the_pending_output(site):
+    res = _stamp(site, "--dry-run", "--budget", "100000000")
+    assert res.returncode == 0, res.stdout + res.stderr
+    assert "Precache: " in res.stdout and "APP_SHELL_ASSETS" not in res.stderr
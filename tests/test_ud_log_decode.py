@@ -0,0 +1,67 @@
+import json
+import struct
+
+import pytest
+
+import ud_log_decode as dec
+
+
+@pytest.mark.parametrize("size", [0, 1, 3, 7, 8, 9])
+@pytest.mark.parametrize("mode", dec.MODES)
+def test_tiny_raw_captures(tmp_path, size, mode):
+    path = tmp_path / "tiny.bin"
+    path.write_bytes(bytes(range(10, 10 + size)))
+    res = dec.decode_file(str(path), fmt="raw", mode=mode)
+    width = 1 if mode == "1" else 2
+    assert res["bytes"] == size
+    assert res["stats"]["samples"] * width + res["skipped_bytes"] + res["dangling_bytes"] == size
+
+
+def test_two_byte_samples_and_auto_alignment(tmp_path):
+    values = [1000 + 3 * i for i in range(64)]
+    data = struct.pack(f"<{len(values)}H", *values)
+    (tmp_path / "a.bin").write_bytes(data)
+    (tmp_path / "b.bin").write_bytes(b"\x99" + data)
+
+    res = dec.decode_file(str(tmp_path / "a.bin"), mode="2LE")
+    assert res["stats"]["samples"] == 64 and res["stats"]["min"] == 1000 and res["stats"]["max"] == 1189
+    shifted = dec.decode_file(str(tmp_path / "b.bin"), mode="2LE")
+    assert shifted["skipped_bytes"] == 1 and shifted["stats"] == res["stats"]
+    big = dec.decode_file(str(tmp_path / "a.bin"), mode="2BE", align="0")
+    assert big["stats"]["samples"] == 64 and big["stats"]["max"] != 1189
+
+
+def test_chunk_size_does_not_change_the_result(tmp_path):
+    data = bytes((i * 37) % 251 for i in range(10001))
+    (tmp_path / "c.bin").write_bytes(data)
+    whole = dec.decode_file(str(tmp_path / "c.bin"), mode="2BE", signed=True, points=50)
+    for chunk in (2, 6, 64, 1000):
+        part = dec.decode_file(str(tmp_path / "c.bin"), mode="2BE", signed=True, points=50, chunk_bytes=chunk)
+        for key in ("stats", "envelope", "skipped_bytes", "dangling_bytes"):
+            assert part[key] == whole[key]
+    env = whole["envelope"]
+    assert 50 <= len(env["min"]) <= 100
+    assert min(env["min"]) == whole["stats"]["min"] and max(env["max"]) == whole["stats"]["max"]
+
+
+def test_text_exports(tmp_path):
+    header = "=== UART RxD Log ===\nBaud Rate: 9600\n\n"
+    (tmp_path / "hex.txt").write_text(header + "[10:00:00.000] 01 02 03\n[10:00:01.000] FF 00\n", "utf-8")
+    (tmp_path / "ascii.txt").write_text(header + "AB\\r\n\\n\nC", "utf-8")
+
+    res = dec.decode_file(str(tmp_path / "hex.txt"))
+    assert res["format"] == "hex" and res["bytes"] == 5
+    assert res["log"] == {"label": "RxD", "baud": 9600, "lines": 2, "timestamps": 2}
+    assert res["timing"]["span_s"] == 1.0 and res["timing"]["bytes_per_s"] == 5.0
+    assert (res["stats"]["min"], res["stats"]["max"]) == (0, 255)
+
+    res = dec.decode_file(str(tmp_path / "ascii.txt"))
+    assert res["format"] == "ascii" and res["bytes"] == 5  # A B \r \n C
+
+
+def test_cli_json_output(tmp_path, capsys):
+    (tmp_path / "d.bin").write_bytes(bytes(range(16)))
+    assert dec.main([str(tmp_path / "d.bin"), "--json", "-", "--points", "4"]) == 0
+    res = json.loads(capsys.readouterr().out)
+    assert res["stats"]["samples"] == 16 and res["envelope"]["bucket"] == 4
+    assert dec.main([str(tmp_path / "missing.bin")]) == 1
@@ -0,0 +1,57 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+import ud_serial_loadgen as gen
+from conftest import MD_DIR
+
+
+def test_text_pattern_numbers_lines_across_refills():
+    pattern = gen.TextPattern("abc")
+    data = b"".join(pattern.take(n) for n in (1, 500, 3, 2000))
+    lines = data.split(b"\r\n")
+    assert lines[0] == b"00000000 abc" and lines[99] == b"00000099 abc"
+    assert len(data) == 2504 and data == gen.TextPattern("abc").take(2504)
+
+
+def test_hex_pattern_is_seeded():
+    assert gen.HexPattern(16, 7).take(1000) == gen.HexPattern(16, 7).take(1000)
+    assert gen.HexPattern(16, 7).take(64) != gen.HexPattern(16, 8).take(64)
+
+
+@pytest.mark.parametrize("signed", [False, True])
+def test_wave_encodings_match_the_oscilloscope_modes(signed):
+    be = gen.encode_wave("sine", 8, "2BE", signed)
+    le = gen.encode_wave("sine", 8, "2LE", signed)
+    assert len(be) == len(le) == 16
+    assert be == b"".join(le[i + 1: i + 2] + le[i: i + 1] for i in range(0, 16, 2))
+    samples = [int.from_bytes(be[i: i + 2], "big", signed=signed) for i in range(0, 16, 2)]
+    mid = 0 if signed else 32768
+    assert abs(samples[0] - mid) <= 1 and samples[2] == (32767 if signed else 65535)
+    assert samples[6] == (-32768 if signed else 0)
+
+    square = gen.encode_wave("square", 4, "1", signed)
+    assert square == (bytes([127, 127, 128, 128]) if signed else bytes([255, 255, 0, 0]))
+
+
+def test_wave_pattern_repeats_one_period():
+    pattern = gen.WavePattern("saw", 10, "2LE", False)
+    period = gen.encode_wave("saw", 10, "2LE", False)
+    assert pattern.take(45) + pattern.take(15) == period * 3
+
+
+@pytest.mark.skipif(not hasattr(os, "openpty"), reason="needs a pty")
+@pytest.mark.parametrize("pattern", ["text", "hex", "wave"])
+def test_reference_reader_receives_every_byte(pattern):
+    res = subprocess.run(
+        [sys.executable, os.path.join(MD_DIR, "ud_serial_loadgen.py"), "--pattern", pattern,
+         "--rate", "400000", "--bytes", "40000", "--json", "-"],
+        capture_output=True, text=True, timeout=60,
+    )
+    assert res.returncode == 0, res.stderr
+    result = json.loads(res.stdout)
+    assert result["generated"] == 40000 and result["integrity"] == "ok"
+    assert result["received"] == result["written"] == 40000 - result["dropped_at_source"]
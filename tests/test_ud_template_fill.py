@@ -0,0 +1,679 @@
+import io
+import json
+import os
+import re
+import signal
+import subprocess
+import sys
+import time
+from typing import Dict, List
+
+import pytest
+
+import ud_template_fill as utf
+from conftest import GOLDEN_DIR, MD_DIR
+
+GENERATED = "2024-01-01T00:00:00"
+
+
+def _read(name: str) -> str:
+    with open(os.path.join(MD_DIR, name), "r", encoding="utf-8") as f:
+        return f.read()
+
+
+@pytest.fixture(scope="module")
+def template() -> utf.Template:
+    return utf.parse_template(_read("usart.tpl"))
+
+
+@pytest.fixture(scope="module")
+def project_text() -> str:
+    return _read("project.ud")
+
+
+@pytest.fixture(scope="module")
+def skeleton() -> str:
+    return _read("main.c")
+
+
+def _stream(c_text: str, sections: Dict[str, str]) -> str:
+    out = io.StringIO()
+    utf.fill_c_stream(io.StringIO(c_text), out, sections)
+    return out.getvalue()
+
+
+# =========================
+# Rendering and filling: golden files (tests/golden/)
+# =========================
+
+def _golden_name(sel: Dict[str, str]) -> str:
+    return "usart_" + "_".join(sel[k] for k in sorted(sel)) + ".c"
+
+
+def test_every_selection_matches_golden(template, skeleton, golden):
+    plan = utf.RenderPlan(template)
+    renderer = utf.Renderer(template)
+    selections = list(utf.matrix_combinations(template))
+    assert len(selections) == 4
+    for sel in selections:
+        sections = utf.render_sections(template, sel, generated=GENERATED)
+        for other in (plan.render(sel, generated=GENERATED),
+                      renderer.render(sel, generated=GENERATED),
+                      renderer.render(sel, generated=GENERATED)):  # second call: LRU hit
+            assert other == sections
+        filled = utf.fill_c_skeleton(skeleton, sections)
+        golden(_golden_name(sel), filled)
+        assert _stream(skeleton, sections) == filled
+    assert renderer.stats()["hits"] == len(selections)
+
+
+def test_project_fill_matches_golden(template, project_text, skeleton, golden):
+    sections = utf.render_project(template, project_text, generated=GENERATED)
+    filled = utf.fill_c_skeleton(skeleton, sections)
+    golden("usart_project.c", filled)
+    assert _stream(skeleton, sections) == filled
+
+
+def test_fill_with_missing_and_empty_sections_matches_golden(skeleton, golden):
+    sections = {"V": "// v\n", "D": "", "C": "int x;\n\nint y;\n", "I": "  a();\n\n b();\n"}
+    filled = utf.fill_c_skeleton(skeleton, sections)
+    golden("sparse.c", filled)
+    assert _stream(skeleton, sections) == filled
+
+
+# =========================
+# C skeleton markers
+# =========================
+
+@pytest.mark.parametrize("c_text, message", [
+    ("//`C+\n//`I+\n//`I-\n//`C-\n", "Line 2: //`I+ inside //`C+ block opened at line 1"),
+    ("x\n//`D-\n", "Line 2: //`D- without matching //`D+"),
+    ("//`H+\nx\n", "Line 1: //`H+ without matching //`H-"),
+    ("//`H+\n//`D-\n", "Line 2: //`D- closes //`H+ block opened at line 1"),
+])
+def test_marker_errors(c_text, message):
+    with pytest.raises(ValueError, match=re.escape(message)):
+        utf.index_markers(c_text.splitlines(keepends=True))
+    with pytest.raises(ValueError, match=re.escape(message)):
+        utf.fill_c_skeleton(c_text, {"H": "#include <a.h>\n"})
+    with pytest.raises(ValueError, match=re.escape(message)):
+        _stream(c_text, {"H": "#include <a.h>\n"})
+
+
+def test_marker_index_targets(skeleton):
+    idx = utf.index_markers(skeleton.splitlines(keepends=True))
+    c_pair, loop_pair = idx.target("C"), idx.loop_target()
+    assert not c_pair.in_main and c_pair.start < idx.main_line
+    assert loop_pair.in_main and loop_pair.indent == "\t\t"
+    assert [p.start for p in idx.pairs["C"]] == [c_pair.start, loop_pair.start]
+
+
+def test_stream_fill_matches_skeleton_fill(template, project_text, skeleton):
+    sections = utf.render_project(template, project_text, generated=GENERATED)
+    assert sections["L"].strip()
+    filled = utf.fill_c_skeleton(skeleton, sections)
+    assert _stream(skeleton, sections) == filled
+    assert "\t\tUD_write_MyPORT(UD_STR_0, 12);" in filled
+
+
+def test_loop_body_needs_a_block_inside_main():
+    c_text = "//`C+\n//`C-\nint main(void)\n{\n}\n"
+    sections = {"C": "int x;\n", "L": "go();\n"}
+    for fill in (utf.fill_c_skeleton, _stream):
+        with pytest.raises(ValueError, match="no //`C\\+ ... //`C- block inside main"):
+            fill(c_text, sections)
+
+
+# =========================
+# Project parameters
+# =========================
+
+_PINS_TPL = '$V 1.0.0 Pins\n$N PINS\n$S @TX PA0|PB0\n$S @RX PA0|PB0 1 "Receive pin"\n$S @MODE FAST|SLOW\n'
+
+_MIXED = """\
+// two USART instances around a GPIO one
+Led GPIO
+    Pin - PA3
+Debug UART
+    Number - USART0
+Main USART
+    Number - USART1
+    Pins location - USART_LOCATION_ALTERNATIVE
+"""
+
+
+def test_resolve_params_by_key_value_and_label():
+    pins = utf.parse_template(_PINS_TPL)
+    assert utf.resolve_params([("Tx pin", "PB0"), ("receive pin", "PA0")], pins) == \
+        {"@TX": "PB0", "@RX": "PA0", "@MODE": "FAST"}
+    assert utf.resolve_params([("Mode @MODE", "TURBO"), ("Speed", "SLOW")], pins) == \
+        {"@MODE": "SLOW", "@TX": "PA0", "@RX": "PB0"}  # @VAR keys win, even with unknown values
+    assert utf.resolve_params([("Pin", "PA0")], pins) == {"@TX": "PA0", "@RX": "PB0", "@MODE": "FAST"}
+
+
+def test_project_model_finds_instances_by_alias_and_name(template):
+    model = utf.ProjectModel(_MIXED)
+    assert [pi.name for pi in model.instances] == ["Led", "Debug", "Main"]
+    assert model.find(template).name == "Debug"  # first in project order, not in alias order
+    assert [pi.name for pi in model.matching(template)] == ["Debug", "Main"]
+    assert model.params_for(template, "Main") == {"@USART": "USART1", "@USART_LOCATION": "USART_LOCATION_ALTERNATIVE"}
+    assert model.params_for(template) == {"@USART": "USART0", "@USART_LOCATION": "USART_LOCATION_DEFAULT"}
+    assert model.find(template, "Led").name == "Led"  # a named instance is used even if its type differs
+    assert model.all_params_for(template) == utf.parse_all_instance_params(_MIXED, template)
+    with pytest.raises(ValueError, match="Cannot find matching instance"):
+        utf.ProjectModel("Led GPIO\n    Pin - PA3\n").find(template)
+
+
+def test_project_model_memoizes_per_template(template):
+    model = utf.ProjectModel(_MIXED)
+    main = model.by_name["Main"][0]
+    first = model.resolve(template, main)
+    first["@USART"] = "changed by the caller"
+    assert model.resolve(template, main)["@USART"] == "USART1"
+    pins = utf.parse_template(_PINS_TPL)
+    assert model.resolve(pins, main) == {"@TX": "PA0", "@RX": "PB0", "@MODE": "FAST"}
+    assert main.params == [("Number", "USART1"), ("Pins location", "USART_LOCATION_ALTERNATIVE")]
+
+
+# =========================
+# Work part
+# =========================
+
+_TWO_PORTS = """\
+A USART
+    Number - USART0
+B USART
+    Number - USART1
+
+"Hello " "World!" -> A
+"\\r\\n" -> A
+"World" -> B // points into the first string
+"\\x41\\102" -> B
+"""
+
+
+def test_work_part_merges_runs_and_shares_strings(template):
+    sections = utf.render_project(template, _TWO_PORTS, all_instances=True, generated=GENERATED)
+    assert sections["L"] == (
+        'UD_write_A(UD_STR_0, 14); // "Hello World!\\r\\n" (project lines 6, 7)\n'
+        'UD_write_B(UD_STR_1, 7); // "WorldAB" (project lines 8, 9)\n'
+    )
+    assert 'static UD_FLASH char UD_STR_0[14] = "Hello World!\\r\\n";' in sections["C"]
+    assert "static void UD_write_A(" in sections["C"] and "static void UD_write_B(" in sections["C"]
+    assert "A_USART0.TXDATAL = c;" not in sections["C"]
+    assert "#define UD_FLASH" in sections["D"]
+    assert not any(k == "W" or k.startswith("W:") for k in sections)
+
+
+def test_work_part_substring_points_into_stored_string():
+    sends = [utf.WorkSend(1, "A", b"Hello World"), utf.WorkSend(2, "B", b"World")]
+    work = utf.compile_work_part(sends, {"A": "put(c);\n", "B": "put2(c);\n"})
+    assert work["L"].splitlines() == [
+        'UD_write_A(UD_STR_0, 11); // "Hello World" (project line 1)',
+        'UD_write_B(UD_STR_0 + 6, 5); // "World" (project line 2)',
+    ]
+    assert work["C"].count("static UD_FLASH char") == 1
+
+
+def test_work_part_without_writer_is_left_as_comment():
+    sends = [utf.WorkSend(3, "A", b"x"), utf.WorkSend(4, "B", b"y")]
+    work = utf.compile_work_part(sends, {"A": "put(c);\n", "B": "  \n"})
+    assert '// "y" -> B (project line 4): no $W writer for this instance' in work["L"]
+    assert utf.compile_work_part(sends, {}) == {}
+
+
+@pytest.mark.parametrize("line, message", [
+    ('"x" -> Nobody', "Project line 4: unknown instance 'Nobody'"),
+    ('"\\q" -> P', "Project line 4: unknown escape sequence \\q"),
+    ('"\\x100" -> P', "Project line 4: escape sequence \\x100 out of range"),
+    ('"x" -> P\nnot a send', "Project line 5: expected"),
+])
+def test_work_part_errors(line, message):
+    project = utf.ProjectModel(f"P USART\n    Number - USART1\n\n{line}\n")
+    with pytest.raises(ValueError, match=re.escape(message)):
+        project.work()
+
+
+# =========================
+# Baud folding
+# =========================
+
+def test_fold_baud_register_for_the_example(template):
+    d = utf.render_sections(template, {"@USART": "USART1"}, generated=GENERATED)["D"]
+    assert "#define USART_BAUD_RATE 116U // 114943 baud (-0.22 %) = (((float) CLK_PER" in d
+    assert "#define BAUD_RATE 115200\n" in d
+
+
+def test_fold_out_of_tolerance_raises():
+    d = ("#define BAUD_RATE 1000000\n#define CLK_PER 3333333UL\n"
+         "#define USART_BAUD_RATE (((float) CLK_PER * 64.0 / (16.0 * (float)BAUD_RATE)) + 0.5)\n")
+    with pytest.raises(ValueError, match="outside the register range 64..65535"):
+        utf.fold_defines(d)
+
+
+def test_fold_derived_define_sees_the_register():
+    d = ("#define BAUD_RATE 115200\n#define CLK_PER 3333333UL\n"
+         "#define USART_BAUD_RATE (((float) CLK_PER * 64.0 / (16.0 * (float)BAUD_RATE)) + 0.5)\n"
+         "#define TWICE_BAUD (USART_BAUD_RATE * 2)\n"
+         "#define NAME \"x\"\n")
+    lines = utf.fold_defines(d).split("\n")
+    assert lines[2].startswith("#define USART_BAUD_RATE 116U //")
+    assert lines[3:] == ["#define TWICE_BAUD (USART_BAUD_RATE * 2)", '#define NAME "x"', ""]
+
+
+def test_fold_keeps_non_numeric_defines():
+    d = "#define F_CPU some_func()\n#define BAUD_RATE 9600\n#define UBAUD (F_CPU / BAUD_RATE)\n"
+    assert utf.fold_defines(d) == d
+
+
+# =========================
+# Template cache
+# =========================
+
+def test_template_cache_round_trip(tmp_path, template):
+    text = _read("usart.tpl")
+    cache = utf.TemplateCache(str(tmp_path))
+    assert cache.load(text) == template
+    assert utf.TemplateCache(str(tmp_path)).load(text) == template
+    assert cache.stats() == {"hits": 0, "misses": 1}
+    assert os.listdir(tmp_path) == [os.path.basename(cache._entry_path(text))]
+
+
+def test_template_cache_reparses_a_broken_entry(tmp_path, template):
+    text = _read("usart.tpl")
+    cache = utf.TemplateCache(str(tmp_path))
+    cache.load(text)
+    with open(cache._entry_path(text), "w", encoding="utf-8") as f:
+        f.write('{"version": "1.0"')
+    assert cache.load(text) == template and cache.stats()["misses"] == 2
+    assert cache.load(text) == template and cache.stats()["hits"] == 1
+
+
+def test_template_cache_evicts_least_recently_used(tmp_path):
+    texts = [_read("usart.tpl") + f"// {name}\n" for name in "abc"]
+    cache = utf.TemplateCache(str(tmp_path))
+    a, b, c = (cache._entry_path(t) for t in texts)
+    cache.load(texts[0])
+    cache.load(texts[1])
+    os.utime(a, (1, 1))
+    os.utime(b, (2, 2))
+    cache.load(texts[0])  # hit: a becomes the most recently used entry
+    cache.max_bytes = int(os.path.getsize(a) * 2.5)
+    cache.load(texts[2])
+    assert os.path.exists(a) and not os.path.exists(b) and os.path.exists(c)
+
+
+def test_template_cache_is_best_effort(tmp_path, template):
+    blocker = tmp_path / "file"
+    blocker.write_text("", "utf-8")
+    cache = utf.TemplateCache(str(blocker / "cache"))
+    assert cache.load(_read("usart.tpl")) == template
+
+
+# =========================
+# CLI and matrix
+# =========================
+
+def _cli(*args: str, stdin: str = "", cwd: str) -> subprocess.CompletedProcess:
+    return subprocess.run(
+        [sys.executable, os.path.join(MD_DIR, "ud_template_fill.py"), "--no-cache", *args],
+        input=stdin.encode("utf-8"), capture_output=True, cwd=cwd,
+    )
+
+
+def test_cli_dash_is_stdin_and_stdout(tmp_path, skeleton):
+    res = _cli("--template", os.path.join(MD_DIR, "usart.tpl"), "--project", os.path.join(MD_DIR, "project.ud"),
+               "--c-in", "-", "--c-out", "-", stdin=skeleton, cwd=str(tmp_path))
+    assert res.returncode == 0, res.stderr
+    out = res.stdout.decode("utf-8")
+    assert "#define USART_BAUD_RATE 116U" in out and "UD_write_MyPORT(UD_STR_0, 12);" in out
+    assert os.listdir(tmp_path) == []
+
+
+def test_crlf_skeleton_keeps_crlf(template, project_text, skeleton):
+    sections = utf.render_project(template, project_text, generated=GENERATED)
+    crlf = skeleton.replace("\n", "\r\n")
+    filled = utf.fill_c_skeleton(crlf, sections)
+    assert filled == utf.fill_c_skeleton(skeleton, sections).replace("\n", "\r\n")
+    out = io.StringIO(newline="")
+    utf.fill_c_stream(io.StringIO(crlf, newline=""), out, sections)
+    assert out.getvalue() == filled
+
+
+def test_cli_paths_write_identical_bytes(tmp_path, skeleton):
+    crlf = tmp_path / "main.c"
+    crlf.write_bytes(skeleton.replace("\n", "\r\n").encode("utf-8"))
+    common = ["--template", os.path.join(MD_DIR, "usart.tpl"), "--project", os.path.join(MD_DIR, "project.ud"),
+              "--reproducible"]
+    outputs = []
+    for stream in ([], ["--stream"]):
+        res = _cli(*common, "--c-in", str(crlf), "--c-out", str(tmp_path / "out.c"), *stream, cwd=str(tmp_path))
+        assert res.returncode == 0, res.stderr
+        outputs.append((tmp_path / "out.c").read_bytes())
+        res = _cli(*common, "--c-in", "-", "--c-out", "-", *stream, stdin=crlf.read_bytes().decode("utf-8"), cwd=str(tmp_path))
+        assert res.returncode == 0, res.stderr
+        outputs.append(res.stdout)
+    assert len(set(outputs)) == 1
+    assert outputs[0].count(b"\r\n") == outputs[0].count(b"\n")
+
+
+def test_cli_reports_fold_errors_without_traceback(tmp_path):
+    tpl = tmp_path / "fast.tpl"
+    tpl.write_text(_read("usart.tpl").replace("#define BAUD_RATE 115200", "#define BAUD_RATE 1000000"), "utf-8")
+    out = tmp_path / "out.c"
+    res = _cli("--template", str(tpl), "--project", os.path.join(MD_DIR, "project.ud"),
+               "--c-in", os.path.join(MD_DIR, "main.c"), "--c-out", str(out), cwd=str(tmp_path))
+    assert res.returncode == 2
+    assert b"outside the register range" in res.stderr and b"Traceback" not in res.stderr
+    assert not out.exists()
+
+
+def test_reproducible_stamp(monkeypatch):
+    monkeypatch.setenv("SOURCE_DATE_EPOCH", "1704067200")
+    assert utf.reproducible_stamp("a", "b") == "2024-01-01T00:00:00Z"
+    monkeypatch.setenv("SOURCE_DATE_EPOCH", "yesterday")
+    with pytest.raises(ValueError, match="SOURCE_DATE_EPOCH"):
+        utf.reproducible_stamp("a")
+    monkeypatch.delenv("SOURCE_DATE_EPOCH")
+    stamp = utf.reproducible_stamp("a", "b")
+    assert re.fullmatch(r"sha256:[0-9a-f]{16}", stamp)
+    assert stamp == utf.reproducible_stamp("a", "b") != utf.reproducible_stamp("ab", "")
+
+
+def test_write_depfile(tmp_path):
+    path = str(tmp_path / "out.d")
+    assert utf.write_depfile(path, "build/main gen.c", ["usart.tpl", "p#1.ud", "usart.tpl"])
+    with open(path, "r", encoding="utf-8") as f:
+        assert f.read() == ("build/main\\ gen.c: \\\n  usart.tpl \\\n  p\\#1.ud\n\n"
+                            "usart.tpl:\n\np\\#1.ud:\n")
+    assert not utf.write_depfile(path, "build/main gen.c", ["usart.tpl", "p#1.ud"])
+
+
+def test_cli_depfile_for_stdout_needs_a_target(tmp_path, skeleton):
+    common = ["--template", os.path.join(MD_DIR, "usart.tpl"), "--project", os.path.join(MD_DIR, "project.ud"),
+              "--c-in", "-", "--c-out", "-", "--depfile", "out.d"]
+    res = _cli(*common, stdin=skeleton, cwd=str(tmp_path))
+    assert res.returncode == 2 and b"--depfile-target" in res.stderr
+    assert os.listdir(tmp_path) == []
+
+    for stream in ([], ["--stream"]):
+        res = _cli(*common, "--depfile-target", "main_gen.c", *stream, stdin=skeleton, cwd=str(tmp_path))
+        assert res.returncode == 0, res.stderr
+        with open(tmp_path / "out.d", "r", encoding="utf-8") as f:
+            depfile = f.read()
+        os.remove(tmp_path / "out.d")
+        assert depfile.startswith("main_gen.c: \\\n") and os.path.join(MD_DIR, "usart.tpl") in depfile
+
+
+def test_matrix_records_failing_combinations(tmp_path, skeleton):
+    tpl = _read("usart.tpl").replace("#define BAUD_RATE 115200", "#define BAUD_RATE @BAUD")
+    tpl = tpl.replace("$S @USART_LOCATION", "$S @BAUD 115200|1000000\n$S @USART_LOCATION")
+    res = utf.run_matrix(tpl, skeleton, str(tmp_path), include=["@USART_LOCATION=USART_LOCATION_DEFAULT"],
+                         workers=1, generated=GENERATED)
+    assert res["combinations"] == 4 and res["unique_files"] == 2
+    assert sorted(f["params"]["@USART"] for f in res["failed"]) == ["USART0", "USART1"]
+    assert all(f["params"]["@BAUD"] == "1000000" for f in res["failed"])
+
+    with open(tmp_path / "manifest.json", "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    failed = [c for c in manifest["combinations"] if c["file"] is None]
+    assert len(failed) == 2 and all("outside the register range" in c["error"] for c in failed)
+    assert sorted(os.listdir(tmp_path)) == sorted(["manifest.json", *manifest["files"]])
+
+
+def test_matrix_writes_what_a_template_run_writes(tmp_path, skeleton):
+    res = utf.run_matrix(_read("usart.tpl"), skeleton, str(tmp_path), workers=2, generated=GENERATED)
+    assert res["combinations"] == res["unique_files"] == 4 and not res["failed"]
+    with open(tmp_path / "manifest.json", "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    for combo in manifest["combinations"]:
+        with open(os.path.join(GOLDEN_DIR, _golden_name(combo["params"])), "rb") as f:
+            assert (tmp_path / combo["file"]).read_bytes() == f.read()
+
+    # @USART_LOCATION is only named in P: both locations of a port are one program
+    codes = {}
+    for combo in manifest["combinations"]:
+        codes.setdefault(combo["code"], set()).add(combo["params"]["@USART"])
+    assert res["unique_code"] == 2 and sorted(codes.values()) == [{"USART0"}, {"USART1"}]
+
+
+# =========================
+# Watch mode
+# =========================
+
+def test_fill_session_matches_a_full_run(template, project_text, skeleton):
+    tpl_text = _read("usart.tpl")
+    session = utf.FillSession(reproducible=True)
+    session.set_template(tpl_text)
+    session.set_project(project_text)
+    session.set_skeleton(skeleton)
+    sections = utf.render_project(template, project_text, generated=utf.reproducible_stamp(tpl_text, project_text))
+    assert session.output() == utf.fill_c_skeleton(skeleton, sections)
+
+
+def test_fill_session_reruns_only_changed_stages(project_text, skeleton):
+    session = utf.FillSession()
+    assert session.set_template(_read("usart.tpl"))
+    session.set_project(project_text)
+    session.set_skeleton(skeleton)
+    first = session.output()
+    assert session.last_stages == ["template", "select", "render", "fill"]
+
+    def stages(**inputs: str) -> List[str]:
+        session.last_stages = []
+        for name, text in inputs.items():
+            getattr(session, f"set_{name}")(text)
+        session.output()
+        return session.last_stages
+
+    assert stages(template=_read("usart.tpl")) == []
+    assert stages(project=project_text + "// edited\n") == ["select"]
+    assert stages(skeleton=skeleton + "\n") == ["fill"]
+    assert stages(project=project_text.replace("USART1", "USART0")) == ["select", "render", "fill"]
+    assert "USART0.TXDATAL" in session.output() and session.output() != first
+
+
+def _touch_later(path, text: str) -> None:
+    path.write_text(text, "utf-8")
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))  # coarse mtime clocks
+
+
+def test_poll_watcher_reports_changed_and_removed_files(tmp_path):
+    a, b = tmp_path / "a.txt", tmp_path / "b.txt"
+    a.write_text("a", "utf-8")
+    b.write_text("b", "utf-8")
+    watcher = utf._PollWatcher([str(a), str(b)], 0.001)
+    _touch_later(b, "b2")
+    assert watcher.wait() == [str(b)]
+    a.unlink()
+    assert watcher.wait() == [str(a)]
+
+
+@pytest.mark.skipif(not sys.platform.startswith("linux"), reason="inotify is Linux only")
+def test_inotify_watcher_sees_saves_by_rename(tmp_path):
+    target, other = tmp_path / "main.c", tmp_path / "other.c"
+    target.write_text("x", "utf-8")
+    watcher = utf._InotifyWatcher([str(target)])
+    try:
+        other.write_text("not watched", "utf-8")
+        tmp = tmp_path / "main.c.swp"
+        tmp.write_text("y", "utf-8")
+        os.replace(tmp, target)
+        assert watcher.wait() == [str(target)]
+    finally:
+        watcher.close()
+
+
+def test_cli_watch_regenerates_on_change(tmp_path, project_text):
+    project, out = tmp_path / "project.ud", tmp_path / "out.c"
+    project.write_text(project_text, "utf-8")
+    proc = subprocess.Popen(
+        [sys.executable, os.path.join(MD_DIR, "ud_template_fill.py"), "--no-cache", "--watch",
+         "--poll", "--poll-interval", "0.02", "--template", os.path.join(MD_DIR, "usart.tpl"),
+         "--project", str(project), "--c-in", os.path.join(MD_DIR, "main.c"), "--c-out", str(out)],
+        stderr=subprocess.PIPE,
+    )
+
+    def wait_for(text: str) -> None:
+        deadline = time.monotonic() + 20
+        while not (out.exists() and text in out.read_text("utf-8")):
+            assert proc.poll() is None and time.monotonic() < deadline, proc.stderr.read().decode()
+            time.sleep(0.02)
+
+    try:
+        wait_for("USART1.TXDATAL")
+        _touch_later(project, project_text.replace("USART1", "USART0"))
+        wait_for("USART0.TXDATAL")
+    finally:
+        proc.send_signal(signal.SIGINT)
+        stderr = proc.communicate(timeout=20)[1].decode()
+    assert proc.returncode == 0, stderr
+    assert "[watch] select,render,fill:" in stderr
+
+
+# =========================
+# Generation server
+# =========================
+
+def _serve_lines(lines: List[object], pool=None) -> List[dict]:
+    rfile = io.BytesIO("".join((x if isinstance(x, str) else json.dumps(x)) + "\n" for x in lines).encode("utf-8"))
+    wfile = io.BytesIO()
+    utf._serve_stream(rfile, wfile, pool or utf._inline_executor())
+    return [json.loads(l) for l in wfile.getvalue().decode("utf-8").splitlines()]
+
+
+def test_serve_renders_and_fills(project_text, skeleton):
+    [resp] = _serve_lines([{"id": 7, "template": _read("usart.tpl"), "project": project_text, "skeleton": skeleton}])
+    assert resp["id"] == 7 and resp["ok"]
+    assert "UD_write_MyPORT(UD_STR_0, 12);" in resp["c"] and resp["sections"]["L"]
+
+
+@pytest.mark.parametrize("req, error", [
+    ({"id": 1, "template": 5, "project": "x"}, "'template' must be a string, got int"),
+    ({"id": 1, "template": "$V 1 t\n", "project": ["x"]}, "'project' must be a string, got list"),
+    ({"id": 1, "template": "$V 1 t\n", "project": "x", "skeleton": 1}, "'skeleton' must be a string, got int"),
+    ({"id": 1, "template": "$V 1 t\n"}, "request needs 'project' text"),
+    ({"id": 1, "project": "x"}, "request needs 'template' or 'template_path'"),
+])
+def test_serve_rejects_bad_requests(req, error):
+    [resp] = _serve_lines([req])
+    assert resp == {"id": 1, "ok": False, "error": "ValueError: " + error}
+
+
+def test_serve_survives_bad_lines(project_text):
+    good = {"id": 3, "template": _read("usart.tpl"), "project": project_text}
+    resps = _serve_lines(["{nope", [1, 2], {"id": 2, "template": {}}, good])
+    assert [(r["id"], r["ok"]) for r in resps] == [(None, False), (None, False), (2, False), (3, True)]
+
+
+def test_serve_answers_every_id_when_the_pool_breaks():
+    from concurrent.futures import Executor, Future
+    from concurrent.futures.process import BrokenProcessPool
+
+    class Broken(Executor):
+        def submit(self, fn, *args, **kwargs):
+            fut: Future = Future()
+            fut.set_exception(BrokenProcessPool("worker died"))
+            return fut
+
+    resps = _serve_lines([{"id": 1}, {"id": 2}], Broken())
+    assert resps == [{"id": i, "ok": False, "error": "BrokenProcessPool: worker died"} for i in (1, 2)]
+
+
+# =========================
+# Batch
+# =========================
+
+def _batch_dir(tmp_path, project_text, skeleton):
+    (tmp_path / "usart.tpl").write_text(_read("usart.tpl"), "utf-8")
+    (tmp_path / "other.tpl").write_text(_read("usart.tpl").replace("$V 1.0.0  MyVersion", "$V 2.0.0  Other"), "utf-8")
+    (tmp_path / "project.ud").write_text(project_text, "utf-8")
+    (tmp_path / "main.c").write_text(skeleton, "utf-8")
+
+
+def _run_batch(tmp_path, template="usart.tpl", **kw):
+    job = utf.BatchJob(str(tmp_path / template), str(tmp_path / "project.ud"), str(tmp_path / "main.c"),
+                       str(tmp_path / "main_gen.c"))
+    return utf.run_batch([job], str(tmp_path / "state.json"), workers=0, reproducible=True, **kw)
+
+
+def test_batch_skips_unchanged_jobs(tmp_path, project_text, skeleton):
+    _batch_dir(tmp_path, project_text, skeleton)
+    assert _run_batch(tmp_path)["rendered"] == 1
+    assert _run_batch(tmp_path)["skipped"] == 1
+    assert _run_batch(tmp_path, force=True)["rendered"] == 1
+
+    (tmp_path / "project.ud").write_text(project_text.replace("USART1", "USART0"), "utf-8")
+    assert _run_batch(tmp_path)["rendered"] == 1
+    (tmp_path / "main_gen.c").write_text("edited", "utf-8")
+    assert _run_batch(tmp_path)["rendered"] == 1
+    assert "USART0.TXDATAL = c;" in (tmp_path / "main_gen.c").read_text("utf-8")
+
+
+def test_batch_reruns_a_job_pointed_at_other_inputs(tmp_path, project_text, skeleton):
+    _batch_dir(tmp_path, project_text, skeleton)
+    assert _run_batch(tmp_path)["rendered"] == 1
+    counts = _run_batch(tmp_path, template="other.tpl")
+    assert counts["rendered"] == 1 and counts["skipped"] == 0
+    assert "// Template: Other" in (tmp_path / "main_gen.c").read_text("utf-8")
+    assert _run_batch(tmp_path, template="other.tpl")["skipped"] == 1
+
+
+def test_batch_failed_job_is_retried(tmp_path, project_text, skeleton):
+    _batch_dir(tmp_path, project_text, skeleton)
+    (tmp_path / "main.c").write_text("//`C+\n", "utf-8")
+    assert _run_batch(tmp_path)["failed"] == 1
+    (tmp_path / "main.c").write_text(skeleton, "utf-8")
+    assert _run_batch(tmp_path)["rendered"] == 1
+
+
+# =========================
+# Template library (--template-dir)
+# =========================
+
+@pytest.fixture
+def library(tmp_path):
+    lib_dir = tmp_path / "templates"
+    (lib_dir / "uart").mkdir(parents=True)
+    (lib_dir / "uart" / "usart.tpl").write_text(_read("usart.tpl"), "utf-8")
+    (lib_dir / "gpio.tpl").write_text("$V 1.0.0 Gpio\n$N GPIO\n$I gpio_init();\n", "utf-8")
+    return utf.TemplateLibrary(str(lib_dir), str(tmp_path / "cache"))
+
+
+def test_library_index_reuses_unchanged_templates(library, tmp_path):
+    assert library.refresh() == {"templates": 2, "unchanged": 0, "rehashed": 0, "reparsed": 2, "removed": 0}
+    assert library.resolve("USART1").endswith(os.path.join("uart", "usart.tpl"))
+    assert library.resolve("SPI") is None
+
+    again = utf.TemplateLibrary(library.root, str(tmp_path / "cache"))
+    assert again.refresh()["unchanged"] == 2
+    gpio = os.path.join(library.root, "gpio.tpl")
+    os.utime(gpio, ns=(0, 0))
+    assert again.refresh()["rehashed"] == 1
+    os.remove(gpio)
+    assert again.refresh()["removed"] == 1 and again.resolve("GPIO") is None
+
+
+def test_library_matches_single_template_output(library, template, project_text, skeleton):
+    library.refresh()
+    got = utf.render_project_library(project_text, library)
+    want = utf.render_project(template, project_text)
+    for k in ("P", "D", "H", "C", "I", "L"):
+        assert got[k] == want[k]
+    assert "void USART_Init(void)" in got["C"] and "MyPORT_" not in got["C"]
+
+
+def test_library_all_instances_prefixes_symbols(library):
+    library.refresh()
+    project = "A USART\n    Number - USART0\nB USART\n    Number - USART1\nLed GPIO\n"
+    warnings: List[str] = []
+    one = utf.render_project_library(project, library, warn=warnings.append)
+    assert "void USART_Init(void)" in one["C"] and "USART0.TXDATAL" in one["C"] and "USART1" not in one["C"]
+    assert "gpio_init();" in one["I"]
+    assert warnings == [f"{os.path.join('uart', 'usart.tpl')}: rendering A only, not B (use --all-instances)"]
+
+    every = utf.render_project_library(project, library, all_instances=True)
+    assert "void A_USART_Init(void)" in every["C"] and "void B_USART_Init(void)" in every["C"]
+    named = utf.render_project_library(project, library, instance="B")
+    assert "USART1.TXDATAL" in named["C"] and "gpio_init" not in named["I"]